@@ -4,9 +4,19 @@ Dataset class.
 """
 import matplotlib.pyplot as pyplot
 
-from numpy import array, loadtxt, savetxt, imag, real, dtype
+import os
+from copy import copy
+
+import h5py
+
+from numpy import arange, array, asarray, ascontiguousarray, argsort, diff, empty, searchsorted, where, minimum, \
+    iscomplexobj, load, save, loadtxt, savetxt, imag, real, dtype, generic
 from scipy.constants import physical_constants
 
+import relations
+from profiling import profiled
+from spectrafiles import readSpectra
+
 energyUnits = ('eV', 'cm-1', 'THz') #List of energy units available
 
 __wavelength = 'electron volt-inverse meter relationship'
@@ -16,11 +26,61 @@ unitTransform = {'cm-1': physical_constants[__wavelength][0]/100,
                  'THz': physical_constants[__herz][0]/10**12,
                  'eV': 1}
 
+# Extension of the binary dataset format: a (columns x points) float64 .npy
+# array with the energies in eV as first row, the values in the following
+# ones (real and imaginary part for complex datasets).
+binaryExtension = '.npy'
+
+def isBinary(filename):
+    """True if filename is in the binary dataset format."""
+    return os.path.splitext(filename)[1].lower() == binaryExtension
+
+def convertToBinary(spectraFile, binaryFile = None, unit = 'eV'):
+    """
+    Converts a text spectra file to the binary dataset format, to be opened
+    (memory mapped) instead of parsed afterwards.
+
+    Parameters:
+
+        binaryFile: Name of the binary file. By default, the one of
+        spectraFile with the binary extension.
+
+        unit: Energy unit of spectraFile, one of energyUnits. Energies are
+        stored in eV.
+
+    Returns:
+
+        The name of the binary file.
+    """
+
+    if binaryFile is None:
+        binaryFile = os.path.splitext(spectraFile)[0] + binaryExtension
+
+    # Rows must be contiguous to be mapped as separate arrays
+    columns = ascontiguousarray(readSpectra(spectraFile))
+
+    if unit != 'eV':
+        columns[0] /= unitTransform[unit]
+
+    with open(binaryFile, 'wb') as f:
+        save(f, columns)
+
+    return binaryFile
+
 class Dataset():
     """Base class for datasets. Generic type."""
 
     __counter = 0
 
+    # Weight of the residuals of the dataset in a fit
+    weight = 1.0
+
+    # Extra label, e.g., temperature
+    label = None
+
+    # EnergyGrid of x, built on first use
+    _grid = None
+
     def __init__(self, x = None, y = None, name = None, inputFile = None, unit = "eV", desc = None):
         """ Write some documentation. """
 
@@ -35,7 +95,7 @@ class Dataset():
             self._name = "Dataset %d" % self.__counter
 
         if inputFile:
-            self.loadRaw(inputFile, unit)
+            self.loadFile(inputFile, unit)
 
         else:
             self.x = array(x, dtype = float)
@@ -46,6 +106,21 @@ class Dataset():
     def __del__(self):
         type(self).__counter -= 1
 
+    def __setstate__(self, state):
+        type(self).__counter += 1
+        self.__dict__.update(state)
+
+    # Attributes of a lazily loaded dataset read from the hdf5 file on access
+    __lazy = ('_x', 'y', '_sorted', '_order', '_monotonic')
+
+    def __getattr__(self, name):
+        # Only called for missing attributes, no cost once the data is read
+        if name in Dataset.__lazy and self.__dict__.get('_source') is not None:
+            self._read()
+            return getattr(self, name)
+
+        raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+
     # How to use decorators to define "setters" and "getters"
     # http://www.python-course.eu/python3_properties.php
     # https://docs.python.org/3/library/functions.html#property
@@ -59,6 +134,128 @@ class Dataset():
     def name(self, name):
         self._name = name
 
+    @property
+    def x(self):
+        """Energies of the dataset."""
+        return self._x
+
+    @x.setter
+    def x(self, x):
+        self._setX(asarray(x, dtype = float))
+
+    def _setX(self, x, monotonic = None):
+        """Stores the energies and the sorted index used to search them.
+
+        monotonic is 1 (non decreasing), -1 (non increasing) or 0 (neither)
+        if already known, e.g. for slices of a monotonic x; otherwise it is
+        checked here, once.
+        """
+
+        self._x = x
+        self._grid = None
+
+        if monotonic is None:
+            step = diff(x) if x.ndim == 1 else diff(x.reshape(-1))
+            if (step >= 0).all():
+                monotonic = 1
+            elif (step <= 0).all():
+                monotonic = -1
+            else:
+                monotonic = 0
+
+        self._monotonic = monotonic
+
+        # Sorted energies and their positions in x (None if trivial)
+        if monotonic == 1:
+            self._sorted, self._order = x, None
+        elif monotonic == -1:
+            self._sorted, self._order = x[::-1], None
+        else:
+            self._order = argsort(x, kind = 'stable')
+            self._sorted = x[self._order]
+
+    @property
+    def grid(self):
+        """EnergyGrid of x, reusing the quantities derived from the energies
+        (e.g. their squares) in every evaluation of a fit."""
+        if self._grid is None:
+            self._grid = relations.EnergyGrid(self._x)
+        return self._grid
+
+    def nearestIndex(self, energy):
+        """Index of the point of x closest to energy (or to each of an
+        array of energies). On ties the first point in x wins.
+
+        Binary search on the sorted index: O(log N) per energy.
+        """
+
+        energy = asarray(energy, dtype = float)
+        n = self._sorted.size
+
+        if n < 2:
+            return energy.astype(int)*0
+
+        # Candidates on both sides of the insertion point
+        pos = searchsorted(self._sorted, energy).clip(1, n - 1)
+        left = energy - self._sorted[pos - 1]
+        right = self._sorted[pos] - energy
+
+        # Positions in x of the first occurrence of each candidate value
+        if self._monotonic == -1:
+            # Reversed view, the first occurrence is the last one sorted
+            low = n - searchsorted(self._sorted, self._sorted[pos - 1], 'right')
+            high = n - searchsorted(self._sorted, self._sorted[pos], 'right')
+        else:
+            low = searchsorted(self._sorted, self._sorted[pos - 1])
+            high = searchsorted(self._sorted, self._sorted[pos])
+            if self._order is not None:
+                low, high = self._order[low], self._order[high]
+
+        return where(left < right, low, where(left > right, high, minimum(low, high)))
+
+    def indices(self, window):
+        """Slice boundaries (low, high) of the points closest to the two
+        energies in window, as used by subset and window."""
+
+        low, high = self.nearestIndex(window[:2])
+        return int(low), int(high)
+
+    def window(self, window, stride = 1, name = None):
+        """Returns a dataset with the points of this one within window, as
+        subset does, without copying the data.
+
+        x and y of the result are read only views on this dataset. They are
+        copied the first time the result is modified through its methods
+        (scale, shift), so this dataset is never affected.
+        """
+
+        low, high = self.indices(window)
+        monotonic = self._monotonic if stride > 0 else 0
+
+        view = copy(self)
+
+        x = self._x[low:high:stride]
+        y = self.y[low:high:stride]
+        x.flags.writeable = False
+        y.flags.writeable = False
+
+        view._setX(x, monotonic or None)
+        view.y = y
+
+        if name:
+            view.name = name
+
+        return view
+
+    def _materialize(self):
+        """Copies read only data (windows, memory maps) before changing it."""
+
+        if not self._x.flags.writeable:
+            self._setX(self._x.copy(), self._monotonic)
+
+        if not self.y.flags.writeable:
+            self.y = self.y.copy()
+
     @property
     def desc(self):
         return self.name
@@ -74,6 +271,176 @@ class Dataset():
     def __str__(self):
         return self.type + ' dataset.\n' + str(self._name)
 
+    def loadFile(self, inputFile, unit = 'eV'):
+        """Loads the data from a binary file (see loadBinary) or a text
+        file (see loadRaw) depending on its extension."""
+
+        if isBinary(inputFile):
+            self.loadBinary(inputFile)
+        else:
+            self.loadRaw(inputFile, unit)
+
+    def loadBinary(self, binaryFile, mmap = True):
+        """
+        Opens a file in the binary dataset format (see convertToBinary).
+
+        The data is memory mapped read only unless mmap is False: nothing is
+        read until used, and modifying the dataset (scale, shift) makes a
+        copy in memory first. The energies are in eV.
+        """
+
+        data = load(binaryFile, mmap_mode = 'r' if mmap else None)
+
+        self.x = data[0]
+        self.y = data[1] if len(data) == 2 else data[1] + 1j*data[2]
+        self.unit = 'eV'
+
+    def saveBinary(self, binaryFile):
+        """Saves x and y in the binary dataset format."""
+
+        y = self.y
+        columns = (self.x, real(y), imag(y)) if iscomplexobj(y) else (self.x, y)
+
+        with open(binaryFile, 'wb') as f:
+            save(f, array(columns, dtype = float))
+
+    def savetohdf5(self, target):
+        """
+        Saves the dataset to hdf5 file. Can be used directly or called
+        from a higher level function (e.g. system.save()).
+
+        hdf5 can either be the filename or an hdf5 group. x and y are
+        stored as chunked and compressed datasets, the metadata as
+        attributes of the group.
+        """
+
+        if isinstance(target, str):
+            # Opening for writing empties the file a lazy dataset reads from
+            self.detach(target)
+            with h5py.File(target, "w") as hdf5:
+                return self.savetohdf5(hdf5)
+
+        hdf5 = target
+        hdf5.attrs['type'] = 'dataset'
+        hdf5.attrs['class'] = type(self).__name__
+        hdf5.attrs['datatype'] = self.type
+        hdf5.attrs['weight'] = self.weight
+        for key in ('name', 'unit', 'description', 'label', 'theta', 'polarization'):
+            value = getattr(self, key, None)
+            if value is not None:
+                hdf5.attrs[key] = value
+
+        for key in ('x', 'y'):
+            data = asarray(getattr(self, key))
+            if data.ndim == 1 and data.size:
+                hdf5.create_dataset(key, data = data, chunks = True,
+                                    compression = 'gzip', shuffle = True)
+            else:
+                hdf5.create_dataset(key, data = data)
+
+        return True
+
+    def loadfromhdf5(self, target, lazy = True):
+        """
+        Loads the dataset from hdf5 file. Can be used directly or called
+        from a higher level function (e.g. system.load()).
+
+        hdf5 can either be the filename or an hdf5 group. With lazy, only
+        the metadata is read: x and y are read from the file the first time
+        they are used, which must therefore still exist.
+        """
+
+        if isinstance(target, str):
+            with h5py.File(target, "r") as hdf5:
+                return self.loadfromhdf5(hdf5, lazy)
+
+        hdf5 = target
+        attrs = hdf5.attrs
+        self.type = attrs.get('datatype', getattr(self, 'type', "Generic"))
+        self.unit = attrs.get('unit', getattr(self, 'unit', "eV"))
+        self.description = attrs.get('description')
+        if 'name' in attrs:
+            self.name = attrs['name']
+        if 'label' in attrs:
+            # h5py returns NumPy scalars, which json cannot encode
+            label = attrs['label']
+            self.label = label.item() if isinstance(label, generic) else label
+        if 'weight' in attrs:
+            self.weight = float(attrs['weight'])
+        if 'theta' in attrs:
+            self.theta = float(attrs['theta'])
+        if 'polarization' in attrs:
+            self.polarization = str(attrs['polarization'])
+
+        if lazy:
+            for key in Dataset.__lazy + ('_grid',):
+                self.__dict__.pop(key, None)
+            self._source = (os.path.abspath(hdf5.file.filename), hdf5.name)
+        else:
+            self._source = None
+            self.x = hdf5['x'][()]
+            self.y = hdf5['y'][()]
+
+        return True
+
+    @classmethod
+    def fromhdf5(cls, target, lazy = True):
+        """Dataset, of the class it was saved from, loaded from hdf5 (see
+        loadfromhdf5)."""
+
+        if isinstance(target, str):
+            with h5py.File(target, "r") as hdf5:
+                return cls.fromhdf5(hdf5, lazy)
+
+        datasetClass = globals().get(target.attrs.get('class'), cls)
+        if not (isinstance(datasetClass, type) and issubclass(datasetClass, Dataset)):
+            datasetClass = cls
+
+        # Subclasses need different arguments to be built: the metadata is
+        # restored as for unpickled datasets instead
+        dataset = datasetClass.__new__(datasetClass)
+        dataset.__setstate__({})
+        dataset.loadfromhdf5(target, lazy)
+
+        return dataset
+
+    def _read(self):
+        """Reads x and y of a lazily loaded dataset."""
+
+        filename, path = self._source
+
+        # Still lazy if the file cannot be read: the error is reported again
+        # on the next access, which succeeds once the file is back
+        with h5py.File(filename, "r") as hdf5:
+            x = hdf5[path]['x'][()]
+            y = hdf5[path]['y'][()]
+
+        del self._source
+        self.x = x
+        self.y = y
+        self._source = None
+
+    def detach(self, filename = None):
+        """
+        Reads now the data of a lazily loaded dataset coming from filename
+        (from any file by default), so that the file can be overwritten or
+        removed. Does nothing for a dataset already in memory.
+        """
+
+        source = self.__dict__.get('_source')
+        if source is None:
+            return
+
+        if filename is not None:
+            try:
+                same = os.path.samefile(source[0], filename)
+            except OSError:
+                same = os.path.abspath(filename) == source[0]
+            if not same:
+                return
+
+        self._read()
+
     def loadRaw(self, spectraFile, unit = 'eV', **kwargs):
         """
         Loads the data from a textfile.
@@ -86,15 +453,36 @@ class Dataset():
             Automatic transformation to eV possible for units listed
             in the list energyUnits.
 
-            Also possible to use any other argument defined in numpy.loadtxt()
-            (see numpy documentation).
+            The delimiter, header lines and gzip compression are detected
+            (see spectrafiles.readSpectra). Also possible to use any other
+            argument defined in numpy.loadtxt() (see numpy documentation),
+            which is then used instead.
         """
 
-        self.x, self.y = loadtxt(spectraFile, unpack = True, *kwargs)
+        if kwargs:
+            columns = loadtxt(spectraFile, unpack = True, **kwargs)
+        else:
+            columns = readSpectra(spectraFile)
+
+        self.x, self.y = columns[:2]
 
         if unit is not 'eV':
             self.x /= unitTransform[unit]
 
+    @profiled()
+    def inputToType(self, epsilon):
+        """Converts a dielectric function to the quantity stored in the
+        dataset. The generic dataset stores the dielectric function itself."""
+
+        return relations.identity(epsilon)
+
+    @profiled()
+    def inputToTypeJacobian(self, epsilon, jacobian):
+        """Converts the derivatives of the dielectric function (rows of
+        jacobian) to derivatives of the quantity stored in the dataset."""
+
+        return jacobian
+
     def clone(self, subset = None, scale = None, shift = None, name = None):
         """Clones/duplicates the dataset."""
 
@@ -127,22 +515,28 @@ class Dataset():
     def subset(self, window, stride = 1):
         """Takes a subset of the data available."""
 
-        __index = range(len(self.x))
-        # Returning the index position with the smalles "distance" (min)
-        # between the available data and the requested boundary
-
-        __lIndex = min(__index, key=lambda i: abs(self.x[i]-window[0]))
-        __hIndex = min(__index, key=lambda i: abs(self.x[i]-window[1]))
+        # Index positions with the smallest "distance" between the available
+        # data and the requested boundaries
+        __lIndex, __hIndex = self.indices(window)
+        __monotonic = self._monotonic if stride > 0 else 0
 
-        self.x = self.x[__lIndex:__hIndex:stride]
+        # Slices of a monotonic x stay monotonic, the others are checked again
+        self._setX(self._x[__lIndex:__hIndex:stride], __monotonic or None)
         self.y = self.y[__lIndex:__hIndex:stride]
 
     def scale(self, factor):
+        self._materialize()
         self.y *= factor
 
     def shift(self, shift):
         """Shifts the spectra by an specified amount in energy."""
-        self.x += shift
+        self._materialize()
+        self._x += shift
+        self._grid = None
+
+        if self._order is not None:
+            # The sorted copy is not a view on x
+            self._sorted += shift
 
     # Not sure if load and save belong here or to a "higher" level component
     def load(self, datafile):
@@ -178,9 +572,26 @@ class Dataset():
 class ReflectivityDataset(Dataset):
     """Reflectivity oriented dataset container."""
 
-    def __init__(self, inputFile = None, unit = "eV", name = None):
-        super().__init__(inputFile = inputFile, unit = unit, name= name)
+    # Angle of incidence (rad) and polarization ('s', 'p' or 'unpolarized')
+    # of the measurement
+    theta = 0.0
+    polarization = 's'
+
+    def __init__(self, inputFile = None, unit = "eV", name = None, x = None, y = None, theta = 0.0, polarization = 's'):
+        super().__init__(x = x, y = y, inputFile = inputFile, unit = unit, name= name)
         self.type = "Reflectivity"
+        self.theta = theta
+        self.polarization = polarization
+
+    @profiled()
+    def inputToType(self, epsilon):
+        """Converts a dielectric function to reflectivity."""
+
+        return relations.reflectivity(epsilon, self.theta, self.polarization)
+
+    @profiled()
+    def inputToTypeJacobian(self, epsilon, jacobian):
+        return real(relations.reflectivity_derivative(epsilon, self.theta, self.polarization)*jacobian)
 
     def plot(self):
         super().plot()
@@ -203,7 +614,7 @@ class DielectricFunctionDataset(Dataset):
         self.type = "Dielectric function"
 
         if inputFile:
-            self.loadRaw(inputFile, unit)
+            self.loadFile(inputFile, unit)
 
         else:
             self.x = array(x, dtype = float)
@@ -219,11 +630,10 @@ class DielectricFunctionDataset(Dataset):
         transform it into electronvolts (eV).
         """
 
-        # How to deal with files with a header?
         # This code is very much like the parent one, how can it be better
         # factorized?
 
-        self.x, self._y1, self._y2 = loadtxt(spectraFile, unpack = True)
+        self.x, self._y1, self._y2 = readSpectra(spectraFile)[:3]
 
         self.y = self._y1+1j*self._y2
 
@@ -234,6 +644,23 @@ class DielectricFunctionDataset(Dataset):
         print("It makes no sense to scale a dielectric function dataset!\n\
             try another operation")
 
+    def cumulativeSpectralWeight(self, method = 'trapezoid'):
+        """
+        Spectral weight between the lowest energy of the dataset and each of
+        its energies, in the order of x (see relations.cumulativeSpectralWeight).
+
+        method: 'trapezoid' or 'simpson'.
+        """
+
+        x, y = self.x, self.y
+        if self._monotonic == 1:
+            return relations.cumulativeSpectralWeight(x, imag(y), method)
+
+        order = self._order if self._order is not None else arange(len(x))[::-1]
+        _sw = empty(len(x))
+        _sw[order] = relations.cumulativeSpectralWeight(x[order], imag(y[order]), method)
+        return _sw
+
     def plot(self):
         """Plots the data contained in the dataset."""
         pyplot.plot(self.x, real(self.y), label = self.name)
@@ -251,12 +678,14 @@ class EllipsometryDataset(Dataset):
         self.ellipType = ellipType
 
     def loadRaw(self, spectraFile):
-        x, y1, y2 = loadtxt(spectraFile, unpack = True)
+        x, y1, y2 = readSpectra(spectraFile)[:3]
         self.d = (Dataset(x, y1), Dataset(x, y2))
 
 
 if __name__ == "__main__":
 
+    import argparse
+
     #import matplotlib.pyplot as pyplot
 
     def plotWindow(*datasets):
@@ -278,3 +707,13 @@ if __name__ == "__main__":
 
         pyplot.legend(loc=0)
         pyplot.show()
+
+    parser = argparse.ArgumentParser(description = "Converts text spectra "
+                                     "files to the binary dataset format.")
+    parser.add_argument('files', nargs = '+', help = "text spectra files")
+    parser.add_argument('-u', '--unit', default = 'eV', choices = energyUnits,
+                        help = "energy unit of the files")
+    arguments = parser.parse_args()
+
+    for spectraFile in arguments.files:
+        print(convertToBinary(spectraFile, unit = arguments.unit))
@@ -1,71 +1,165 @@
 import numpy as np
-from scipy import integrate
+from scipy import integrate, special
+from concurrent.futures import ThreadPoolExecutor
 
-def real2imag(Nu, Y, iNuEval=None):
+from profiling import profiled
+
+try:
+	simps = integrate.simps
+except AttributeError:
+	# Renamed in recent scipy versions
+	simps = integrate.simpson
+
+def _log_ratio(nu, b):
+	"""ln|(b-nu)/(b+nu)|, i.e. 2*nu times the principal value integral of
+	1/(x^2-nu^2) from 0 to b. Zero where b = nu or nu = 0."""
+	with np.errstate(divide='ignore', invalid='ignore'):
+		L = np.log(np.abs((b-nu)/(b+nu)))
+	return np.where(np.isfinite(L), L, 0.0)
+
+def _chunks(nEval, nNu, memory):
+	"""Slices of the nEval evaluation points such that the (points x nNu)
+	float64 matrices of a chunk take about memory bytes (a few of them
+	are alive at the same time)."""
+	rows = max(1, int(memory // (4 * 8 * nNu)))
+	for start in range(0, nEval, rows):
+		yield slice(start, min(start + rows, nEval))
+
+def _map_chunks(Function, nEval, nNu, memory, threads=None):
+	"""Calls Function(rows) on the chunks of the nEval evaluation points.
+	With threads > 1 the chunks are spread over a pool of threads (NumPy
+	releases the GIL in the heavy loops) and memory is shared among them."""
+	if threads is not None and threads > 1:
+		Chunks = list(_chunks(nEval, nNu, memory / threads))
+		with ThreadPoolExecutor(max_workers=threads) as executor:
+			# list() propagates the exceptions raised in the workers
+			list(executor.map(Function, Chunks))
+	else:
+		for rows in _chunks(nEval, nNu, memory):
+			Function(rows)
+
+@profiled()
+def real2imag(Nu, Y, iNuEval=None, memory=2**26, threads=None):
 	"""Compute the imaginary part g of a causal function of the form
 	f + ig given its real part f.
 	
+	The integrand is evaluated as an (evaluation points x Nu) matrix, in
+	chunks taking about memory bytes, optionally on a pool of threads.
+	
 	iNuEval must be the array of indexes of Nu where to calculate KK.
 	"""
 	
-	if iNuEval==None:
-		iNuEval = np.arange(Nu)
+	Nu = np.asarray(Nu, dtype=float)
+	Y = np.asarray(Y, dtype=float)
+	
+	if iNuEval is None:
+		iNuEval = np.arange(len(Nu))
+	iNuEval = np.asarray(iNuEval)
+	
+	# Limit of the integrand at the singular point
+	Limit = np.gradient(Y, Nu) / (2.0 * np.where(Nu != 0, Nu, 1.0))
+	Limit[Nu == 0] = 0.0
 	
 	L = len(iNuEval)
-	NuEval = np.zeros(L)
+	NuEval = Nu[iNuEval]
 	Result = np.zeros(L)
-	for i in range(L):
-		j = iNuEval[i]
-		nuEval = Nu[j]
-		
-		Integrand = np.divide(Y-Y[j],np.power(Nu,2)-np.power(nuEval,2))
+	
+	Nu2 = np.power(Nu,2)
+	def chunk(rows):
+		J = iNuEval[rows]
 		
-		result = integrate.simps(Integrand,X=Nu)
+		with np.errstate(divide='ignore', invalid='ignore'):
+			Integrand = np.subtract.outer(-Nu2[J], -Nu2)
+			np.divide(np.subtract.outer(-Y[J], -Y), Integrand, out=Integrand)
+		Integrand[np.arange(len(J)), J] = Limit[J]
 		
-		NuEval[i] = nuEval
-		Result[i] = -2.0 * nuEval / np.pi * result
+		Result[rows] = simps(Integrand,x=Nu,axis=1)
+	
+	_map_chunks(chunk, L, len(Nu), memory, threads)
+	
+	Result *= -2.0 * NuEval / np.pi
 	
 	return NuEval, Result
 	
-def imag2real(Nu, Y, iNuEval=None):
+@profiled()
+def imag2real(Nu, Y, iNuEval=None, memory=2**26, threads=None):
 	"""Compute the real part f of a causal function of the form
 	f + ig given its real part g.
 	
+	g is taken as zero outside of Nu.
+	
+	The integrand is evaluated as an (evaluation points x Nu) matrix, in
+	chunks taking about memory bytes, optionally on a pool of threads.
+	
 	iNuEval must be the array of indexes of Nu where to calculate KK.
 	"""
 	
-	if iNuEval==None:
-		iNuEval = np.arange(Nu)
+	Nu = np.asarray(Nu, dtype=float)
+	Y = np.asarray(Y, dtype=float)
+	
+	if iNuEval is None:
+		iNuEval = np.arange(len(Nu))
+	iNuEval = np.asarray(iNuEval)
+	
+	# Limit of the integrand at the singular point
+	Limit = (Y + Nu*np.gradient(Y, Nu)) / (2.0 * np.where(Nu != 0, Nu, 1.0))
+	Limit[Nu == 0] = 0.0
 	
 	L = len(iNuEval)
-	NuEval = np.zeros(L)
+	NuEval = Nu[iNuEval]
 	Result = np.zeros(L)
-	for i in range(L):
-		j = iNuEval[i]
-		nuEval = Nu[j]
-		
-		Integrand = 0.0#np.divide(Y-Y[j],np.power(Nu,2)-np.power(nuEval,2))
+	
+	Nu2 = np.power(Nu,2)
+	NuY = Nu*Y
+	def chunk(rows):
+		J = iNuEval[rows]
 		
-		result = integrate.simps(Integrand,X=Nu)
+		with np.errstate(divide='ignore', invalid='ignore'):
+			Integrand = np.subtract.outer(-Nu2[J], -Nu2)
+			np.divide(np.subtract.outer(-NuY[J], -NuY), Integrand, out=Integrand)
+		Integrand[np.arange(len(J)), J] = Limit[J]
 		
-		NuEval[i] = nuEval
-		Result[i] = -2.0 * nuEval / np.pi * result
+		Result[rows] = simps(Integrand,x=Nu,axis=1)
+	
+	_map_chunks(chunk, L, len(Nu), memory, threads)
+	
+	# Adding back the subtracted term over the finite range
+	Result += Y[iNuEval] / 2.0 * (_log_ratio(NuEval, Nu[-1]) - _log_ratio(NuEval, Nu[0]))
+	Result *= 2.0 / np.pi
 	
 	return NuEval, Result
 
-def mod2phase(Nu, Y, iNuEval=None, Extrapolation="FreeCharges", ExtrapolationParams=None):
+@profiled()
+def mod2phase(Nu, Y, iNuEval=None, Extrapolation="FreeCharges", ExtrapolationParams=None,
+		LowExtrapolation=None, memory=2**26, threads=None):
 	"""Compute the imaginary part g of a causal function of the form
 	log(f) + ig, i.e. f*exp(ig), given f. High frequency
-	extrapolations are done above the last 
+	extrapolations are done above the last point, low frequency ones below
+	the first.
+	
+	The integrand is evaluated as an (evaluation points x Nu) matrix, in
+	chunks taking about memory bytes, optionally on a pool of threads.
+	
+	Extrapolation: "FreeCharges" (f ~ nu^-4 above Nu[-1]), "Full" (f ~ nu^-2
+	up to 2*Nu[-1], then nu^-4), or None to use ExtrapolationParams (see
+	mod2phase_extrapolation_high). No high frequency extrapolation if both
+	are None.
+	
+	LowExtrapolation: None, "Constant" or "HagenRubens" (see
+	mod2phase_extrapolation_low).
 	
 	iNuEval must be the array of indexes of Nu where to calculate KK.
 	"""
 	
-	if iNuEval==None:
-		iNuEval = np.arange(Nu)
-		
+	Nu = np.asarray(Nu, dtype=float)
+	Y = np.asarray(Y, dtype=float)
+	
+	if iNuEval is None:
+		iNuEval = np.arange(len(Nu))
+	iNuEval = np.asarray(iNuEval)
+	
 	L = len(iNuEval)
-	NuEval = np.zeros(L)
+	NuEval = Nu[iNuEval]
 	Result = np.zeros(L)
 	
 	nuLast = Nu[-1]
@@ -79,34 +173,217 @@ def mod2phase(Nu, Y, iNuEval=None, Extrapolation="FreeCharges", ExtrapolationPar
 		#With intermediate region
 		ExtrapolationParams = {'nub': nuLast*2.0, 's': 2.0, 'N': 10}
 
-	for i in range(L):
-		j = iNuEval[i]
-		nuEval = Nu[j]
-		
-		Integrand = np.divide(np.log(Y/Y[j]),np.power(nuEval,2)-np.power(Nu,2))
+	LogY = np.log(Y)
+	# Limit of the integrand at the singular point
+	Limit = -np.gradient(LogY, Nu) / (2.0 * np.where(Nu != 0, Nu, 1.0))
+	Limit[Nu == 0] = 0.0
+	
+	Nu2 = np.power(Nu,2)
+	def chunk(rows):
+		J = iNuEval[rows]
 		
-		result = integrate.simps(Integrand,X=Nu)
-		resultExtrap = mod2phase_extrapolation_high(nuEval, nuLast, Y[j], yLast, ExtrapolationParams)
+		with np.errstate(divide='ignore', invalid='ignore'):
+			Integrand = np.subtract.outer(Nu2[J], Nu2)
+			np.divide(np.subtract.outer(-LogY[J], -LogY), Integrand, out=Integrand)
+		Integrand[np.arange(len(J)), J] = Limit[J]
 		
-		NuEval[i] = nuEval
-		Result[i] = nuEval / np.pi * result * resultExtrap
+		Result[rows] = simps(Integrand,x=Nu,axis=1)
 	
-	return NuEval, Result
+	_map_chunks(chunk, L, len(Nu), memory, threads)
+	
+	Result *= NuEval / np.pi
 	
+	if ExtrapolationParams is not None:
+		Result += mod2phase_extrapolation_high(NuEval, nuLast, Y[iNuEval], yLast, ExtrapolationParams)
+	
+	if LowExtrapolation is not None and Nu[0] > 0:
+		Result += mod2phase_extrapolation_low(NuEval, Nu[0], Y[iNuEval], Y[0], LowExtrapolation)
+	
+	return NuEval, Result
+
+# Coefficients 1/(2n+1)^2 of the series of the high energy extrapolation
+_wootenTable = 1.0 / np.power(2*np.arange(64) + 1, 2)
+
 def mod2phase_extrapolation_high(nu, nua, Rnu, Rnua, ExtrapolationParams):
-	"""High energy contributions. See Wooten's book, Appendix G."""
+	"""High energy contributions. See Wooten's book, Appendix G.
+	
+	Phase contributed by f(x) = Rnua*(nua/x)^s between nua and nub, and
+	continuing as x^-4 above nub, for all the points nu (below nua) at once.
+	
+	ExtrapolationParams: dictionary with nub, s and N, the number of terms
+	of the series. N = None uses its closed form (Legendre chi function).
+	"""
 	
 	nub = ExtrapolationParams['nub']
 	s = ExtrapolationParams['s']
 	N = ExtrapolationParams['N']
 	
-	result = 0.0
+	nu = np.asarray(nu, dtype=float)
 	nnua = nu/nua
 	nnub = nu/nub
 	fourms = 4.0 - s
-	for n in np.arange(N):
-		result += (s * pow(nnua,2*n+1) + fourms * pow(nnub, 2*n+1)) / pow(2*n + 1, 2)
-	result *= np.pi
-	result += 1.0/2.0*np.pi*np.log(Rnua/Rnu)*log( (1.0 - nu/nua) / (1.0 + nu/nua) )
+	
+	if N is None:
+		# sum x^(2n+1)/(2n+1)^2 = (Li2(x) - Li2(-x))/2, Li2(x) = spence(1-x)
+		chi2 = lambda x: (special.spence(1.0 - x) - special.spence(1.0 + x)) / 2.0
+		result = s * chi2(nnua) + fourms * chi2(nnub)
+	else:
+		Table = _wootenTable[:N] if N <= len(_wootenTable) else 1.0 / np.power(2*np.arange(N) + 1, 2)
+		Powers = 2*np.arange(len(Table)) + 1
+		result = np.dot(s * np.power.outer(nnua, Powers) + fourms * np.power.outer(nnub, Powers), Table)
+	
+	result /= np.pi
+	result += 1.0/2.0/np.pi*np.log(Rnua/Rnu)*_log_ratio(nu, nua)
 	
 	return result
+
+def mod2phase_extrapolation_low(nu, nu0, Rnu, R0, Extrapolation="HagenRubens", nodes=32):
+	"""Low energy contributions, from 0 to nu0, for all the points nu (above
+	nu0) at once.
+	
+	Extrapolation: "Constant", f(x) = R0 (insulators), or "HagenRubens",
+	f(x) = 1 - (1 - R0)*sqrt(x/nu0), the low frequency limit of a Drude
+	metal.
+	
+	The constant part ln(R0/Rnu) is integrated analytically, the rest by
+	Gauss-Legendre quadrature with the given number of nodes.
+	"""
+	
+	nu = np.asarray(nu, dtype=float)
+	
+	result = np.log(Rnu/R0) / 2.0 * _log_ratio(nu, nu0)
+	
+	if Extrapolation == "HagenRubens":
+		x, w = np.polynomial.legendre.leggauss(nodes)
+		x = (x + 1.0) * nu0 / 2.0
+		w = w * nu0 / 2.0
+		LogR = np.log((1.0 - (1.0 - R0) * np.sqrt(x / nu0)) / R0)
+		result += np.dot(1.0 / np.subtract.outer(np.power(nu,2), np.power(x,2)), w * LogR) * nu
+	elif Extrapolation != "Constant":
+		raise ValueError("Unknown low energy extrapolation '%s'" % Extrapolation)
+	
+	return result / np.pi
+
+"""
+FFT based transforms
+"""
+
+def _uniform(Nu, points):
+	"""Uniform grid from 0 to Nu[-1] with points+1 samples, by default the
+	power of two above the number of samples of Nu."""
+	if points is None:
+		points = 2**int(np.ceil(np.log2(len(Nu))))
+	return np.linspace(0.0, Nu[-1], points+1)
+
+def _hilbert(F, parity):
+	"""Hilbert transform (1/pi) PV int F(x)/(nu-x) dx of the even
+	(parity=1) or odd (parity=-1) extension of F sampled on a uniform grid
+	starting at 0. Zero padded to twice the length to avoid wrap around."""
+	M = len(F) - 1
+	L = 4 * M
+	Extended = np.zeros(L)
+	Extended[:M+1] = F
+	Extended[L-M:] = parity * F[:0:-1]
+	
+	Spectrum = np.fft.rfft(Extended)
+	Spectrum *= -1.0j
+	Spectrum[0] = 0.0
+	Spectrum[-1] = 0.0
+	
+	return np.fft.irfft(Spectrum, L)[:M+1]
+
+@profiled()
+def real2imag_fft(Nu, Y, iNuEval=None, points=None, tail="constant"):
+	"""Compute the imaginary part g of a causal function of the form
+	f + ig given its real part f, in O(N log N).
+	
+	f is resampled on a uniform grid of points+1 samples from 0 to Nu[-1]
+	(constant below Nu[0]) and transformed with an FFT based Hilbert
+	transform, which handles the singular point of the principal value.
+	The result is interpolated back at Nu[iNuEval].
+	
+	tail: "constant" continues f with its last value above Nu[-1].
+	"truncate" integrates over Nu only, as real2imag does.
+	
+	iNuEval must be the array of indexes of Nu where to calculate KK.
+	"""
+	
+	Nu = np.asarray(Nu, dtype=float)
+	Y = np.asarray(Y, dtype=float)
+	
+	if iNuEval is None:
+		iNuEval = np.arange(len(Nu))
+	
+	Grid = _uniform(Nu, points)
+	yLast = Y[-1]
+	
+	# A constant has no Hilbert transform: only the deviation from the last
+	# value is transformed
+	G = _hilbert(np.interp(Grid, Nu, Y) - yLast, 1)
+	
+	NuEval = Nu[iNuEval]
+	Result = np.interp(NuEval, Grid, G)
+	
+	if tail == "truncate":
+		YEval = Y[iNuEval]
+		Result -= ((yLast - YEval) * (_log_ratio(NuEval, Nu[-1]) - _log_ratio(NuEval, Nu[0]))
+			- (Y[0] - yLast) * _log_ratio(NuEval, Nu[0])) / np.pi
+	
+	return NuEval, Result
+
+@profiled()
+def imag2real_fft(Nu, Y, iNuEval=None, points=None):
+	"""Compute the real part f of a causal function of the form
+	f + ig given its imaginary part g, in O(N log N).
+	
+	g is taken as zero outside of Nu. See real2imag_fft.
+	
+	iNuEval must be the array of indexes of Nu where to calculate KK.
+	"""
+	
+	Nu = np.asarray(Nu, dtype=float)
+	Y = np.asarray(Y, dtype=float)
+	
+	if iNuEval is None:
+		iNuEval = np.arange(len(Nu))
+	
+	Grid = _uniform(Nu, points)
+	G = np.interp(Grid, Nu, Y, left=0.0, right=0.0)
+	
+	NuEval = Nu[iNuEval]
+	Result = -np.interp(NuEval, Grid, _hilbert(G, -1))
+	
+	return NuEval, Result
+
+@profiled()
+def mod2phase_fft(Nu, Y, iNuEval=None, points=None, tail="constant"):
+	"""Compute the imaginary part g of a causal function of the form
+	log(f) + ig, i.e. f*exp(ig), given f, in O(N log N). No extrapolation
+	besides the one set by tail (see real2imag_fft).
+	
+	iNuEval must be the array of indexes of Nu where to calculate KK.
+	"""
+	
+	return real2imag_fft(Nu, 0.5*np.log(Y), iNuEval, points, tail)
+
+def check_fft(Nu, Y, transform="real2imag", samples=32, rtol=1e-2, points=None):
+	"""Compares an FFT based transform with its direct counterpart on
+	samples points of Nu (away from its ends).
+	
+	transform: "real2imag" or "imag2real".
+	
+	Returns whether the largest deviation, relative to the largest value of
+	the direct transform, is within rtol, and that deviation.
+	"""
+	
+	Direct, Fast = {"real2imag": (real2imag, lambda Nu, Y, i: real2imag_fft(Nu, Y, i, points, "truncate")),
+					"imag2real": (imag2real, lambda Nu, Y, i: imag2real_fft(Nu, Y, i, points))}[transform]
+	
+	iNuEval = np.unique(np.linspace(1, len(Nu)-2, samples).astype(int))
+	
+	Reference = Direct(Nu, Y, iNuEval)[1]
+	Result = Fast(Nu, Y, iNuEval)[1]
+	
+	deviation = np.max(np.abs(Result - Reference)) / np.max(np.abs(Reference))
+	
+	return bool(deviation <= rtol), float(deviation)
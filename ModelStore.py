@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk library of optical models, backed by SQLite.
+"""
+import json
+import sqlite3
+from numbers import Number
+
+import numpy as np
+
+from OpticalModel import OpticalModel
+
+_schema = """
+CREATE TABLE IF NOT EXISTS models (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    desc TEXT,
+    label TEXT,
+    value REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS models_name ON models (name);
+CREATE INDEX IF NOT EXISTS models_desc ON models (desc);
+CREATE INDEX IF NOT EXISTS models_label ON models (label);
+CREATE INDEX IF NOT EXISTS models_value ON models (value);
+"""
+
+
+def _plain(label):
+    """label with a NumPy scalar (e.g. read from hdf5) converted to the
+    Python one, which json can encode."""
+    return label.item() if isinstance(label, np.generic) else label
+
+
+def _value(label):
+    """Numeric value of a (plain) label, None if it is not a number."""
+    return float(label) if isinstance(label, Number) and not isinstance(label, bool) else None
+
+
+class StoredModel:
+    """Entry of a ModelStore. The metadata comes with the query, the model
+    itself is only read and built when model is first accessed."""
+
+    def __init__(self, store, id, name, desc, label):
+        self.store = store
+        self.id = id
+        self.name = name
+        self.desc = desc
+        self.label = label
+        self._model = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = self.store.get(self.id)
+        return self._model
+
+    def __repr__(self):
+        return "StoredModel(id = {}, name = {!r}, label = {!r})".format(self.id, self.name, self.label)
+
+
+class ModelStore:
+    """Library of optical models in a SQLite database, indexed by name,
+    description and label.
+
+    Numeric labels (e.g. temperatures) are also stored as numbers, so that
+    ranges are selected by an indexed query. The models are stored in the
+    json format of OpticalModel.toDict.
+    """
+
+    def __init__(self, filename=":memory:"):
+        self.filename = filename
+        self._connection = sqlite3.connect(filename)
+        # Lets prefix patterns (name LIKE 'Fe3O4%') use the name index
+        self._connection.execute("PRAGMA case_sensitive_like = ON")
+        self._connection.executescript(_schema)
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM models").fetchone()[0]
+
+    @staticmethod
+    def __row(model):
+        data = model.toDict()
+        label = data['label'] = _plain(model.label)
+        return (model.name, model.desc, json.dumps(label), _value(label), json.dumps(data))
+
+    def add(self, model):
+        """Stores a model. Returns its id in the store."""
+        return self.addMany([model])[0]
+
+    def addMany(self, models):
+        """Stores many models in a single transaction. Returns their ids."""
+        with self._connection:
+            cursor = self._connection.cursor()
+            ids = []
+            for model in models:
+                cursor.execute("INSERT INTO models (name, desc, label, value, data) VALUES (?, ?, ?, ?, ?)",
+                               self.__row(model))
+                ids.append(cursor.lastrowid)
+        return ids
+
+    def remove(self, ids):
+        """Removes the models with the given ids."""
+        with self._connection:
+            self._connection.executemany("DELETE FROM models WHERE id = ?", [(id,) for id in ids])
+
+    def get(self, id):
+        """Builds the model stored with id."""
+        row = self._connection.execute("SELECT data FROM models WHERE id = ?", (id,)).fetchone()
+        if row is None:
+            raise KeyError(id)
+
+        model = OpticalModel()
+        model.loadDict(json.loads(row[0]))
+        return model
+
+    def query(self, name=None, pattern=None, desc=None, label=None):
+        """
+        Selects stored models, all conditions given must hold.
+
+        Parameters:
+         name -- exact name
+         pattern -- SQL LIKE pattern on the name, e.g. 'Fe3O4%'
+         desc -- exact description
+         label -- a label, or a (low, high) range of numeric labels, ends
+                  included (None for an open end). Numeric labels are
+                  compared by value (10 matches 10.0)
+
+        Returns:
+          list of StoredModel, ordered by numeric label then id; the
+          models are only built when accessed
+        """
+
+        conditions, arguments = [], []
+
+        for column, operator, value in (("name", "=", name), ("name", "LIKE", pattern), ("desc", "=", desc)):
+            if value is not None:
+                conditions.append("{} {} ?".format(column, operator))
+                arguments.append(value)
+
+        if isinstance(label, tuple):
+            low, high = label
+            if low is not None:
+                conditions.append("value >= ?")
+                arguments.append(float(low))
+            if high is not None:
+                conditions.append("value <= ?")
+                arguments.append(float(high))
+        elif label is not None:
+            # Numbers by value, so that 10 finds a model labelled 10.0
+            label = _plain(label)
+            value = _value(label)
+            if value is None:
+                conditions.append("label = ?")
+                arguments.append(json.dumps(label))
+            else:
+                conditions.append("value = ?")
+                arguments.append(value)
+
+        sql = "SELECT id, name, desc, label FROM models"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY value, id"
+
+        return [StoredModel(self, id, name, desc, json.loads(label))
+                for id, name, desc, label in self._connection.execute(sql, arguments)]
+
+    def models(self, **conditions):
+        """Builds the models selected by query(**conditions)."""
+        return [entry.model for entry in self.query(**conditions)]
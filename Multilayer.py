@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Reflection and transmission of stacks of thin films, by the transfer
+(characteristic) matrix method of Abelès.
+
+The stack lies between a semi-infinite ambient, from which the light is
+incident, and a semi-infinite substrate:
+
+    stack = Multilayer(substrate, [(film, 25.0)])
+    R = stack.reflectivity(energies, theta=np.radians([0, 45, 70]), polarization='p')
+
+The media are OpticalModels (or anything with a dielectricFunction, e.g. an
+oscillator) or constant dielectric functions. Each one is evaluated once per
+call; the angles and polarizations are then computed together as arrays of
+shape (..., angles, energies).
+"""
+import collections
+
+import numpy as np
+from scipy.constants import physical_constants
+
+import relations
+from profiling import profiled
+
+# hbar c in eV nm: the vacuum wavevector is E/hbarc (nm^-1) at energy E (eV)
+hbarc = physical_constants['reduced Planck constant times c in MeV fm'][0]
+
+# Amplitude coefficients and intensities, of shape (..., angles, energies)
+Coefficients = collections.namedtuple('Coefficients', ['r', 't', 'R', 'T'])
+
+
+def _dielectricFunction(medium, grid):
+    """Dielectric function of a medium on grid: a model (anything with a
+    dielectricFunction method) or a constant."""
+
+    if hasattr(medium, 'dielectricFunction'):
+        return np.asarray(medium.dielectricFunction(grid), dtype=complex)
+    return np.full(grid.shape, medium, dtype=complex)
+
+
+# Points (polarizations x angles x energies) computed together by
+# Multilayer.coefficients
+blockSize = 2**14
+
+
+def _transfer(energies, theta, ambient, substrate, films, polarizations):
+    """r, t and T of a stack of films, of shape (polarizations, angles,
+    energies), from the dielectric functions of the substrate and films at
+    energies. See Multilayer.coefficients."""
+
+    def admittances(epsilon, N):
+        # Tilted admittances of a medium, one row per polarization
+        return [N if name == 's' else epsilon/N for name in polarizations]
+
+    epsilon = np.full(energies.shape, ambient, dtype=complex)
+    eta0 = np.stack(admittances(epsilon, relations.normal_component(epsilon, theta, ambient)))
+    etaS = np.stack(admittances(substrate, relations.normal_component(substrate, theta, ambient)))
+
+    # Tangential fields (B, C) at the top of the stack, for a unit field in
+    # the substrate, with the common factor exp(scale) taken out of them so
+    # that thick absorbing layers cannot overflow
+    B = np.ones(etaS.shape, dtype=complex)
+    C = etaS.copy()
+    scale = np.zeros(etaS.shape[1:])
+
+    k0 = energies/hbarc
+    for epsilon, thickness in reversed(films):
+        N = relations.normal_component(epsilon, theta, ambient)
+
+        # cos(delta) and i sin(delta) of the phase thickness delta, times
+        # exp(-|Im delta|), from real functions of its parts
+        delta = (k0*thickness)*N
+        _decay = np.abs(delta.imag)
+        scale += _decay
+        np.exp(-2.0*_decay, out=_decay)
+        _cosh = 0.5*(1.0 + _decay)
+        _sinh = np.copysign(0.5*(1.0 - _decay), delta.imag)
+        _c, _s = np.cos(delta.real), np.sin(delta.real)
+        _cos = _c*_cosh - 1j*(_s*_sinh)
+        _isin = 1j*(_s*_cosh) - _c*_sinh
+
+        for row, eta in enumerate(admittances(epsilon, N)):
+            B[row], C[row] = _cos*B[row] - _isin/eta*C[row], _cos*C[row] - _isin*eta*B[row]
+
+    _den = eta0*B + C
+    r = (eta0*B - C)/_den
+    t = 2.0*eta0*np.exp(-scale)/_den
+    T = 4.0*eta0.real*etaS.real*np.exp(-2.0*scale)/np.abs(_den)**2
+    return r, t, T
+
+
+class Multilayer:
+    """Stack of films on a substrate.
+
+    Attributes:
+    substrate -- Semi-infinite medium below the films.
+    layers -- List of (medium, thickness) of the films, thickness in nm,
+              from the ambient side down to the substrate.
+    ambient -- Transparent semi-infinite medium of incidence, a real
+               dielectric function (1.0: vacuum).
+    """
+
+    def __init__(self, substrate, layers=(), ambient=1.0):
+        self.substrate = substrate
+        self.layers = []
+        # Stacked from the substrate up
+        for medium, thickness in reversed(list(layers)):
+            self.add(medium, thickness)
+        self.ambient = ambient
+
+    def __len__(self):
+        return len(self.layers)
+
+    def __repr__(self):
+        return "Multilayer({} layer(s) on {!r})".format(len(self.layers), self.substrate)
+
+    def add(self, medium, thickness):
+        """Adds a film of thickness (nm) on top of the stack."""
+
+        if thickness < 0.0:
+            raise ValueError("The thickness of a layer cannot be negative ({})".format(thickness))
+        self.layers.insert(0, (medium, float(thickness)))
+
+    @profiled()
+    def coefficients(self, window, theta=0.0, polarization='s'):
+        """
+        Computes the reflection and transmission of the stack.
+
+        Parameters:
+        window -- Energies (eV), 1-D array or EnergyGrid.
+        theta -- Angle(s) of incidence in the ambient (rad), scalar or 1-D array.
+        polarization -- 's', 'p', or a sequence of them, e.g. ('s', 'p'),
+                        computed together along a leading axis.
+
+        Returns:
+            Coefficients(r, t, R, T) of shape ([polarizations,] [angles,]
+            energies). r and t are the ratios of the reflected and
+            transmitted tangential fields, equal to the Fresnel coefficients
+            for s polarization and for normal incidence; R and T are the
+            reflected and transmitted fractions of the incident power.
+        """
+
+        grid = relations.asGrid(window)
+        energies = grid.E.ravel()
+        single = isinstance(polarization, str)
+        polarizations = (polarization,) if single else tuple(polarization)
+        for name in polarizations:
+            if name not in ('s', 'p'):
+                raise ValueError("Unknown polarization '{}'".format(name))
+
+        angles = np.asarray(theta, dtype=float)
+        theta = angles.reshape(-1, 1)
+        ambient = float(np.real(self.ambient))
+
+        # Every medium is evaluated once, on the whole grid
+        substrate = _dielectricFunction(self.substrate, grid).ravel()
+        films = [(_dielectricFunction(medium, grid).ravel(), thickness) for medium, thickness in self.layers]
+
+        r = np.empty((len(polarizations), theta.size, energies.size), dtype=complex)
+        t = np.empty(r.shape, dtype=complex)
+        T = np.empty(r.shape)
+
+        # Blocks of energies small enough for the temporaries to be reused
+        step = max(blockSize//(theta.size*len(polarizations)), 64)
+        for start in range(0, energies.size, step):
+            block = slice(start, start + step)
+            r[..., block], t[..., block], T[..., block] = _transfer(
+                energies[block], theta, ambient, substrate[block],
+                [(epsilon[block], thickness) for epsilon, thickness in films], polarizations)
+
+        shape = grid.shape if angles.ndim == 0 else angles.shape + grid.shape
+        if single:
+            r, t, T = r[0], t[0], T[0]
+        else:
+            shape = (len(polarizations),) + shape
+        return Coefficients(r.reshape(shape), t.reshape(shape), (np.abs(r)**2).reshape(shape), T.reshape(shape))
+
+    def __intensity(self, field, window, theta, polarization):
+        if polarization == 'unpolarized':
+            return getattr(self.coefficients(window, theta, ('s', 'p')), field).mean(axis=0)
+        return getattr(self.coefficients(window, theta, polarization), field)
+
+    def reflectivity(self, window, theta=0.0, polarization='s'):
+        """Reflectivity of the stack, see coefficients. polarization may
+        also be 'unpolarized', the mean of s and p."""
+        return self.__intensity('R', window, theta, polarization)
+
+    def transmittance(self, window, theta=0.0, polarization='s'):
+        """Transmittance into the substrate, see coefficients. polarization
+        may also be 'unpolarized', the mean of s and p."""
+        return self.__intensity('T', window, theta, polarization)
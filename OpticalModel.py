@@ -8,7 +8,9 @@ import numpy as np
 from scipy.integrate import romb
 
 import Oscillators
+import relations
 from Oscillators import Drude, Lorentz, Gauss
+from profiling import profiled
 
 # Parameters for plots. Shouldn't be here!
 params = {
@@ -21,6 +23,231 @@ params = {
    }
 pyplot.rc(params)
 
+# Version of the json format written by OpticalModel.save and saveModels.
+# Version 1 stored each oscillator as its repr.
+jsonVersion = 2
+
+
+class EvaluationPlan:
+    """Compiled evaluation plan for a collection of oscillators.
+
+    Oscillators sharing a lineshape are grouped by type and their parameters
+    stacked into an (oscillators x parameters) array, so that each family is
+    evaluated in one broadcasted NumPy pass over (energy x oscillator) using
+    the batchDielectricFunction kernel of its class. Oscillators without
+    such a kernel are evaluated one by one.
+
+    The plan only captures the structure of the model: parameters are read
+    at evaluation time, either from the oscillators or, through precomputed
+    index arrays, from a flat parameter vector laid out in the order of the
+    oscillators (as OpticalModel.params). The energy axis is processed in
+    tiles of blockSize points so that the (oscillator x energy) temporaries
+    stay in cache.
+
+    The flat parameter vector may also be a matrix of shape (..., nparams),
+    e.g. one row per model of a series sharing the structure: all the rows
+    are evaluated at once, the tiles shrinking accordingly.
+    """
+
+    blockSize = 2048
+
+    def __init__(self, oscillators):
+        families = collections.OrderedDict()
+        indices = collections.OrderedDict()
+        self.fallback = []
+
+        # Positions of the parameters of the oscillators without kernel
+        self.fallbackIndices = []
+
+        offset = 0
+        for oscillator in oscillators:
+            kind = type(oscillator)
+            if 'batchDielectricFunction' in vars(kind):
+                families.setdefault(kind, []).append(oscillator)
+                indices.setdefault(kind, []).append(range(offset, offset + oscillator.nparams))
+            else:
+                self.fallback.append(oscillator)
+                self.fallbackIndices.append(slice(offset, offset + oscillator.nparams))
+            offset += oscillator.nparams
+
+        self.families = list(families.items())
+        # Positions of each family's parameters in the flat parameter vector
+        self.indices = [np.array(rows, dtype=np.intp).reshape(-1, kind.nparams)
+                        for kind, rows in indices.items()]
+
+    def __len__(self):
+        return sum(len(members) for kind, members in self.families) + len(self.fallback)
+
+    def parameters(self, params=None):
+        """Returns the stacked parameter array of each family, gathered from
+        the flat vector params if given, else from the oscillators."""
+
+        if params is None:
+            return [np.array([oscillator.params for oscillator in members], dtype=float)
+                    for kind, members in self.families]
+
+        params = np.asarray(params, dtype=float)
+        return [params[..., index] for index in self.indices]
+
+    @profiled()
+    def dielectricFunction(self, window, out=None, params=None):
+        """Adds the dielectric function of all the oscillators to out.
+
+        Parameter:
+        window -- 1-D array or EnergyGrid of points where to calculate the
+                  dielectric function.
+        out -- Complex buffer of shape (..., len(window)). Allocated (and
+               zeroed) if not given.
+        params -- Flat parameter vector to read the parameters from, or
+                  matrix of shape (..., nparams) of such vectors. The
+                  oscillators without batch kernel use their own for a
+                  vector, the rows of the matrix one at a time otherwise.
+
+        Returns:
+                The updated buffer.
+        """
+
+        # Tiles of the grid share its cached quantities
+        window = relations.asGrid(window)
+
+        if out is None:
+            leading = np.shape(params)[:-1] if params is not None else ()
+            out = np.zeros(leading + window.shape, dtype=complex)
+
+        # Rows evaluated together, sharing the energy tiles
+        rows = max(1, out.size // max(1, window.shape[-1]))
+        blockSize = max(16, self.blockSize // rows)
+
+        for (kind, members), stacked in zip(self.families, self.parameters(params)):
+            for start in range(0, window.shape[-1], blockSize):
+                stop = start + blockSize
+                kind.batchDielectricFunction(window[start:stop], stacked, out[..., start:stop])
+
+        if params is not None and np.ndim(params) > 1:
+            self.__fallbackRows(window, out, np.asarray(params, dtype=float))
+        else:
+            for oscillator in self.fallback:
+                out += oscillator.dielectricFunction(window)
+
+        return out
+
+    def __fallbackRows(self, window, out, params):
+        """Adds the oscillators without kernel for each row of params, by
+        temporarily assigning them the parameters of the row."""
+
+        for oscillator, index in zip(self.fallback, self.fallbackIndices):
+            saved = np.array(oscillator._values)
+            try:
+                for row in np.ndindex(params.shape[:-1]):
+                    oscillator.setParamsUnchecked(params[row][index])
+                    out[row] += oscillator.dielectricFunction(window)
+            finally:
+                oscillator.setParamsUnchecked(saved)
+
+
+# Gauss-Kronrod 7-15 rule on [-1, 1]: nodes, Kronrod and Gauss weights
+_kronrodNodes = np.array([0.991455371120812639206854697526329, 0.949107912342758524526189684047851,
+                          0.864864423359769072789712788640926, 0.741531185599394439863864773280788,
+                          0.586087235467691130294144845693013, 0.405845151377397166906606412076961,
+                          0.207784955007898467600689403773245, 0.0])
+_kronrodWeights = np.array([0.022935322010529224963732008058970, 0.063092092629978553290700663189204,
+                            0.104790010322250183839876322541518, 0.140653259715525918745189590510238,
+                            0.169004726639267902826583426598550, 0.190350578064785409913256402421014,
+                            0.204432940075298892414161999234649, 0.209482141084727828012999174891714])
+_gaussWeights = np.array([0.0, 0.129484966168869693270611432679082, 0.0, 0.279705391489276667901467771423780,
+                         0.0, 0.381830050505118944950369775488975, 0.0, 0.417959183673469387755102040816327])
+
+_nodes = np.concatenate((-_kronrodNodes[:-1], _kronrodNodes[::-1]))
+_kronrod = np.concatenate((_kronrodWeights[:-1], _kronrodWeights[::-1]))
+_gauss = np.concatenate((_gaussWeights[:-1], _gaussWeights[::-1]))
+
+
+def adaptiveQuadrature(function, breakpoints, tolerance=1e-8, maxEvaluations=2**16):
+    """
+    Integrates function between the first and last breakpoints by adaptive
+    Gauss-Kronrod (7-15) quadrature.
+
+    All the pending intervals are evaluated in a single call of function per
+    pass. An interval is accepted when the difference between its Kronrod
+    and Gauss estimates is below its share (by length) of tolerance times
+    the integral of |function|; the others are bisected.
+
+    Parameters:
+    function -- Vectorized integrand, called with 1-D arrays of points.
+    breakpoints -- Increasing points where the integrand changes quickly
+                   (e.g. around the oscillators), splitting the first pass.
+    tolerance -- Requested relative accuracy.
+    maxEvaluations -- Budget of evaluations of the integrand. Beyond it the
+                      remaining intervals are accepted as they are.
+
+    Returns:
+        The integral and its estimated error.
+    """
+
+    breakpoints = np.asarray(breakpoints, dtype=float)
+    low, high = breakpoints[:-1], breakpoints[1:]
+    span = breakpoints[-1] - breakpoints[0]
+    if span == 0.0:
+        return 0.0, 0.0
+
+    value = error = scale = 0.0
+    evaluations = 0
+
+    while low.size:
+        centre, half = 0.5*(low + high), 0.5*(high - low)
+        f = function((centre[:, np.newaxis] + half[:, np.newaxis]*_nodes).ravel()).reshape(low.size, _nodes.size)
+        evaluations += f.size
+
+        kronrod = half*(f @ _kronrod)
+        differences = np.abs(kronrod - half*(f @ _gauss))
+
+        # Integral of |function|, as the scale of the tolerance
+        absolute = scale + np.sum(half*(np.abs(f) @ _kronrod))
+        allowed = tolerance*absolute*(high - low)/span
+
+        done = differences <= allowed
+        if evaluations >= maxEvaluations:
+            done[:] = True
+        else:
+            # Intervals too short to be split further
+            done |= half <= 1e-12*span
+
+        value += np.sum(kronrod[done])
+        error += np.sum(differences[done])
+        scale += np.sum(half[done]*(np.abs(f[done]) @ _kronrod))
+
+        low, centre, high = low[~done], centre[~done], high[~done]
+        low, high = np.concatenate((low, centre)), np.concatenate((centre, high))
+
+    return value, error
+
+
+def _breakpoints(oscillators, low, high):
+    """Limits of integration and, between them, the positions of the
+    oscillators, their gaps and a few widths around them."""
+
+    points = [low, high]
+    for oscillator in oscillators:
+        position = getattr(oscillator, 'position', 0.0)
+        width = getattr(oscillator, 'width', 0.0)
+        points += [position + k*width for k in (-3, -1, 0, 1, 3)]
+        if hasattr(oscillator, 'gap'):
+            points.append(oscillator.gap)
+
+    points = np.unique(points)
+    return points[(points >= low) & (points <= high)]
+
+
+def _analyticWeight(oscillator):
+    """Whether the partialSpectralWeight of the oscillator is the closed
+    form of its lineshape: both defined by the same class, so that a
+    subclass changing the lineshape is integrated numerically."""
+
+    def owner(name):
+        return next(cls for cls in type(oscillator).__mro__ if name in vars(cls))
+
+    return owner('partialSpectralWeight') is owner('dielectricFunction')
+
 
 class OpticalModel(collections.MutableSequence):
     """Class to store and handle the oscillator model of the dielectric
@@ -58,10 +285,21 @@ class OpticalModel(collections.MutableSequence):
         else:
             self.__oscillators = []
 
+        # Evaluation plan, compiled on demand and dropped on structural changes
+        self.__plan = None
+
+        # Contiguous parameter vector; the parameters of each oscillator are
+        # a view into it. Rebuilt on demand after structural changes.
+        self.__params = np.empty(0)
+        self.__bound = False
+
         self._einf = 1.0
         self._polelow = [0.1, 0]
         self._polehigh = [10, 0]
 
+        # Whether to sum memoized contributions of each oscillator
+        self._cached = False
+
     def __del__(self):
         type(self).__counter -= 1
 
@@ -69,6 +307,37 @@ class OpticalModel(collections.MutableSequence):
     def OpticalModelInstances():
         return OpticalModel.__counter
 
+    def __structureChanged(self):
+        self.__plan = None
+        self.__bound = False
+
+    def __bind(self):
+        """Gathers the parameters of the oscillators in a new contiguous
+        vector, leaving each oscillator with a view into it."""
+
+        P = np.empty(sum(oscillator.nparams for oscillator in self.__oscillators))
+
+        offset = 0
+        for oscillator in self.__oscillators:
+            oscillator._bind(P[offset:offset + oscillator.nparams], self)
+            offset += oscillator.nparams
+
+        self.__params = P
+        self.__bound = True
+
+    def _unbind(self):
+        """Called by an oscillator moving its parameters to another model."""
+        self.__bound = False
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_OpticalModel__bound'] = False
+        return state
+
+    def __setstate__(self, state):
+        type(self).__counter += 1
+        self.__dict__.update(state)
+
     @staticmethod
     def __checkValue(value):
         if not isinstance(value, Oscillators.BaseOscillator):
@@ -87,14 +356,17 @@ class OpticalModel(collections.MutableSequence):
 
     def __delitem__(self, index):
         del self.__oscillators[index]
+        self.__structureChanged()
 
     def __setitem__(self, index, value):
         self.__checkValue(value)
         self.__oscillators[index] = value
+        self.__structureChanged()
 
     def insert(self, index, value):
         self.__checkValue(value)
         self.__oscillators.insert(index, value)
+        self.__structureChanged()
 
     def __add__(self, other):
         return OpticalModel(oscillators=self.__oscillators + other.__oscillators)
@@ -125,21 +397,42 @@ class OpticalModel(collections.MutableSequence):
 
     @property
     def params(self):
-        P = []
-        for oscillator in self.__oscillators:
-            P.extend(oscillator.params)
+        """Contiguous float64 vector with the parameters of all the
+        oscillators, in order. It is the storage of the oscillators'
+        parameters, not a copy: writing into it updates the model."""
 
-        return P
+        if not self.__bound:
+            self.__bind()
+
+        return self.__params
 
     @params.setter
     def params(self, P):
-        for oscillator in self.__oscillators:
-            oscillator.params = P[0:oscillator.nparams]
-            np.delete(P, slice(0, oscillator.nparams))
+        # Same rule as the parameter descriptor, checked in one pass
+        P = np.asarray(P, dtype=float)
+        invalid = ~(P >= 0.0)
+        if invalid.any():
+            print("Parameters {} should be positive numbers. Values set at 0.0".format(np.flatnonzero(invalid).tolist()))
+            P = np.where(invalid, 0.0, P)
+
+        self.setParamsUnchecked(P)
+
+    def setParamsUnchecked(self, P):
+        """Trusted bulk update of all the parameters, skipping validation.
+        Meant for optimizers, which already enforce the bounds."""
+        self.params[:] = P
 
     def sort(self):
         """Sorts the oscillators of the model in ascending order by energy."""
         self.__oscillators.sort(key=lambda oscillator: oscillator.position)
+        self.__structureChanged()
+
+    def compile(self):
+        """Returns the evaluation plan of the model, building it if needed."""
+        if self.__plan is None:
+            self.__plan = EvaluationPlan(self.__oscillators)
+
+        return self.__plan
 
     def show(self):
         """Prints the collection of oscillators composing the model."""
@@ -171,46 +464,55 @@ class OpticalModel(collections.MutableSequence):
         """Removes all oscillators from the model."""
 
         self.__oscillators = []
+        self.__structureChanged()
+
+    def toDict(self):
+        """Structured representation of the model, as saved in json files.
+        Each oscillator is stored by type name and parameter array, with its
+        representation for readability (see BaseOscillator.toDict)."""
+
+        return {'type': 'model',
+                'version': jsonVersion,
+                'name': self.name,
+                'desc': self.desc,
+                'label': self.label,
+                'eps1': {'einf': self.einf,
+                         'pole1': list(self._polelow),
+                         'pole2': list(self._polehigh)},
+                'oscillators': [osc.toDict() for osc in self.__oscillators]}
+
+    def loadDict(self, data):
+        """Adds the oscillators and sets the metadata of a model stored with
+        toDict. Oscillators stored as representation strings (former
+        format) are parsed, never evaluated."""
+
+        if data.get('type') != 'model':
+            raise ValueError("Not a model: type '{}'".format(data.get('type')))
+
+        self.name = data['name']
+        self.desc = data.get('desc')
+        if data.get('label') is not None:
+            self.label = data['label']
+
+        if 'eps1' in data:
+            self.einf = data['eps1']['einf']
+            self.poles = [*data['eps1']['pole1'], *data['eps1']['pole2']]
+
+        self.add([Oscillators.fromRepr(osc) if isinstance(osc, str) else Oscillators.fromDict(osc)
+                  for osc in data['oscillators']])
 
     def save(self, filename):
         """Exports the model as a json file."""
 
         with open(filename, 'w') as f:
-            _dump = dict()
-            _dump['type'] = 'model'
-            # Preparing metadata
-            _dump['name'] = self.name
-            _dump['desc'] = self.desc
-
-            # Preparing epsilon1
-
-            _dump['eps1'] = {'einf': self.einf,
-                             'pole1': self._polelow,
-                             'pole2': self._polehigh}
-
-            # Preparing oscillators
-            _dump['oscillators'] = []
-            for osc in self.__oscillators:
-                _dump['oscillators'].append(repr(osc))
-
-            json.dump(_dump, f, sort_keys=True, indent=2)
+            json.dump(self.toDict(), f, sort_keys=True, indent=2)
             print("Model is saved as: ", filename)
 
     def load(self, filename):
         """Imports a model from a json file."""
 
         with open(filename, 'r') as f:
-            _data = json.load(f)
-            if 'type' in _data.keys() and _data['type'] == 'model':
-                self.name = _data['name']
-                self.desc = _data['desc']
-
-                self.einf = _data['eps1']['einf']
-                self.poles = [*_data['eps1']['pole1'], *_data['eps1']['pole2']]
-
-                for osc in _data['oscillators']:
-                    # Uses the representation of an oscillator to recreate it
-                    self.add(eval(osc))
+            self.loadDict(json.load(f))
             print("Model '%s' was loaded!" % filename)
 
     def savetohdf5(self, target):
@@ -219,16 +521,37 @@ class OpticalModel(collections.MutableSequence):
         from a higher level function (e.g. system.save()).
 
         hdf5 can either be the filename or an hdf5 group.
+
+        The metadata, einf and the poles are attributes of the group; the
+        oscillators are a single compound dataset, one row per oscillator
+        with its type and its parameters (padded with NaN).
         """
 
         # Testing if target is a string, if true creates an hdf5 file.
         if isinstance(target, str):
-            hdf5 = h5py.File(target, "w")
-
+            with h5py.File(target, "w") as hdf5:
+                return self.savetohdf5(hdf5)
+
+        hdf5 = target
+        hdf5.attrs['type'] = 'model'
+        hdf5.attrs['name'] = self.name
+        for key, value in (('desc', self.desc), ('label', self.label)):
+            if value is not None:
+                hdf5.attrs[key] = value
+        hdf5.attrs['einf'] = self.einf
+        hdf5.attrs['poles'] = np.array([*self._polelow, *self._polehigh], dtype=float)
+
+        width = max([oscillator.nparams for oscillator in self.__oscillators], default=0)
+        table = np.zeros(len(self.__oscillators), dtype=[('type', h5py.string_dtype()),
+                                                         ('nparams', np.int32),
+                                                         ('params', float, (width,))])
+        table['params'] = np.nan
         for index, oscillator in enumerate(self.__oscillators):
-                h5osc = hdf5.create_group(str(index))
-                h5osc.attrs['type'] = oscillator.__class__.__name__
-                h5osc.create_dataset("params", data=oscillator.params)
+            table[index]['type'] = oscillator.__class__.__name__
+            table[index]['nparams'] = oscillator.nparams
+            table[index]['params'][:oscillator.nparams] = oscillator.params
+
+        hdf5.create_dataset("oscillators", data=table)
 
         return True
 
@@ -240,12 +563,36 @@ class OpticalModel(collections.MutableSequence):
         hdf5 can either be the filename or an hdf5 group.
         """
         if isinstance(target, str):
-            hdf5 = h5py.File(target, "r")
-
-        for idx, h5osc in hdf5.items():
-            osc = getattr(Oscillators, h5osc.attrs['type'])()
-            osc.params = h5osc['params'][:]
-            self.add(osc)
+            with h5py.File(target, "r") as hdf5:
+                return self.loadfromhdf5(hdf5)
+
+        hdf5 = target
+        if 'name' in hdf5.attrs:
+            self.name = hdf5.attrs['name']
+        self.desc = hdf5.attrs.get('desc', self.desc)
+        label = hdf5.attrs.get('label', self.label)
+        # h5py returns NumPy scalars, which json cannot encode
+        self.label = label.item() if isinstance(label, np.generic) else label
+        self.einf = float(hdf5.attrs.get('einf', self.einf))
+        if 'poles' in hdf5.attrs:
+            self.poles = hdf5.attrs['poles'].tolist()
+
+        if 'oscillators' in hdf5:
+            oscillators = []
+            for row in hdf5['oscillators'][()]:
+                kind = row['type']
+                if isinstance(kind, bytes):
+                    kind = kind.decode()
+                osc = getattr(Oscillators, kind)()
+                osc.params = row['params'][:row['nparams']]
+                oscillators.append(osc)
+            self.add(oscillators)
+        else:
+            # Former layout, a group per oscillator
+            for idx, h5osc in sorted(hdf5.items(), key=lambda item: int(item[0])):
+                osc = getattr(Oscillators, h5osc.attrs['type'])()
+                osc.params = h5osc['params'][:]
+                self.add(osc)
 
         return True
 
@@ -253,6 +600,21 @@ class OpticalModel(collections.MutableSequence):
         self.clear()
         self.append(self.__params2oscillator(Parameter, Type, Constraint))
 
+    @property
+    def cached(self):
+        """Whether dielectricFunction sums the memoized contribution of each
+        oscillator (see BaseOscillator.cachedDielectricFunction) instead of
+        evaluating the compiled plan. Pays off when only a few oscillators
+        change between evaluations on the same grids, as in a fit."""
+        return self._cached
+
+    @cached.setter
+    def cached(self, value):
+        self._cached = bool(value)
+        if not self._cached:
+            for oscillator in self.__oscillators:
+                oscillator.clearCache()
+
     @property
     def einf(self):
         return self._einf
@@ -274,8 +636,9 @@ class OpticalModel(collections.MutableSequence):
         # For a single value the ** operator is faster than the pow() function
         # For an array, apparently the pow() function is faster
 
-        return np.divide(intensity, position ** 2 - pow(window, 2))
+        return np.divide(intensity, position ** 2 - relations.asGrid(window).E2)
 
+    @profiled()
     def dielectricFunction(self, window):
         """Calculates the complex dielectric function of the model.
 
@@ -286,21 +649,76 @@ class OpticalModel(collections.MutableSequence):
                 The calculated dielectric function.
         """
 
-        _eps = self._einf  # Broadcasting einf
-        # _eps = np.zeros(len(window), dtype = np.cfloat)
-        #_eps = np.ones(len(window), dtype=np.cfloat)
+        window = relations.asGrid(window)
+        grid = window if window.ndim == 1 else relations.EnergyGrid(window.E.ravel())
 
-        for oscillator in self.__oscillators:
-            _eps += oscillator.dielectricFunction(window)
+        # Preallocated output, starting from einf
+        _eps = np.full(grid.size, self._einf, dtype=complex)
+
+        if self._cached:
+            key = grid.key
+            for oscillator in self.__oscillators:
+                _eps += oscillator.cachedDielectricFunction(grid, key)
+        else:
+            self.compile().dielectricFunction(grid, out=_eps, params=self.params)
 
         # Checking if poles have any intensity
         if self.poles[0][1] != 0:
-            _eps += self._pole(window, *self.poles[0])
+            _eps += self._pole(grid, *self.poles[0])
         if self.poles[1][1] != 0:
-            _eps += self._pole(window, *self.poles[1])
+            _eps += self._pole(grid, *self.poles[1])
+
+        return _eps.reshape(window.shape)
+
+    @profiled()
+    def batchDielectricFunction(self, window, params):
+        """Calculates the dielectric function of the model for many sets of
+        parameters at once, e.g. to sample the uncertainties of a fit.
+        einf and the poles are the ones of the model.
+
+        Parameter:
+        window -- 1-D array of points where to calculate the dielectric function.
+        params -- Matrix of shape (..., len(params)), each row ordered as params.
+
+        Returns:
+                Complex array of shape (..., len(window)).
+        """
+
+        window = relations.asGrid(window)
+        params = np.asarray(params, dtype=float)
+        if params.shape[-1] != len(self.params):
+            raise ValueError("Expected rows of {} parameters, got {}".format(len(self.params), params.shape[-1]))
+
+        _eps = np.full(params.shape[:-1] + window.shape, self._einf, dtype=complex)
+        self.compile().dielectricFunction(window, out=_eps, params=params)
+
+        for intensity, position in self.poles:
+            # Same condition as in dielectricFunction
+            if position != 0:
+                _eps += self._pole(window, intensity, position)
 
         return _eps
 
+    @profiled()
+    def jacobian(self, window):
+        """Calculates the derivatives of the dielectric function of the model
+        with respect to its parameters.
+
+        Parameter:
+        window -- Set of points where to calculate the derivatives.
+
+        Returns:
+                Complex array of shape (len(params), len(window)), with rows
+                in the same order as params.
+        """
+
+        window = relations.asGrid(window)
+
+        if not self.__oscillators:
+            return np.empty((0,) + window.shape, dtype=complex)
+
+        return np.concatenate([oscillator.jacobian(window) for oscillator in self.__oscillators])
+
     def opticalConductivity(self, window):
         """Calculates the complex optical conductivity of the model.
 
@@ -313,40 +731,130 @@ class OpticalModel(collections.MutableSequence):
         # TODO: Check formula and units!
         return window * self.dielectricFunction(window)
 
-    def spectralWeight(self, limits=None):
-        """Calculates the spectral weight of the model. If an energy
-         window is give, a partial spectral weight is returned.
+    def spectralWeight(self, limits=None, method='analytic', tolerance=1e-8, error=False):
+        """Calculates the spectral weight of the model,
+        epsilon_0/hbar^2 int E epsilon_2(E) dE. If an energy window is given,
+        a partial spectral weight is returned.
 
-         Parameter:
-         limits -- A tuple indicating beginning and end where to calculate
-                   the partial spectral weight of the model.
+        Parameters:
+        limits -- A tuple indicating beginning and end where to calculate
+                  the partial spectral weight of the model (finite, eV).
+        method -- Integration of the partial spectral weight:
+                  'analytic': closed forms of the oscillators
+                      having one (Drude, Lorentz, Gauss), adaptive
+                      quadrature of the others;
+                  'adaptive': adaptive Gauss-Kronrod quadrature of the
+                      model, refined around the oscillators;
+                  'romberg': Romberg integration on a uniform grid with a
+                      step below 0.02 eV.
+        tolerance -- Relative accuracy requested from the adaptive quadrature.
+        error -- Also return the estimated error of the integration.
 
-         Returns:
-            The calculated dielectric function.
-         """
+        Returns:
+            The calculated spectral weight or, with error, a tuple of it
+            and its estimated error (0 for closed forms).
+        """
 
-        _sw = 0.0
+        _sw, _error = 0.0, 0.0
 
         if not limits:
             for oscillator in self.__oscillators:
                 _sw += oscillator.spectralWeight
 
         else:
-            # Using Romberg: See http://young.physics.ucsc.edu/242/romberg.pdf
-            interval = limits[1]-limits[0]
+            low, high = limits
+            oscillators = self.__oscillators
+
+            def integrand(energy):
+                # Oscillators without closed form; the poles and einf are real
+                _eps = np.zeros(energy.shape, dtype=complex)
+                for oscillator in oscillators:
+                    _eps += oscillator.dielectricFunction(energy)
+                return energy*_eps.imag
+
+            if method == 'analytic':
+                oscillators = []
+                for oscillator in self.__oscillators:
+                    if _analyticWeight(oscillator):
+                        _sw += oscillator.partialSpectralWeight(low, high)
+                    else:
+                        oscillators.append(oscillator)
+
+                if oscillators:
+                    _value, _error = adaptiveQuadrature(integrand, _breakpoints(oscillators, low, high), tolerance)
+                    _sw += relations.swFactor*_value
+                    _error *= relations.swFactor
+
+            elif method == 'adaptive':
+                _sw, _error = adaptiveQuadrature(lambda energy: energy*np.imag(self.dielectricFunction(energy)),
+                                                 _breakpoints(oscillators, low, high), tolerance)
+                _sw *= relations.swFactor
+                _error *= relations.swFactor
+
+            elif method == 'romberg':
+                # Using Romberg: See http://young.physics.ucsc.edu/242/romberg.pdf
+                interval = high - low
+
+                # Finding minimal k for a smaller than 0.02 integration step
+                k = max(ceil(log(max(interval/0.02 - 1, 2))/log(2)), 1)
+
+                # Determining final step size
+                dx = interval/(2.0**k)
+
+                # Create a 2**k+1 equally spaced sample
+                x = np.linspace(low, high, 2**k+1)
+                f = relations.swFactor*x*np.imag(self.dielectricFunction(x))
+
+                _sw = romb(f, dx)
+                # Compared with the same integration on every other point
+                _error = abs(_sw - romb(f[::2], 2*dx))
+
+            else:
+                raise ValueError("Unknown integration method '{}'".format(method))
+
+        if error:
+            return _sw, _error
+        return _sw
+
+    def cumulativeSpectralWeight(self, window, method='analytic', oscillators=False):
+        """Calculates the partial spectral weight of the model between the
+        first energy of window and each of them, e.g. N_eff as a function of
+        the cutoff, in one evaluation of the model.
 
-            # Finding minimal k for a smaller than 0.02 integration step
-            k = ceil(log(interval/0.02-1)/log(2))
+        Parameters:
+        window -- Increasing energies (eV). Start it at 0 for the weight
+                  below each cutoff.
+        method -- 'analytic': closed forms of the oscillators having one,
+                      Simpson integration of the others (see spectralWeight);
+                  'trapezoid' or 'simpson': numerical integration of the
+                      dielectric function sampled at window (see
+                      relations.cumulativeSpectralWeight).
+        oscillators -- Whether to return the weight of each oscillator.
 
-            # Determining final step size
-            dx = interval/(2.0**k)
+        Returns:
+            Array of the spectral weights at each energy of window or, with
+            oscillators, of shape (len(model), len(window)) in the order of
+            the oscillators (the poles carry no spectral weight).
+        """
 
-            # Create a 2**k+1 equally spaced sample
-            x = np.linspace(limits[0], limits[1], 2**k+1)
+        window = relations.asGrid(window)
+        energies = window.E
 
-            _sw = romb(np.imag(self.dielectricFunction(x)), dx)
+        if method not in ('analytic', 'trapezoid', 'simpson'):
+            raise ValueError("Unknown integration method '{}'".format(method))
 
-        return _sw
+        if not oscillators and method != 'analytic':
+            return relations.cumulativeSpectralWeight(energies, np.imag(self.dielectricFunction(window)), method)
+
+        _sw = np.zeros((len(self.__oscillators), window.size))
+        for row, oscillator in zip(_sw, self.__oscillators):
+            if method == 'analytic' and _analyticWeight(oscillator):
+                row[:] = oscillator.partialSpectralWeight(energies[0], energies)
+            else:
+                row[:] = relations.cumulativeSpectralWeight(energies, np.imag(oscillator.dielectricFunction(window)),
+                                                            'simpson' if method == 'analytic' else method)
+
+        return _sw if oscillators else _sw.sum(axis=0)
 
     def refractiveIndex(self, window):
         """Calculates the complex refractive index of the model.
@@ -360,17 +868,18 @@ class OpticalModel(collections.MutableSequence):
 
         return np.sqrt(self.dielectricFunction(window))
 
-    def reflectivity(self, window):
+    def reflectivity(self, window, theta=0.0, polarization='s'):
         """Calculates the reflectivity of the model.
 
         Parameter:
         window -- Set of points where to calculate the complex refractive index.
+        theta -- Angle of incidence (rad), from vacuum.
+        polarization -- 's', 'p' or 'unpolarized'.
 
         Returns:
                 The calculated complex refractive index.
         """
-        __n = self.refractiveIndex(window)
-        return np.abs((__n-1)/(__n+1))**2
+        return relations.reflectivity(self.dielectricFunction(window), theta, polarization)
 
     def __singleAxisPlot(self, x, y, label):
         pyplot.figure()
@@ -415,3 +924,99 @@ class OpticalModel(collections.MutableSequence):
 
         else:
             self.__doubleAxisPlot(window, self.dielectricFunction(window), labels=[r'$\varepsilon_1$', r'$\varepsilon_2$'])
+
+
+def loadModels(filenames):
+    """Reads json files, each holding either a single model (see
+    OpticalModel.save) or a library of models (see saveModels), e.g. a
+    whole temperature series. Each file is parsed once.
+
+    Parameter:
+     filenames -- a filename or an iterable of filenames
+
+    Returns:
+      list of the models, in the order they are stored
+    """
+
+    if isinstance(filenames, str):
+        filenames = [filenames]
+
+    models = []
+    for filename in filenames:
+        with open(filename, 'r') as f:
+            data = json.load(f)
+
+        for entry in data['models'] if data.get('type') == 'models' else [data]:
+            model = OpticalModel()
+            model.loadDict(entry)
+            models.append(model)
+
+    return models
+
+
+def saveModels(models, filename):
+    """Saves many models in a single json file (library), to be read back
+    with loadModels."""
+
+    with open(filename, 'w') as f:
+        json.dump({'type': 'models', 'version': jsonVersion,
+                   'models': [model.toDict() for model in models]}, f, sort_keys=True, indent=2)
+
+
+@profiled()
+def dielectricFunctions(models, window):
+    """Calculates the dielectric functions of many models on the same grid.
+
+    Models sharing the same structure (types of oscillators, in order) are
+    evaluated together: their parameter vectors are stacked into a matrix
+    and run through the compiled plan of one of them, with einf and the
+    poles of each model applied as arrays.
+
+    Parameter:
+     models -- iterable of OpticalModel
+     window -- 1-D array or EnergyGrid of points where to calculate the
+               dielectric functions
+
+    Returns:
+      complex array of shape (len(models), len(window))
+    """
+
+    models = list(models)
+    window = relations.asGrid(window)
+    _eps = np.empty((len(models), window.size), dtype=complex)
+
+    groups = collections.OrderedDict()
+    for row, model in enumerate(models):
+        groups.setdefault(tuple(type(oscillator) for oscillator in model), []).append(row)
+
+    for rows in groups.values():
+        group = [models[row] for row in rows]
+        params = np.array([model.params for model in group], dtype=float).reshape(len(group), -1)
+
+        _block = np.empty((len(group), window.size), dtype=complex)
+        _block[:] = np.array([model.einf for model in group], dtype=float)[:, np.newaxis]
+        group[0].compile().dielectricFunction(window, out=_block, params=params)
+
+        for pole in range(2):
+            intensity, position = np.array([model.poles[pole] for model in group], dtype=float).T
+            # Same condition as in OpticalModel.dielectricFunction
+            active = position != 0
+            if active.any():
+                _block[active] += np.divide(intensity[active, np.newaxis],
+                                            position[active, np.newaxis] ** 2 - window.E2)
+
+        _eps[rows] = _block
+
+    return _eps
+
+
+def reflectivities(models, window):
+    """Calculates the normal incidence reflectivity of many models on the
+    same grid, see dielectricFunctions.
+
+    Returns:
+      array of shape (len(models), len(window))
+    """
+
+    _n = np.sqrt(dielectricFunctions(models, window))
+    return np.abs((_n-1)/(_n+1))**2
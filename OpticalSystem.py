@@ -1,10 +1,205 @@
+import collections
+import copy
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import h5py
 import matplotlib.pyplot as plt
 import numpy as np
-from scipy.optimize import minimize
+from scipy.optimize import minimize, least_squares
 
 import Datasets
 from OpticalModel import OpticalModel
+from profiling import profiled
+
+
+class FitResult:
+    """Outcome of a fit of an optical model to a set of datasets. The cost is
+    half the sum of the squared residuals."""
+
+    def __init__(self, params, method, success, message, nfev, cost,
+                 covariance=None, model=None, label=None):
+        self.params = np.asarray(params, dtype=float)
+        self.method = method
+        self.success = success
+        self.message = message
+        self.nfev = nfev
+        self.cost = cost
+        self.covariance = covariance
+        self.model = model
+        self.label = label
+
+    @property
+    def uncertainties(self):
+        """Standard deviations of the parameters, if the covariance is known."""
+        if self.covariance is None:
+            return None
+
+        return np.sqrt(np.diag(self.covariance))
+
+    def __str__(self):
+        return "Fit of '{}' ({}): {}, cost {:g} after {} evaluations".format(
+            self.model, self.method, self.message, self.cost, self.nfev)
+
+    def savetohdf5(self, group):
+        """Saves the result into an hdf5 group: the arrays as datasets, the
+        rest as attributes."""
+        group.attrs['type'] = 'fit'
+        for key in ('method', 'success', 'message', 'nfev', 'cost', 'model', 'label'):
+            value = getattr(self, key)
+            if value is not None:
+                group.attrs[key] = value
+
+        group.create_dataset("params", data=self.params)
+        if self.covariance is not None:
+            group.create_dataset("covariance", data=self.covariance)
+
+    @classmethod
+    def fromhdf5(cls, group):
+        """Result saved with savetohdf5."""
+        attrs = group.attrs
+        return cls(group['params'][()], attrs.get('method'), bool(attrs.get('success')),
+                   attrs.get('message'), int(attrs.get('nfev', 0)), float(attrs.get('cost', np.nan)),
+                   covariance=group['covariance'][()] if 'covariance' in group else None,
+                   model=attrs.get('model'), label=attrs.get('label'))
+
+
+class FitProgress:
+    """State of a running fit, passed to the fit callbacks after every
+    evaluation of the objective.
+
+    evaluation -- objective evaluations so far
+    iteration -- iterations of the optimizer so far (Jacobian evaluations
+                 for the least-squares methods)
+    cost -- half the sum of the squared residuals at params
+    best -- lowest cost so far
+    params -- parameters of the evaluation
+    delta -- change of the parameters since the previous evaluation
+    elapsed -- seconds since the start of the fit
+    rate -- evaluations per second
+    """
+
+    def __init__(self, model, method, evaluation, iteration, cost, best, params, delta, elapsed):
+        self.model = model
+        self.method = method
+        self.evaluation = evaluation
+        self.iteration = iteration
+        self.cost = cost
+        self.best = best
+        self.params = params
+        self.delta = delta
+        self.elapsed = elapsed
+
+    @property
+    def rate(self):
+        return self.evaluation / self.elapsed if self.elapsed > 0 else np.inf
+
+    def __str__(self):
+        return "{} ({}): evaluation {}, iteration {}, cost {:g} (best {:g}), {:.0f} evaluations/s, |delta| {:.3g}".format(
+            self.model, self.method, self.evaluation, self.iteration, self.cost, self.best, self.rate,
+            np.sqrt(np.dot(self.delta, self.delta)))
+
+
+class EarlyStopping:
+    """Fit callback stopping a fit that has stalled or run out of budget.
+
+    Parameters:
+    plateau -- Stop when the best cost improved by less than this fraction
+               over the last patience evaluations.
+    patience -- Evaluations over which the improvement is measured.
+    timeout -- Stop after this many seconds.
+    maxEvaluations -- Stop after this many evaluations of the objective.
+
+    The instance can be reused: its state is reset at the first evaluation
+    of every fit.
+    """
+
+    def __init__(self, plateau=None, patience=100, timeout=None, maxEvaluations=None):
+        self.plateau = plateau
+        self.patience = patience
+        self.timeout = timeout
+        self.maxEvaluations = maxEvaluations
+        self._bests = collections.deque(maxlen=patience + 1)
+
+    def __call__(self, progress):
+        if progress.evaluation == 1:
+            self._bests.clear()
+
+        if self.maxEvaluations is not None and progress.evaluation >= self.maxEvaluations:
+            return "maximum of {} evaluations reached".format(self.maxEvaluations)
+
+        if self.timeout is not None and progress.elapsed >= self.timeout:
+            return "time limit of {:g} s reached".format(self.timeout)
+
+        if self.plateau is not None:
+            self._bests.append(progress.best)
+            if len(self._bests) == self._bests.maxlen:
+                previous = self._bests[0]
+                if previous - progress.best <= self.plateau * abs(previous):
+                    return "relative improvement below {:g} over {} evaluations".format(self.plateau, self.patience)
+
+        return None
+
+
+class ProgressLog:
+    """Fit callback printing the progress (see FitProgress) at most every
+    interval seconds, e.g. to follow long batch fits in the logs."""
+
+    def __init__(self, interval=10.0, file=None):
+        self.interval = interval
+        self.file = file
+        self._last = None
+
+    def __call__(self, progress):
+        if progress.evaluation == 1:
+            self._last = -np.inf
+        if progress.elapsed - self._last >= self.interval:
+            self._last = progress.elapsed
+            print(progress, file=self.file or sys.stdout, flush=True)
+
+
+class _StopFit(Exception):
+    """Raised through the optimizer to stop a fit early."""
+
+
+class _FitMonitor:
+    """Tracks the evaluations of a fit objective and calls the callbacks,
+    stopping the fit when one returns a true value (its reason, if a
+    string)."""
+
+    def __init__(self, callbacks, model, method):
+        self.callbacks = callbacks
+        self.model = model
+        self.method = method
+        self.evaluations = 0
+        self.iterations = 0
+        self.best = np.inf
+        self.bestParams = None
+        self.reason = None
+        self._previous = None
+        self._start = time.perf_counter()
+
+    def iterated(self, *args):
+        self.iterations += 1
+
+    def evaluated(self, params, cost):
+        params = np.array(params, dtype=float)
+        self.evaluations += 1
+        if cost < self.best or self.bestParams is None:
+            self.best, self.bestParams = cost, params
+
+        delta = params - self._previous if self._previous is not None else np.zeros_like(params)
+        self._previous = params
+
+        progress = FitProgress(self.model.name, self.method, self.evaluations, self.iterations,
+                               cost, self.best, params, delta, time.perf_counter() - self._start)
+        for callback in self.callbacks:
+            reason = callback(progress)
+            if reason:
+                self.reason = reason if isinstance(reason, str) else "stopped by {!r}".format(callback)
+                raise _StopFit(self.reason)
 
 
 class OpticalSystem:
@@ -14,6 +209,7 @@ class OpticalSystem:
 
         self.datasets = []  # List of datasets
         self.models = []  # List of optical models
+        self.fits = []  # List of fit results
         self.logger = ""
         self.description = description
 
@@ -26,41 +222,62 @@ class OpticalSystem:
         self._description = string
 
     def save(self, filename):
-        """Save everything to an hdf5 file"""
-        f = h5py.File(filename, "w")
-        # Specify in the metadata that it contains a system
-        f.attrs['type'] = 'optics system'
-        f.attrs['desc'] = self.description
-
-        # Save models
-        h5models = f.create_group("models")
-        for model in self.models:
-            h5model = h5models.create_group(model.name)
-            model.savetohdf5(h5model)
-
-        # Save datasets
-        h5datasets = f.create_group("datasets")
-        for i, dataset in enumerate(self.datasets):
-            h5dataset = h5datasets.create_group(str(i))
-            dataset.savetohdf5(h5dataset)
-        f.close()
-
-    def load(self, filename):
-        """Load everything from an hdf5 file"""
-        f = h5py.File(filename, "r")
-        assert (f.attrs['type'] == 'optics system'), "This file does not contain a optics system"
-
-        for name, h5model in f['models'].items():
-            om = self.createModel(name)
-            om.loadfromhdf5(h5model)
-
-        # Load datasets
-        for i, hd5dataset in f['datasets'].items():
-            dset = Datasets.Dataset()
-            dset.loadfromhdf5(hd5dataset)
-            self.datasets.append(dset)
-
-        f.close()
+        """Save everything to an hdf5 file: models, datasets and fit results,
+        each in a group named after its index."""
+
+        # Lazily loaded datasets still read from the file being overwritten
+        for dataset in self.datasets:
+            dataset.detach(filename)
+
+        with h5py.File(filename, "w") as f:
+            # Specify in the metadata that it contains a system
+            f.attrs['type'] = 'optics system'
+            if self.description is not None:
+                f.attrs['desc'] = self.description
+
+            # Save models
+            h5models = f.create_group("models")
+            for i, model in enumerate(self.models):
+                h5model = h5models.create_group(str(i))
+                model.savetohdf5(h5model)
+
+            # Save datasets
+            h5datasets = f.create_group("datasets")
+            for i, dataset in enumerate(self.datasets):
+                h5dataset = h5datasets.create_group(str(i))
+                dataset.savetohdf5(h5dataset)
+
+            # Save fit results
+            h5fits = f.create_group("fits")
+            for i, result in enumerate(self.fits):
+                h5fit = h5fits.create_group(str(i))
+                result.savetohdf5(h5fit)
+
+    @staticmethod
+    def __ordered(group):
+        """Members of a group in the order they were saved."""
+        return sorted(group.items(), key=lambda item: int(item[0]) if item[0].isdigit() else item[0])
+
+    def load(self, filename, lazy=True):
+        """Load everything from an hdf5 file. With lazy, the data of the
+        datasets is only read from the file when used (see
+        Dataset.loadfromhdf5)."""
+        with h5py.File(filename, "r") as f:
+            assert (f.attrs['type'] == 'optics system'), "This file does not contain a optics system"
+            if 'desc' in f.attrs:
+                self.description = f.attrs['desc']
+
+            for name, h5model in self.__ordered(f['models']):
+                om = self.createModel(name)
+                om.loadfromhdf5(h5model)
+
+            # Load datasets
+            for i, hd5dataset in self.__ordered(f['datasets']):
+                self.datasets.append(Datasets.Dataset.fromhdf5(hd5dataset, lazy))
+
+            # Load fit results
+            for i, h5fit in self.__ordered(f.get('fits', {})):
+                self.fits.append(FitResult.fromhdf5(h5fit))
 
     def createModel(self, name=None):
         """Creates an optical model with a given name returning the instance of
@@ -193,40 +410,283 @@ class OpticalSystem:
     """
 
     @staticmethod
+    @profiled("OpticalSystem.fitError")
     def __fit_error(params, model, datasets):
+        """Sum of the squared weighted residuals, the objective of the
+        scalar minimizers: twice the cost of the least-squares methods."""
 
-        e = 0.0
         model.params = params
+        residuals = OpticalSystem.__fit_residuals(model.params, model, datasets)
+
+        #Constraints (should be contained in the model)
+
+        return np.dot(residuals, residuals)
+
+    @staticmethod
+    def __split(values):
+        """Real residuals (or Jacobian rows) from possibly complex ones."""
+        if np.iscomplexobj(values):
+            return np.concatenate((np.real(values), np.imag(values)), axis=-1)
+
+        return values
+
+    @staticmethod
+    @profiled("OpticalSystem.fitResiduals")
+    def __fit_residuals(params, model, datasets):
+        """Weighted residuals of all the datasets, concatenated. Complex
+        quantities contribute their real and imaginary parts."""
+
+        model.setParamsUnchecked(params)
+        residuals = []
         for dataset in datasets:
-            epsilon = model.dielectric_function(dataset.x)
+            epsilon = model.dielectricFunction(dataset.grid)
             processed = dataset.inputToType(epsilon)
-            e += np.sum(np.power(np.absolute(processed - dataset.y), 2))
+            residuals.append(OpticalSystem.__split(dataset.weight*(processed - dataset.y)))
 
-        #Constraints (should be contained in the model)
+        return np.concatenate(residuals)
+
+    @staticmethod
+    @profiled("OpticalSystem.fitJacobian")
+    def __fit_jacobian(params, model, datasets):
+        """Jacobian of __fit_residuals, of shape (residuals, parameters)."""
+
+        model.setParamsUnchecked(params)
+        rows = []
+        for dataset in datasets:
+            epsilon = model.dielectricFunction(dataset.grid)
+            jacobian = dataset.inputToTypeJacobian(epsilon, model.jacobian(dataset.grid))
+            rows.append(OpticalSystem.__split(dataset.weight*jacobian))
+
+        return np.concatenate(rows, axis=-1).T
+
+    @staticmethod
+    def __covariance(jacobian, cost, dof):
+        """Covariance of the parameters from the Jacobian at the solution."""
+
+        _, s, VT = np.linalg.svd(jacobian, full_matrices=False)
+        threshold = np.finfo(float).eps * max(jacobian.shape) * s[0] if s.size else 0.0
+        s = s[s > threshold]
+        VT = VT[:s.size]
+        covariance = np.dot(VT.T / s**2, VT)
 
-        return e
+        return covariance * 2.0 * cost / dof if dof > 0 else covariance * np.inf
 
-    def fit(self, model, datasets=None, verbose=True):
-        if datasets==None:
-            dsets = self.datasets
+    def _datasets(self, datasets):
+        """Resolves datasets given as None (all), a dataset, a list of
+        datasets or a list of indexes."""
+
+        if datasets is None:
+            return self.datasets
         elif isinstance(datasets, Datasets.Dataset):
-            dsets = [datasets]
+            return [datasets]
         elif isinstance(datasets[0], Datasets.Dataset):
-            dsets = datasets
-        elif isinstance(datasets[0], int):
-            dsets = []
-            for i in datasets:
-                dsets.append(self.datasets[i])
+            return list(datasets)
+        else:
+            return [self.datasets[i] for i in datasets]
+
+    @profiled()
+    def fit(self, model, datasets=None, verbose=True, method="Powell", callback=None):
+        """Fits the parameters of model to datasets.
+
+        Parameters:
+        model -- The OpticalModel to fit. Its parameters are updated.
+        datasets -- None (all the datasets), a dataset, or a list of datasets
+                    or of their indexes.
+        verbose -- Whether to print the initial parameters and the model.
+        method -- "Powell" (or any scipy.optimize.minimize method) minimizes
+                  the sum of the squared weighted residuals; "trf", "dogbox"
+                  and "lm" use scipy.optimize.least_squares on the vector of
+                  weighted residuals with analytic Jacobians. Both report
+                  the same cost. "trf" and "dogbox" keep the parameters
+                  non-negative; "lm" does not support bounds.
+        callback -- A callable, or a list of them, called with a FitProgress
+                    after every evaluation of the objective (see
+                    EarlyStopping and ProgressLog). A true return value
+                    stops the fit at the best parameters so far; a string
+                    is reported as the reason.
+
+        Returns:
+                A FitResult, also appended to fits. Least-squares methods
+                report the covariance and uncertainties of the parameters.
+                A stopped fit is not successful, its message gives the
+                reason.
+        """
+
+        dsets = self._datasets(datasets)
 
         parameters = model.params
-        print(parameters)
-        Result = minimize(self.__fit_error,
+        if verbose:
+            print(parameters)
+
+        monitor = None
+        if callback is not None:
+            callbacks = list(callback) if isinstance(callback, (list, tuple)) else [callback]
+            monitor = _FitMonitor(callbacks, model, method)
+
+        try:
+            result = self.__fitWith(model, dsets, method, parameters, monitor)
+        except _StopFit:
+            params = monitor.bestParams
+            if method in ("trf", "dogbox", "lm"):
+                model.setParamsUnchecked(params)
+                residuals = self.__fit_residuals(params, model, dsets)
+                covariance = self.__covariance(self.__fit_jacobian(params, model, dsets),
+                                               monitor.best, residuals.size - params.size)
+            else:
+                model.params = params
+                covariance = None
+
+            result = FitResult(params, method, False, "Stopped: " + monitor.reason,
+                               monitor.evaluations, monitor.best, model=model.name, covariance=covariance)
+
+        self.fits.append(result)
+
+        if verbose:
+            model.show()
+
+        return result
+
+    def __fitWith(self, model, dsets, method, parameters, monitor):
+        """Runs the optimizer, reporting every evaluation to monitor if given."""
+
+        residuals, error, jacobian, iterated = self.__fit_residuals, self.__fit_error, self.__fit_jacobian, None
+
+        if monitor is not None:
+            iterated = monitor.iterated
+
+            def residuals(params, model, datasets):
+                values = OpticalSystem.__fit_residuals(params, model, datasets)
+                monitor.evaluated(params, 0.5 * np.dot(values, values))
+                return values
+
+            def error(params, model, datasets):
+                value = OpticalSystem.__fit_error(params, model, datasets)
+                monitor.evaluated(params, value / 2.0)
+                return value
+
+            def jacobian(params, model, datasets):
+                monitor.iterated()
+                return OpticalSystem.__fit_jacobian(params, model, datasets)
+
+        if method in ("trf", "dogbox", "lm"):
+            bounds = (-np.inf, np.inf) if method == "lm" else (0.0, np.inf)
+            Result = least_squares(residuals,
+                x0=parameters,
+                jac=jacobian,
+                bounds=bounds,
+                method=method,
+                args=(model, dsets))
+
+            model.setParamsUnchecked(Result.x)
+            return FitResult(Result.x, method, Result.success, Result.message,
+                             Result.nfev, Result.cost, model=model.name,
+                             covariance=self.__covariance(Result.jac, Result.cost,
+                                                          Result.fun.size - Result.x.size))
+
+        Result = minimize(error,
             x0=parameters,
-            method="Powell",
-            args=(model, dsets),
-            jac=False)
+            method=method,
+            callback=iterated,
+            args=(model, dsets))
+
+        model.params = Result.x
+        return FitResult(Result.x, method, Result.success, Result.message,
+                         Result.nfev, Result.fun / 2.0, model=model.name)
+
+    def fitBatch(self, model, datasets=None, groupBy=None, restarts=0, spread=0.3,
+                 chain=True, method="trf", workers=None, seed=None, callback=None):
+        """Runs independent fits of the structure of model in parallel
+        processes.
+
+        Parameters:
+        model -- The OpticalModel providing the structure and the initial
+                 parameters. It is not modified.
+        datasets -- As in fit. By default, all the datasets.
+        groupBy -- None fits each dataset on its own; "label" fits together
+                   the datasets sharing a label (e.g., a temperature), in
+                   ascending order of label, the unlabelled ones first.
+        restarts -- Extra fits per group from randomly perturbed initial
+                    parameters (multiplied by exp(spread*N(0,1))). The
+                    fit with the lowest cost is kept.
+        chain -- Seed each fit from the converged parameters of the previous
+                 group. The groups are split in contiguous chunks, one per
+                 worker, each walked in order.
+        method -- As in fit.
+        workers -- Number of processes; 1 runs in this process.
+        seed -- Seed of the random restarts.
+        callback -- As in fit, called in the worker processes, so it must
+                    be picklable if workers > 1 (e.g. an EarlyStopping).
+
+        Returns:
+                A list of FitResult, one per group in order, labelled with
+                the label of the group. Also appended to fits.
+        """
+
+        dsets = self._datasets(datasets)
+
+        if groupBy == "label":
+            # Unlabelled datasets (label None) form the first group
+            labels = sorted(set(dataset.label for dataset in dsets), key=lambda label: (label is not None, label))
+            groups = [(label, [dataset for dataset in dsets if dataset.label == label])
+                      for label in labels]
+        else:
+            groups = [(dataset.label, [dataset]) for dataset in dsets]
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        if chain:
+            chunks = [list(chunk) for chunk in np.array_split(np.arange(len(groups)), min(workers, len(groups)))]
+        else:
+            chunks = [[i] for i in range(len(groups))]
+
+        seeds = np.random.RandomState(seed).randint(2**31, size=len(chunks))
+        jobs = [([groups[i] for i in chunk], seeds[n]) for n, chunk in enumerate(chunks)]
+
+        if workers == 1:
+            results = [_fitChain(copy.deepcopy(model), job, method, restarts, spread, jobSeed, chain, callback)
+                       for job, jobSeed in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(_fitChain, model, job, method, restarts, spread, jobSeed, chain, callback)
+                           for job, jobSeed in jobs]
+                results = [future.result() for future in futures]
+
+        results = [result for chunk in results for result in chunk]
+        self.fits.extend(results)
+
+        return results
+
+
+def _fitChain(model, groups, method, restarts, spread, seed, chain, callback=None):
+    """Fits model to each (label, datasets) group in turn, keeping the best
+    of the random restarts. Runs in the worker processes of fitBatch."""
+
+    system = OpticalSystem()
+    random = np.random.RandomState(seed)
+    start = np.array(model.params)
+
+    results = []
+    for label, datasets in groups:
+        best = None
+        for attempt in range(restarts + 1):
+            if attempt:
+                model.setParamsUnchecked(start * np.exp(spread * random.standard_normal(start.size)))
+            else:
+                model.setParamsUnchecked(start)
+
+            result = system.fit(model, datasets, verbose=False, method=method, callback=callback)
+            if best is None or result.cost < best.cost:
+                best = result
+
+        best.label = label
+        results.append(best)
+
+        if chain:
+            start = best.params
+
+    return results
 
-        return True if verbose == False else model.show()
 
 if __name__ == '__main__':
     system = OpticalSystem()
@@ -3,7 +3,8 @@
 Drude family of oscillators.
 """
 
-from Oscillators.Oscillator import BaseOscillator, parameter, hbar
+from Oscillators.Oscillator import BaseOscillator, parameter, hbar, swFactor
+from relations import asGrid
 
 import numpy as np
 import scipy.constants as constants
@@ -23,12 +24,14 @@ class Drude(BaseOscillator):  # Using the base oscillator as parent
 
     """
 
+    __slots__ = ()
+
     nparams = 2
 
     representation = "standard"
 
-    amplitude = parameter('amplitude', 0.0)
-    width = parameter('width', 0.0)
+    amplitude = parameter('amplitude', 0.0, 0)
+    width = parameter('width', 0.0, 1)
     position = 0  # Needed to allow sorting.
 
     def __init__(self, amplitude=0.0, width=0.0):
@@ -70,19 +73,62 @@ class Drude(BaseOscillator):  # Using the base oscillator as parent
 
         return self.SW
 
+    def partialSpectralWeight(self, low, high):
+        """Returns the spectral weight between the energies low and high (eV).
+
+        E epsilon_2(E) = A gamma/(E^2 + gamma^2), whose primitive is
+        A arctan(E/gamma).
+        """
+
+        return swFactor*self.amplitude*(np.arctan2(high, self.width) - np.arctan2(low, self.width))
+
     def dielectricFunction(self, energy):
         """Returns the complex dielectric function at the specified energy.
 
         input
         =====
 
-        energy: Specified (range) of values to return.
+        energy: Specified (range) of values to return, or EnergyGrid.
         """
 
-        _den = energy + 1.j * self.width
-        self.dfunc = np.divide(-self.amplitude, energy * _den)
+        grid = asGrid(energy)
+        _den = grid.E2 + 1.j * self.width * grid.E
+        return np.divide(-self.amplitude, _den)
+
+    def jacobian(self, energy):
+        """Returns the analytic derivatives of the dielectric function with
+        respect to (amplitude, width) at the specified energy."""
+
+        grid = asGrid(energy)
+        energy = grid.E
+        _den = grid.E2 + 1.j * self.width * energy
+
+        _jac = np.empty((self.nparams,) + energy.shape, dtype=complex)
+        _jac[0] = -1.0 / _den
+        _jac[1] = 1.j * self.amplitude * energy / np.power(_den, 2)
+
+        return _jac
+
+    @classmethod
+    def batchDielectricFunction(cls, window, params, out):
+        """Adds the dielectric function of several Drude oscillators to out.
+
+        See BaseOscillator.batchDielectricFunction.
+        """
+
+        grid = asGrid(window)
+        E = grid.E
+        A = params[..., :, 0, np.newaxis]
+        B = params[..., :, 1, np.newaxis]
+
+        _den = np.empty(np.broadcast(E, A).shape, dtype=complex)
+        _den.real = grid.E2
+        _den.imag = B * E
+        np.divide(-A, _den, out=_den)
+
+        out += _den.sum(axis=-2)
 
-        return self.dfunc
+        return out
 
 
 class Drude_genosc(Drude):
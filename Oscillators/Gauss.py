@@ -2,7 +2,9 @@
 """
 Gaussian family of oscillators.
 """
-from Oscillators.Oscillator import BaseOscillator, parameter, hbar
+from Oscillators.Oscillator import BaseOscillator, parameter, hbar, swFactor
+from Oscillators.Kernels import gaussDielectricFunction
+from relations import asGrid
 
 import numpy as np
 import scipy.special
@@ -24,13 +26,15 @@ class Gauss(BaseOscillator):
 
     """
 
+    __slots__ = ()
+
     nparams = 3
 
     representation = "standard"
 
-    amplitude = parameter('amplitude', 0.0)
-    width = parameter('width', 0.0)
-    position = parameter('position', 0.0)
+    amplitude = parameter('amplitude', 0.0, 0)
+    width = parameter('width', 0.0, 1)
+    position = parameter('position', 0.0, 2)
 
     def __init__(self, amplitude=0.0, width=0.0, position=0.0):
         """Defines a Gaussian lineshape as described in
@@ -68,38 +72,107 @@ class Gauss(BaseOscillator):
 
     @property
     def spectralWeight(self):
-        """Returns the spectral weight of the oscillator."""
+        """Returns the spectral weight of the oscillator,
+        swFactor * A Ec sigma sqrt(pi) with sigma = B/(2 sqrt(ln 2))."""
 
-        _preFactor = constants.epsilon_0*constants.pi/2/hbar**2
-        self.SW = _preFactor*self.amplitude
+        _sigma = self.width/(2*sqrt(log(2)))
+        self.SW = swFactor*self.amplitude*self.position*_sigma*sqrt(constants.pi)
 
         return self.SW
 
+    def partialSpectralWeight(self, low, high):
+        """Returns the spectral weight between the energies low and high (eV).
+
+        E epsilon_2(E) = A E (g(E - Ec) - g(E + Ec)) with g(u) = exp(-u^2/sigma^2),
+        integrated with int u g(u) du = -sigma^2/2 g(u) and
+        int g(u) du = sigma sqrt(pi)/2 erf(u/sigma).
+        """
+
+        A, Ec = self.amplitude, self.position
+        _sigma = self.width/(2*sqrt(log(2)))
+        if _sigma == 0.0:
+            return swFactor*0.0*(np.asarray(high, dtype=float) - low)
+
+        def _primitive(energy):
+            _minus = (np.asarray(energy, dtype=float) - Ec)/_sigma
+            _plus = (np.asarray(energy, dtype=float) + Ec)/_sigma
+            return A*(0.5*_sigma*_sigma*(np.exp(-_plus*_plus) - np.exp(-_minus*_minus))
+                      + 0.5*Ec*_sigma*sqrt(constants.pi)*(scipy.special.erf(_minus) + scipy.special.erf(_plus)))
+
+        return swFactor*(_primitive(high) - _primitive(low))
+
     def dielectricFunction(self, window):
         """Returns the complex dielectric function at the specified energy.
 
         input
         =====
 
-        window: Specified (range) of values to return.
+        window: Specified (range) of values to return, or EnergyGrid.
+        """
+
+        window = asGrid(window).E
+        _dfunc = np.zeros(window.shape, dtype=complex)
+        gaussDielectricFunction(window.ravel(), _dfunc.reshape(-1), self.amplitude, self.width, self.position)
+        return _dfunc
+
+    def jacobian(self, window):
+        """Returns the analytic derivatives of the dielectric function with
+        respect to (amplitude, width, position) at the specified window.
+
+        Uses D'(u) = 1 - 2uD(u) for the Dawson function D of the real part.
+        """
+
+        window = asGrid(window).E
+        A, B = self.amplitude, self.width
+        _scale = 2.0 * sqrt(log(2)) / B
+
+        _plus = (window + self.position) * _scale
+        _minus = (window - self.position) * _scale
+        _gplus = np.exp(-_plus * _plus)
+        _gminus = np.exp(-_minus * _minus)
+        _dplus = scipy.special.dawsn(_plus)
+        _dminus = scipy.special.dawsn(_minus)
+        _dplus_prime = 1.0 - 2.0 * _plus * _dplus
+        _dminus_prime = 1.0 - 2.0 * _minus * _dminus
+
+        _jac = np.empty((self.nparams,) + window.shape, dtype=complex)
+        _jac[0] = 2.0 / sqrt(np.pi) * (_dplus - _dminus) + 1.j * (_gminus - _gplus)
+        _jac[1] = 2.0 * A / B * (
+            (_minus * _dminus_prime - _plus * _dplus_prime) / sqrt(np.pi)
+            + 1.j * (_minus * _minus * _gminus - _plus * _plus * _gplus))
+        _jac[2] = 2.0 * A * _scale * (
+            (_dplus_prime + _dminus_prime) / sqrt(np.pi)
+            + 1.j * (_minus * _gminus + _plus * _gplus))
+
+        return _jac
+
+    @classmethod
+    def batchDielectricFunction(cls, window, params, out):
+        """Adds the dielectric function of several Gaussian oscillators to out.
+
+        See BaseOscillator.batchDielectricFunction.
         """
 
-        LN2 = log(2)
-        SLN2 = sqrt(LN2)
-        G2 = pow(self.width, 2)
+        SLN2 = sqrt(log(2))
+
+        E = asGrid(window).E
+        A = params[..., :, 0, np.newaxis]
+        _scale = 2.0 * SLN2 / params[..., :, 1, np.newaxis]
+        Ec = params[..., :, 2, np.newaxis]
 
-        _imag = self.amplitude * \
-            (np.exp(-4.0 * LN2 * np.power(window-self.position, 2) / G2) 
-           - np.exp(-4.0 * LN2 * np.power(window+self.position, 2) / G2))
+        _plus = (E + Ec) * _scale
+        _minus = (E - Ec) * _scale
 
-        _real = self.amplitude * 2.0 / sqrt(np.pi) * \
-            (scipy.special.dawsn(2.0*SLN2 * (window+self.position) / self.width)
-           - scipy.special.dawsn(2.0*SLN2 * (window-self.position) / self.width))
+        _imag = np.exp(-_minus * _minus) - np.exp(-_plus * _plus)
+        _imag *= A
+        _real = scipy.special.dawsn(_plus)
+        _real -= scipy.special.dawsn(_minus)
+        _real *= 2.0 / sqrt(np.pi) * A
 
-        _den = window + 1.j * self.width
-        self.dfunc = np.divide(-self.amplitude, window * _den)
+        out.real += _real.sum(axis=-2)
+        out.imag += _imag.sum(axis=-2)
 
-        return _real + 1.j*_imag
+        return out
 
 
 class Gauss_genosc(Gauss):
@@ -157,9 +230,11 @@ class Gauss_genosc(Gauss):
         input
         =====
 
-        energy: Specified (range) of values to return.
+        energy: Specified (range) of values to return, or EnergyGrid.
         """
 
+        energy = asGrid(energy).E
+
         def _realDF(imaginaryPart):
             # TODO: Add KK consistent part
             return 0
@@ -174,9 +249,7 @@ class Gauss_genosc(Gauss):
         _imaginaryPart = _imagDF(energy)
         _realPart = _realDF(_imaginaryPart)
 
-        self.dfunc = _realPart + 1.j*_imaginaryPart
-
-        return self.dfunc
+        return _realPart + 1.j*_imaginaryPart
 
     def spectralWeight(self, window=None):
         """Returns the spectral weight of the oscillator.
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Fused kernels of the Tauc-Lorentz and Gaussian lineshapes.
+
+The kernels add the dielectric function of one oscillator to a complex
+buffer, computing the real and imaginary parts together. The scalars
+depending only on the parameters are computed once per call; with numba
+installed the Tauc-Lorentz kernel is a single compiled loop over the
+energies, without any temporary array. Otherwise (or with jit = False) the
+NumPy versions are used, working in place on a few buffers.
+"""
+from math import log, pi, sqrt
+
+import numpy as np
+import scipy.special
+
+from profiling import profiled
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Use the compiled kernels when numba is available
+jit = numba is not None
+
+
+def _taucCoefficients(A, C, E0, Eg):
+    """Scalars of the Tauc-Lorentz lineshape (Jellison and Modine), or
+    arrays of them for arrays of parameters.
+
+    The real part is
+
+        (p1 E^2 + p0 + c4 (E^2+Eg^2)/E ln(|E-Eg|/(E+Eg))
+            + c5 (ln(|E-Eg| (E+Eg)) - lnN)) / ((E^2-g2)^2 + a2)
+
+    and the imaginary part cim (E-Eg)^2 / (((E^2-E0^2)^2 + C^2 E^2) E)
+    above the gap, zero below.
+    """
+
+    # NumPy scalars, so that degenerate parameters give inf/nan (with a
+    # warning) as the array expressions do, instead of raising
+    A, C, E0, Eg = (np.asarray(p, dtype=float)[()] for p in (A, C, E0, Eg))
+    E02, Eg2, C2 = E0*E0, Eg*Eg, C*C
+
+    alfa = np.sqrt(4.0*E02 - C2)
+    g2 = E02 - C2/2.0
+
+    k1 = 0.5*A*C/pi/alfa/E0 * np.log((E02 + Eg2 + alfa*Eg) / (E02 + Eg2 - alfa*Eg))
+    k2 = A/pi/E0 * (pi - np.arctan((2.0*Eg + alfa)/C) + np.arctan((alfa - 2.0*Eg)/C))
+    k3 = 2.0*A*E0*Eg/pi/alfa * (pi + 2.0*np.arctan(2.0*(g2 - Eg2)/alfa/C))
+
+    p1 = k1*(Eg2 - E02) - k2*(E02 + Eg2) + k3
+    p0 = k1*(Eg2*C2 - E02*(E02 + 3.0*Eg2)) - k2*(Eg2*C2 - E02*(E02 + Eg2)) - k3*g2
+    c4 = -A*E0*C/pi
+    c5 = 2.0*A*E0*C*Eg/pi
+    lnN = 0.5*np.log((E02 - Eg2)**2 + Eg2*C2)
+
+    return p1, p0, c4, c5, lnN, g2, alfa*alfa*C2/4.0, A*E0*C, E02, C2, Eg
+
+
+def _taucNumpy(E, E2, out, p1, p0, c4, c5, lnN, g2, a2, cim, E02, C2, Eg):
+    _minus = E - Eg
+    _plus = E + Eg
+
+    # Imaginary part, zero below the gap
+    _den = E2 - E02
+    _den *= _den
+    _den += C2*E2
+    _den *= E
+    _imag = np.maximum(_minus, 0.0)
+    _imag *= _imag
+    _imag *= cim
+    _imag /= _den
+    out.imag += _imag
+
+    # Real part, reusing the buffers
+    np.abs(_minus, out=_minus)
+    _real = np.multiply(_minus, _plus, out=_imag)
+    np.log(_real, out=_real)
+    _real -= lnN
+    _real *= c5
+    np.divide(_minus, _plus, out=_minus)
+    np.log(_minus, out=_minus)
+    np.add(E2, Eg*Eg, out=_plus)
+    _plus /= E
+    _plus *= c4
+    _minus *= _plus
+    _real += _minus
+    _real += p0
+    _real += p1*E2
+
+    np.subtract(E2, g2, out=_den)
+    _den *= _den
+    _den += a2
+    _real /= _den
+    out.real += _real
+
+
+def _taucLoop(E, E2, out, p1, p0, c4, c5, lnN, g2, a2, cim, E02, C2, Eg):
+    for i in range(E.shape[0]):
+        x = E[i]
+        x2 = E2[i]
+        d = x - Eg
+        s = x + Eg
+
+        a = abs(d)
+        real = p1*x2 + p0 + c4*(x2 + Eg*Eg)/x*np.log(a/s) + c5*(np.log(a*s) - lnN)
+        csi = x2 - g2
+        real /= csi*csi + a2
+
+        imag = 0.0
+        if d > 0.0:
+            den = x2 - E02
+            imag = cim*d*d/((den*den + C2*x2)*x)
+
+        out[i] += complex(real, imag)
+
+
+def _taucRows(E, E2, out, coefficients):
+    for row in range(coefficients.shape[0]):
+        c = coefficients[row]
+        _taucLoop(E, E2, out, c[0], c[1], c[2], c[3], c[4], c[5], c[6], c[7], c[8], c[9], c[10])
+
+
+if numba is not None:
+    _taucLoop = numba.njit(cache=True, error_model='numpy')(_taucLoop)
+    _taucRows = numba.njit(cache=True, error_model='numpy')(_taucRows)
+
+
+@profiled()
+def taucDielectricFunction(E, E2, out, amplitude, width, position, gap):
+    """Adds the Tauc-Lorentz dielectric function to out.
+
+    input
+    =====
+
+    E: 1-D array of energies (eV).
+    E2: their squares.
+    out: complex array of the shape of E, updated in place.
+    amplitude, width, position, gap: parameters of the oscillator.
+    """
+
+    coefficients = _taucCoefficients(amplitude, width, position, gap)
+
+    if jit and numba is not None:
+        _taucLoop(E, E2, out, *coefficients)
+    else:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            _taucNumpy(E, E2, out, *coefficients)
+
+    return out
+
+
+@profiled()
+def taucBatchDielectricFunction(E, E2, params, out):
+    """Adds the dielectric function of several Tauc-Lorentz oscillators to
+    out.
+
+    input
+    =====
+
+    E: 1-D array of energies (eV).
+    E2: their squares.
+    params: array of shape (..., oscillators, 4), ordered as Tauc.params.
+    out: complex array of shape (..., len(E)), updated in place.
+    """
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if jit and numba is not None:
+            coefficients = np.stack(np.broadcast_arrays(*_taucCoefficients(*np.moveaxis(params, -1, 0))), axis=-1)
+            for row in np.ndindex(params.shape[:-2]):
+                _taucRows(E, E2, out[row], coefficients[row])
+        else:
+            # One broadcasted pass over (oscillators x energies)
+            _dfunc = np.zeros(params.shape[:-1] + E.shape, dtype=complex)
+            _taucNumpy(E, E2, _dfunc, *_taucCoefficients(*np.moveaxis(params[..., np.newaxis], -2, 0)))
+            out += _dfunc.sum(axis=-2)
+
+    return out
+
+
+@profiled()
+def gaussDielectricFunction(E, out, amplitude, width, position):
+    """Adds the Gaussian dielectric function to out.
+
+    The Dawson function of the real part has no numba implementation, so
+    this kernel is NumPy only, working in place on two buffers.
+
+    input
+    =====
+
+    E: 1-D array of energies (eV).
+    out: complex array of the shape of E, updated in place.
+    amplitude, width, position: parameters of the oscillator.
+    """
+
+    # inf for a zero width, as the array expressions
+    _scale = 2.0*sqrt(log(2))/np.float64(width)
+
+    _plus = E + position
+    _plus *= _scale
+    _minus = E - position
+    _minus *= _scale
+
+    _real = scipy.special.dawsn(_plus)
+    _real -= scipy.special.dawsn(_minus)
+    _real *= 2.0/sqrt(pi)*amplitude
+    out.real += _real
+
+    _imag = np.square(_minus, out=_real)
+    np.negative(_imag, out=_imag)
+    np.exp(_imag, out=_imag)
+    np.square(_plus, out=_plus)
+    np.negative(_plus, out=_plus)
+    np.exp(_plus, out=_plus)
+    _imag -= _plus
+    _imag *= amplitude
+    out.imag += _imag
+
+    return out
@@ -3,7 +3,8 @@
 Lorentz family of oscillators.
 """
 
-from Oscillators.Oscillator import BaseOscillator, parameter, hbar
+from Oscillators.Oscillator import BaseOscillator, parameter, hbar, swFactor
+from relations import asGrid
 
 import math
 import numpy as np
@@ -23,13 +24,15 @@ class Lorentz(BaseOscillator):
         $E_c$ energy center (eV).
     """
 
+    __slots__ = ()
+
     nparams = 3
 
     representation = "standard"
 
-    amplitude = parameter('amplitude', 0.0)
-    width = parameter('width', 0.0)
-    position = parameter('position', 0.0)
+    amplitude = parameter('amplitude', 0.0, 0)
+    width = parameter('width', 0.0, 1)
+    position = parameter('position', 0.0, 2)
 
     def __init__(self, amplitude=0.0, width=0.0, position=0.0):
         """Defines a Lorentz lineshape.
@@ -73,17 +76,79 @@ class Lorentz(BaseOscillator):
 
         return self.SW
 
+    def partialSpectralWeight(self, low, high):
+        """Returns the spectral weight between the energies low and high (eV).
+
+        E epsilon(E) = -A B E0 E/((E - r1)(E - r2)), with the poles
+        r = (-iB +- sqrt(4 E0^2 - B^2))/2 in the lower half plane, so that
+        the logarithms of its primitive are continuous along the real axis.
+        """
+
+        A, B, E0 = self.amplitude, self.width, self.position
+        if A*B*E0 == 0.0:
+            return swFactor*0.0*(np.asarray(high, dtype=float) - low)
+
+        _omega = np.emath.sqrt(4.0*E0*E0 - B*B)
+
+        def _primitive(energy):
+            energy = np.asarray(energy, dtype=float)
+            if abs(_omega) < 1e-6*B:
+                # Critical damping: double pole
+                r = -0.5j*B
+                return (-A*B*E0*(np.log(energy - r) - r/(energy - r))).imag
+            r1, r2 = 0.5*(-1.j*B + _omega), 0.5*(-1.j*B - _omega)
+            return (-A*B*E0/(r1 - r2)*(r1*np.log(energy - r1) - r2*np.log(energy - r2))).imag
+
+        return swFactor*(_primitive(high) - _primitive(low))
+
     def dielectricFunction(self, window):
         """Returns the complex dielectric function at the specified window.
 
         input
         =====
 
-        window: Specified (range) of values to return.
+        window: Specified (range) of values to return, or EnergyGrid.
+        """
+
+        grid = asGrid(window)
+        _den = math.pow(self.position, 2) - grid.E2 - 1.j * grid.E * self.width
+
+        return self.amplitude * np.divide(self.width * self.position, _den)
+
+    def jacobian(self, window):
+        """Returns the analytic derivatives of the dielectric function with
+        respect to (amplitude, width, position) at the specified window."""
+
+        grid = asGrid(window)
+        window = grid.E
+        _den = math.pow(self.position, 2) - grid.E2 - 1.j * window * self.width
+        _eps = self.amplitude * self.width * self.position / _den
+
+        _jac = np.empty((self.nparams,) + window.shape, dtype=complex)
+        _jac[0] = self.width * self.position / _den
+        _jac[1] = self.amplitude * self.position / _den + 1.j * window * _eps / _den
+        _jac[2] = self.amplitude * self.width / _den - 2.0 * self.position * _eps / _den
+
+        return _jac
+
+    @classmethod
+    def batchDielectricFunction(cls, window, params, out):
+        """Adds the dielectric function of several Lorentz oscillators to out.
+
+        See BaseOscillator.batchDielectricFunction.
         """
 
-        _den = math.pow(self.position, 2) - np.power(window, 2) - 1.j * window * self.width
+        grid = asGrid(window)
+        E = grid.E
+        A = params[..., :, 0, np.newaxis]
+        B = params[..., :, 1, np.newaxis]
+        Ec = params[..., :, 2, np.newaxis]
+
+        _den = np.empty(np.broadcast(E, A).shape, dtype=complex)
+        _den.real = Ec * Ec - grid.E2
+        _den.imag = -B * E
+        np.divide(A * B * Ec, _den, out=_den)
 
-        self.dfunc = self.amplitude * np.divide(self.width * self.position, _den)
+        out += _den.sum(axis=-2)
 
-        return self.dfunc
\ No newline at end of file
+        return out
\ No newline at end of file
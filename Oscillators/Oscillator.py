@@ -3,22 +3,31 @@
 Basic attributes and methods shared by all oscillators.
 """
 import abc
+import collections
+import re
+import weakref
 from numbers import Number
 
+import numpy as np
+
 #  import scipy.constants as constants
 from scipy.constants import physical_constants
 
+from profiling import profiled
+from relations import asGrid, swFactor
+
 hbar = physical_constants['natural unit of action in eV s'][0]
 
 
-def parameter(name, default=0.0):
-    """Checks if the input provided for the attribute is valid."""
+def parameter(name, default=0.0, index=0):
+    """Checks if the input provided for the attribute is valid.
 
-    storage_name = '_' + name
+    The value is stored at position index of the parameter array of the
+    oscillator, which is the order of params."""
 
     @property
     def attribute(self):
-        return getattr(self, storage_name)
+        return float(self._values[index])
 
     @attribute.setter
     def attribute(self, value):
@@ -32,26 +41,160 @@ def parameter(name, default=0.0):
                 raise TypeError
             if value < 0.0:  # no value should be below 0?
                 raise ValueError
-            setattr(self, storage_name, float(value))  # casting to float
+            self._values[index] = float(value)  # casting to float
         except:
             print("The parameter '{}' should be a positive number. Value set at {}".format(name, default))
-            setattr(self, storage_name, default)
+            self._values[index] = default
 
     return attribute
 
 
+# Oscillator classes by name, filled as they are defined
+registry = {}
+
+# Former json format: the repr of the oscillator, e.g.
+# "Lorentz(amplitude = 1.000000, width = 0.200000, position = 1.500000)"
+_reprCall = re.compile(r"^\s*(\w+)\s*\((.*)\)\s*$", re.S)
+_reprArgument = re.compile(r"^\s*([A-Za-z_]\w*)\s*=\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|nan|inf)\s*$")
+
+
+def oscillatorType(name):
+    """Oscillator class registered as name."""
+    try:
+        return registry[name]
+    except KeyError:
+        raise ValueError("Unknown oscillator type '{}'".format(name)) from None
+
+
+def fromDict(data):
+    """Builds an oscillator from its structured representation (see
+    BaseOscillator.toDict). Falls back to the representation string if
+    there are no parameters."""
+
+    if 'params' not in data:
+        return fromRepr(data['repr'])
+
+    oscillator = oscillatorType(data['type'])()
+    params = data['params']
+    if len(params) != oscillator.nparams:
+        raise ValueError("{} takes {} parameters, {} given".format(data['type'], oscillator.nparams, len(params)))
+    oscillator.params = params
+
+    return oscillator
+
+
+def fromRepr(text):
+    """Builds an oscillator from its repr, as stored by the former json
+    format, without evaluating it: only calls of a registered oscillator
+    with numeric keyword arguments are accepted."""
+
+    call = _reprCall.match(text)
+    if call is None:
+        raise ValueError("Not an oscillator representation: {!r}".format(text))
+
+    kwargs = {}
+    arguments = call.group(2)
+    for argument in arguments.split(',') if arguments.strip() else ():
+        match = _reprArgument.match(argument)
+        if match is None:
+            raise ValueError("Invalid argument {!r} in {!r}".format(argument, text))
+        kwargs[match.group(1)] = float(match.group(2))
+
+    try:
+        return oscillatorType(call.group(1))(**kwargs)
+    except TypeError as error:
+        raise ValueError("Invalid arguments in {!r}: {}".format(text, error)) from None
+
+
+def gridKey(window):
+    """Hashable key identifying the values of an energy grid, equal only
+    for equal grids (see EnergyGrid.key)."""
+    return asGrid(window).key
+
+
 class BaseOscillator(metaclass=abc.ABCMeta):
-    """Base class for all oscillator implementations."""
+    """Base class for all oscillator implementations.
+
+    The parameters live in a float64 array of length nparams. When the
+    oscillator is part of an OpticalModel, that array is a view into the
+    contiguous parameter vector of the model.
+
+    Lineshapes declare empty __slots__ to keep instances compact; the
+    other attributes are listed here."""
+
+    __slots__ = ('_values', '_owner', 'dfunc', 'SW')
+
+    nparams = 0
+
+    # Number of dielectric functions memoized by cachedDielectricFunction
+    cacheSize = 4
+
+    def __new__(cls, *args, **kwargs):
+        self = super().__new__(cls)
+        # Allocated here so that parameters can be set before __init__ runs
+        self._values = np.zeros(cls.nparams)
+        self._owner = None
+        # Quick lookup for calculated dielectric function values: LRU cache
+        # keyed on (parameters, grid key)
+        self.dfunc = collections.OrderedDict()
+        return self
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        registry[cls.__name__] = cls
+
+        # Timing of every lineshape, see profiling
+        for name in ('dielectricFunction', 'jacobian'):
+            if name in vars(cls):
+                setattr(cls, name, profiled()(vars(cls)[name]))
+        if 'batchDielectricFunction' in vars(cls):
+            cls.batchDielectricFunction = classmethod(profiled()(vars(cls)['batchDielectricFunction'].__func__))
 
     def __init__(self, *args, **kwargs):
-        # Attribute for quick lookup for calculated dielectric function values
-        self.dfunc = None
         # Attribute for quick lookup for calculated spectral weight (SW) value
         self.SW = None
 
+    def toDict(self):
+        """Structured representation of the oscillator, as stored in json
+        files: type name, parameter array and representation."""
+        return {'type': type(self).__name__,
+                'params': [float(value) for value in self._values],
+                'repr': repr(self)}
+
     def params(self):
         pass
 
+    def setParamsUnchecked(self, values):
+        """Trusted bulk update of the parameters, skipping the validation
+        done by the public setters. Meant for optimizers."""
+        self._values[:] = values
+
+    def __getstate__(self):
+        state = dict(getattr(self, '__dict__', {}))
+        for name in BaseOscillator.__slots__:
+            state[name] = getattr(self, name, None)
+        state['_values'] = np.array(self._values)
+        state['_owner'] = None
+        state['dfunc'] = collections.OrderedDict()
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def _bind(self, storage, owner):
+        """Moves the parameters into storage, a view into the parameter
+        vector of owner. The model previously holding them is told to
+        rebuild its own vector."""
+
+        storage[:] = self._values
+        self._values = storage
+
+        previous = self._owner() if self._owner is not None else None
+        if previous is not None and previous is not owner:
+            previous._unbind()
+        self._owner = weakref.ref(owner)
+
     @abc.abstractmethod
     def __str__(self):
         pass
@@ -65,6 +208,94 @@ class BaseOscillator(metaclass=abc.ABCMeta):
         """Computes and returns the complex dielectric function of the oscillator."""
         pass
 
+    @classmethod
+    def batchDielectricFunction(cls, window, params, out):
+        """Adds the dielectric function of a family of oscillators to out.
+
+        Optional vectorized kernel: a lineshape implementing it is evaluated
+        for all its oscillators in a single broadcasted pass instead of one
+        call per oscillator. Only kernels defined by the class itself are
+        used, so subclasses changing the lineshape fall back to
+        dielectricFunction.
+
+        input
+        =====
+
+        window: 1-D array of energies (eV).
+        params: array of shape (..., oscillators, nparams), ordered as params.
+        out: complex array of shape (..., len(window)), updated in place.
+        """
+        raise NotImplementedError
+
+    def cachedDielectricFunction(self, window, key=None):
+        """Returns the dielectric function at window, memoized on the current
+        parameters and the grid. The least recently used values are evicted
+        beyond cacheSize entries. The returned array is read-only.
+
+        key: gridKey(window), if already known.
+        """
+
+        if key is None:
+            key = gridKey(window)
+        key = (tuple(self._values), key)
+
+        try:
+            self.dfunc.move_to_end(key)
+            return self.dfunc[key]
+        except KeyError:
+            pass
+
+        _dfunc = np.asarray(self.dielectricFunction(window))
+        _dfunc.flags.writeable = False
+
+        self.dfunc[key] = _dfunc
+        while len(self.dfunc) > self.cacheSize:
+            self.dfunc.popitem(last=False)
+
+        return _dfunc
+
+    def clearCache(self):
+        """Empties the memoized dielectric functions."""
+        self.dfunc.clear()
+
+    def jacobian(self, window):
+        """Returns the derivatives of the dielectric function with respect to
+        each parameter, as an array of shape (nparams, len(window)) ordered
+        as params.
+
+        Numerical (central differences) by default; lineshapes override it
+        with analytic derivatives.
+        """
+        return self._numericalJacobian(self.dielectricFunction, window)
+
+    def _numericalJacobian(self, function, window):
+        """Central differences of function(window) with respect to the
+        parameters, stepping forward only where the parameter sits at the
+        lower bound (0)."""
+
+        # The grid quantities are reused by every evaluation
+        window = asGrid(window)
+        p0 = list(self.params)
+        _jac = np.empty((len(p0),) + window.shape, dtype=complex)
+
+        try:
+            for i, value in enumerate(p0):
+                step = 1e-6 * max(abs(value), 1.0)
+                low, high = max(value - step, 0.0), value + step
+
+                p = list(p0)
+                p[i] = high
+                self.params = p
+                _jac[i] = function(window)
+                p[i] = low
+                self.params = p
+                _jac[i] -= function(window)
+                _jac[i] /= high - low
+        finally:
+            self.params = p0
+
+        return _jac
+
     # @abc.abstractmethod
     # def opticalConductivity(self, window):
     #     """Computes and returns the optical conductivity of the oscillator.
@@ -78,6 +309,21 @@ class BaseOscillator(metaclass=abc.ABCMeta):
         """Calculates and returns the area of the oscillator analytically or numerically."""
         pass
 
+    def partialSpectralWeight(self, low, high):
+        """Returns the spectral weight of the oscillator between the energies
+        low and high (eV), swFactor * int_low^high E epsilon_2(E) dE, whose
+        value over (0, inf) is spectralWeight.
+
+        Lineshapes override it with a closed form; NotImplementedError means
+        that the weight has to be integrated numerically.
+
+        input
+        =====
+
+        low, high: finite limits of integration (eV), numbers or arrays.
+        """
+        raise NotImplementedError
+
     # @abc.abstractmethod
     # def plasmaFrequency(self):
     #     """Calculates the square of plasma frequency in eV^2 of
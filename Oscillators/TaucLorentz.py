@@ -3,10 +3,11 @@
 Tauc-Lorentz family of oscillators.
 """
 from Oscillators.Oscillator import BaseOscillator, parameter, hbar
+from Oscillators.Kernels import taucDielectricFunction, taucBatchDielectricFunction
+from relations import asGrid
 
 import numpy as np
 import scipy.constants as constants
-import cmath
 #from math import log, pow, sqrt
 
 #import scipy.special
@@ -26,14 +27,16 @@ class Tauc(BaseOscillator):
 
     """
 
+    __slots__ = ()
+
     nparams = 4
 
     representation = "standard"
 
-    amplitude = parameter('amplitude', 0.0)
-    width = parameter('width', 0.0)
-    position = parameter('position', 0.0)
-    gap = parameter('gap', 0.0)
+    amplitude = parameter('amplitude', 0.0, 0)
+    width = parameter('width', 0.0, 1)
+    position = parameter('position', 0.0, 2)
+    gap = parameter('gap', 0.0, 3)
 
     def __init__(self, amplitude=0.0, width=0.0, position=0.0, gap=0.0):
         """Defines a Tauc-Lorentz lineshape as described in
@@ -67,43 +70,58 @@ class Tauc(BaseOscillator):
         input
         =====
 
-        energy: Specified (range) of values to return.
+        energy: Specified (range) of values to return, or EnergyGrid.
         """
-        return _compute_tauc_real(energy)+1.0j*_compute_tauc_imaginary(energy)
-        
+        grid = asGrid(energy)
+        _dfunc = np.zeros(grid.shape, dtype=complex)
+        taucDielectricFunction(grid.E.ravel(), grid.E2.ravel(), _dfunc.reshape(-1), *self._values)
+        return _dfunc
+
     def _compute_tauc_real(self, energy):
-        E0 = self.position
-        A = self.amplitude
-        C = self.width #gamma
-        Eg = self.gap
-        x = energy
-        
-        epsinf = 0.0
-	alfa = sqrt(4.0*np.power(E0,2) - np.power(C,2))
-	g = cmath.sqrt(np.power(E0,2) - np.power(C,2) / 2.0)
-	aln = (np.power(Eg,2) - np.power(E0,2))*np.power(x,2) + np.power(Eg,2) * np.power(C,2) - np.power(E0,2) * (np.power(E0,2) + 3.0 * np.power(Eg,2))
-	aatan = (np.power(x,2) - np.power(E0,2))*(np.power(E0,2) + np.power(Eg,2)) + np.power(Eg,2)*np.power(C,2)
-	csi4 = np.power( np.power(x,2) - np.power(g,2), 2) + np.power(alfa,2) * np.power(C,2) / 4.0
-	tauc1 = epsinf + \
-			0.5 * A * C / np.pi / csi4 * aln / alfa / E0 * np.log( (np.power(E0,2) + np.power(Eg,2) + alfa*Eg) / (np.power(E0,2) + np.power(Eg,2) - alfa*Eg) ) - \
-			A / np.pi / csi4 * aatan / E0 * ( np.pi - np.arctan( (2.0*Eg + alfa)/C ) + np.arctan( (-2.0*Eg+alfa) / C ) ) + \
-			2.0 * A * E0 / np.pi / csi4 / alfa * Eg * ( np.power(x,2) - np.power(g,2) ) * ( np.pi + 2.0 * np.arctan( 2.0 * (np.power(g,2) - np.power(Eg,2)) / alfa / C ) ) -\
-			A * E0 * C / np.pi / csi4 * np.divide( np.power(x,2) + np.power(Eg,2) , x) * np.log( abs(x-Eg) / (x+Eg) ) +\
-			2.0 * A * E0 * C / np.pi / csi4 * Eg * np.log( abs(x-Eg) * (x+Eg) / sqrt( np.power(np.power(E0,2)-np.power(Eg,2),2) + np.power(Eg,2)*np.power(C,2) ) )
-			
-	return tauc1
-        
-    
+        return self.dielectricFunction(energy).real
+
     def _compute_tauc_imaginary(self, energy):
+        return self.dielectricFunction(energy).imag
+
+    def jacobian(self, energy):
+        """Returns the derivatives of the dielectric function with respect to
+        (amplitude, width, position, gap) at the specified energy.
+
+        The imaginary part is differentiated analytically; the real part is
+        differentiated numerically, its closed form being too involved.
+        """
+
         E0 = self.position
         A = self.amplitude
-        C = self.width #gamma
+        C = self.width
         Eg = self.gap
-        x = energy
-        
-        im = 0.5*(np.sign(x-Eg)+1.0) * A * E0 * C * np.divide( np.power(x-Eg,2), ( np.power( np.power(x,2) - np.power(E0,2), 2) + np.power(C,2) * np.power(x,2) ) * x )
-        
-        return im
+        grid = asGrid(energy)
+        x = grid.E
+        x2 = grid.E2
+
+        _step = 0.5*(np.sign(x-Eg)+1.0)
+        _den = np.power( x2 - np.power(E0,2), 2) + np.power(C,2) * x2
+        _base = _step * np.divide( np.power(x-Eg,2), _den * x )
+        _im = A * E0 * C * _base
+
+        _jac = self._numericalJacobian(self._compute_tauc_real, grid)
+        _jac.imag[0] = E0 * C * _base
+        _jac.imag[1] = A * E0 * _base - _im * 2.0 * C * x2 / _den
+        _jac.imag[2] = A * C * _base + _im * 4.0 * E0 * (x2 - np.power(E0,2)) / _den
+        _jac.imag[3] = -2.0 * A * E0 * C * _step * np.divide( x-Eg, _den * x )
+
+        return _jac
+
+    @classmethod
+    def batchDielectricFunction(cls, window, params, out):
+        """Adds the dielectric function of several Tauc-Lorentz oscillators
+        to out.
+
+        See BaseOscillator.batchDielectricFunction.
+        """
+
+        grid = asGrid(window)
+        return taucBatchDielectricFunction(grid.E, grid.E2, params, out)
 
     def spectralWeight(self):
         """Returns the spectral weight of the oscillator."""
@@ -169,8 +187,10 @@ class Tauc_genosc(Tauc):
         input
         =====
 
-        energy: Specified (range) of values to return.
+        energy: Specified (range) of values to return, or EnergyGrid.
         """
+        energy = asGrid(energy).E
+
         def _tauc_lorentz():
             """Compute Tauc-Lorentz. It seems that it it still incomplete.
 
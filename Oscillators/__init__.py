@@ -1,13 +1,14 @@
 # -*- coding: utf-8 -*-
 
-from Oscillators.Oscillator import BaseOscillator
+from Oscillators.Oscillator import BaseOscillator, registry, oscillatorType, fromDict, fromRepr
 
 from Oscillators.Drude import Drude
 from Oscillators.Lorentz import Lorentz
 from Oscillators.Gauss import Gauss
+from Oscillators.TaucLorentz import Tauc
 
 def list():
     for sc in BaseOscillator.__subclasses__():
         print(sc.__name__)
 
-__all__ = ["Drude", "Lorentz", "Gauss"]
+__all__ = ["Drude", "Lorentz", "Gauss", "Tauc"]
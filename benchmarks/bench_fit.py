@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+End to end benchmarks of OpticalSystem.fit.
+"""
+import os
+
+import numpy as np
+
+import Datasets
+import OpticalSystem
+import Oscillators
+
+examples = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Examples")
+
+
+class ExampleFitSuite:
+    """A phonon fitted to the reflectivity and dielectric function examples."""
+
+    params = [['trf', 'lm']]
+    param_names = ['method']
+
+    def setup(self, method):
+        self.system = OpticalSystem.OpticalSystem()
+        self.system.datasets.extend([
+            Datasets.ReflectivityDataset(os.path.join(examples, "Reflectivity-Simple-wavenumber.dat"), unit='cm-1'),
+            Datasets.DielectricFunctionDataset(inputFile=os.path.join(examples, "DielectricFunction-Simple-wavenumber.dat"),
+                                               unit='cm-1')])
+        self.model = self.system.createModel("Phonon")
+        self.model.add(Oscillators.Lorentz())
+        self.model.einf = 2.6
+        self.start = [15, 1e-3, 0.012]
+
+    def time_fit(self, method):
+        self.model.params = self.start
+        self.system.fit(self.model, verbose=False, method=method)
+
+
+class SyntheticFitSuite:
+    """Drude, Lorentz and Gauss fitted to their own reflectivity and
+    dielectric function."""
+
+    params = [['trf', 'lm'], [300, 3000]]
+    param_names = ['method', 'points']
+
+    def setup(self, method, points):
+        self.system = OpticalSystem.OpticalSystem()
+        window = np.linspace(0.05, 8, points)
+
+        self.model = self.system.createModel("Synthetic")
+        self.model.add([Oscillators.Drude(), Oscillators.Lorentz(), Oscillators.Gauss()])
+        self.model.params = [2.0, 0.3, 1.0, 0.4, 2.0, 0.5, 1.0, 4.0]
+        epsilon = self.model.dielectricFunction(window)
+
+        self.system.datasets.extend([
+            Datasets.ReflectivityDataset(x=window, y=np.abs((np.sqrt(epsilon) - 1)/(np.sqrt(epsilon) + 1))**2),
+            Datasets.DielectricFunctionDataset(window, epsilon)])
+        self.start = [1.5, 0.4, 1.2, 0.3, 2.2, 0.4, 1.2, 3.8]
+
+    def time_fit(self, method, points):
+        self.model.params = self.start
+        self.system.fit(self.model, verbose=False, method=method)
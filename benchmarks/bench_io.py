@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of loading datasets from text and binary files.
+"""
+import os
+import tempfile
+
+import numpy as np
+
+import Datasets
+
+examples = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Examples")
+
+
+class LoadSuite:
+
+    def setup(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.example = os.path.join(examples, "DielectricFunction-Simple-wavenumber.dat")
+
+        rng = np.random.default_rng(0)
+        x = np.linspace(100, 40000, 200000)
+        self.large = os.path.join(self.directory.name, "large.dat")
+        np.savetxt(self.large, np.column_stack([x, rng.uniform(0, 1, x.size)]), header="cm-1 R")
+        self.binary = Datasets.convertToBinary(self.large, os.path.join(self.directory.name, "large.npy"), unit='cm-1')
+
+    def teardown(self):
+        self.directory.cleanup()
+
+    def time_loadRaw_example(self):
+        Datasets.DielectricFunctionDataset(inputFile=self.example, unit='cm-1')
+
+    def time_loadRaw_large(self):
+        Datasets.ReflectivityDataset(self.large, unit='cm-1')
+
+    def time_loadBinary_large(self):
+        Datasets.ReflectivityDataset(self.binary).y.sum()
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the Kramers-Kronig transforms.
+"""
+import numpy as np
+
+from KramersKronig import KramersKronig
+
+
+class KramersKronigSuite:
+    params = [[1000, 4000]]
+    param_names = ['points']
+
+    def setup(self, points):
+        self.nu = np.linspace(0, 30, points)
+        self.epsilon = 1 + 2/(1 - self.nu**2 - 0.3j*self.nu) + 1/(9 - self.nu**2 - 0.5j*self.nu)
+        n = np.sqrt(self.epsilon)
+        self.reflectivity = np.abs((n - 1)/(n + 1))**2
+
+    def time_real2imag(self, points):
+        KramersKronig.real2imag(self.nu, self.epsilon.real)
+
+    def time_imag2real(self, points):
+        KramersKronig.imag2real(self.nu, self.epsilon.imag)
+
+    def time_mod2phase(self, points):
+        KramersKronig.mod2phase(self.nu, self.reflectivity)
+
+    def time_real2imag_fft(self, points):
+        KramersKronig.real2imag_fft(self.nu, self.epsilon.real)
+
+    def time_mod2phase_fft(self, points):
+        KramersKronig.mod2phase_fft(self.nu, self.reflectivity)
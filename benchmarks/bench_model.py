@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of OpticalModel, against the number of oscillators.
+"""
+import numpy as np
+
+import Oscillators
+import OpticalModel
+
+
+def model(oscillators, kinds=(Oscillators.Lorentz, Oscillators.Gauss, Oscillators.Tauc, Oscillators.Drude)):
+    """Model of oscillators of the given kinds in turn, spread over 0.5-8 eV."""
+
+    _model = OpticalModel.OpticalModel("Benchmark")
+    for i, position in enumerate(np.linspace(0.5, 8, oscillators)):
+        kind = kinds[i % len(kinds)]
+        if kind is Oscillators.Drude:
+            _model.add(kind(10, 0.1))
+        elif kind is Oscillators.Tauc:
+            _model.add(kind(100, 1, position, position/2))
+        else:
+            _model.add(kind(1, 0.3, position))
+    _model.einf = 1.5
+    return _model
+
+
+class ModelSuite:
+    params = [[1, 8, 64], [1000, 100000]]
+    param_names = ['oscillators', 'points']
+
+    def setup(self, oscillators, points):
+        self.model = model(oscillators)
+        self.window = np.linspace(0.013, 10, points)
+
+    def time_dielectricFunction(self, oscillators, points):
+        self.model.dielectricFunction(self.window)
+
+    def time_jacobian(self, oscillators, points):
+        self.model.jacobian(self.window)
+
+    def time_reflectivity(self, oscillators, points):
+        self.model.reflectivity(self.window)
+
+
+class SeriesSuite:
+    """A temperature series: many models sharing their structure."""
+
+    params = [[10, 100]]
+    param_names = ['models']
+
+    def setup(self, models):
+        rng = np.random.default_rng(0)
+        self.models = [model(8) for i in range(models)]
+        for _model in self.models:
+            _model.params = _model.params * rng.uniform(0.9, 1.1, len(_model.params))
+        self.window = np.linspace(0.013, 10, 1000)
+
+    def time_dielectricFunctions(self, models):
+        OpticalModel.dielectricFunctions(self.models, self.window)
+
+    def time_loop(self, models):
+        for _model in self.models:
+            _model.dielectricFunction(self.window)
+
+
+class SpectralWeightSuite:
+    params = [[None, (0, 4), (0, 20)]]
+    param_names = ['limits']
+
+    def setup(self, limits):
+        self.model = model(8, kinds=(Oscillators.Lorentz, Oscillators.Gauss))
+
+    def time_spectralWeight(self, limits):
+        self.model.spectralWeight(limits)
+
+
+class PartialSpectralWeightSuite:
+    params = [['analytic', 'adaptive', 'romberg'], [(0.05, 20), (0.05, 100)]]
+    param_names = ['method', 'limits']
+
+    def setup(self, method, limits):
+        self.model = model(8)
+
+    def time_spectralWeight(self, method, limits):
+        self.model.spectralWeight(limits, method)
+
+
+class CumulativeSpectralWeightSuite:
+    params = [['analytic', 'trapezoid', 'simpson'], [1000, 100000]]
+    param_names = ['method', 'points']
+
+    def setup(self, method, points):
+        self.model = model(8)
+        self.window = np.linspace(0, 20, points)
+
+    def time_cumulativeSpectralWeight(self, method, points):
+        self.model.cumulativeSpectralWeight(self.window, method)
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the transfer matrices of Multilayer, against the number of
+layers and angles.
+"""
+import numpy as np
+
+import Multilayer
+from bench_model import model
+
+
+class MultilayerSuite:
+    params = [[1, 5], [1, 20], [1000, 100000]]
+    param_names = ['layers', 'angles', 'points']
+
+    def setup(self, layers, angles, points):
+        self.stack = Multilayer.Multilayer(model(8), [(model(4), 20.0*(i + 1)) for i in range(layers)])
+        self.window = np.linspace(0.05, 10, points)
+        self.theta = np.radians(np.linspace(0, 80, angles))
+
+    def time_coefficients(self, layers, angles, points):
+        self.stack.coefficients(self.window, self.theta, ('s', 'p'))
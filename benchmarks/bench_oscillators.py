@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the lineshapes, across grid sizes.
+"""
+import numpy as np
+
+import Oscillators
+from relations import EnergyGrid
+
+# Typical oscillators of a fit, by lineshape
+oscillators = {
+    'Drude': lambda: Oscillators.Drude(10, 0.1),
+    'Lorentz': lambda: Oscillators.Lorentz(1, 0.3, 2),
+    'Gauss': lambda: Oscillators.Gauss(1, 0.5, 3),
+    'Tauc': lambda: Oscillators.Tauc(100, 1, 3, 1.5),
+}
+
+
+class OscillatorSuite:
+    params = [sorted(oscillators), [1000, 100000]]
+    param_names = ['oscillator', 'points']
+
+    def setup(self, name, points):
+        self.oscillator = oscillators[name]()
+        self.window = np.linspace(0.013, 10, points)
+        # A grid already used once, as in a fit
+        self.grid = EnergyGrid(self.window)
+        self.oscillator.dielectricFunction(self.grid)
+
+    def time_dielectricFunction(self, name, points):
+        self.oscillator.dielectricFunction(self.window)
+
+    def time_dielectricFunction_grid(self, name, points):
+        self.oscillator.dielectricFunction(self.grid)
+
+    def time_jacobian(self, name, points):
+        self.oscillator.jacobian(self.grid)
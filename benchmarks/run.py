@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Runs the benchmarks and compares them with the stored baseline.
+
+The benchmarks follow the conventions of asv (airspeed velocity), so that
+they can be moved to it as they are: classes of the bench_*.py modules,
+whose time_* methods are timed for every combination of the class params
+(named by param_names), after setup and before teardown, both called with
+the parameters. A setup raising NotImplementedError skips the combination.
+
+Usage:
+
+    python benchmarks/run.py             compare with benchmarks/baseline.json
+    python benchmarks/run.py -k Tauc     only the benchmarks matching a regex
+    python benchmarks/run.py --save      store the results as the baseline
+
+The run fails (exit status 1) if a benchmark is slower than its baseline by
+more than the threshold factor. Baselines are only meaningful on the machine
+they were stored on: store a new one after changing machine.
+"""
+import argparse
+import importlib
+import inspect
+import itertools
+import json
+import os
+import platform
+import re
+import sys
+import timeit
+import warnings
+
+import numpy as np
+
+directory = os.path.dirname(os.path.abspath(__file__))
+baselineFile = os.path.join(directory, "baseline.json")
+
+# Slower than the baseline by more than this factor is a regression
+threshold = 1.5
+
+# Minimum duration of a timing, in seconds, and timings per benchmark
+duration = 0.05
+repeat = 5
+
+
+def _settleAllocator():
+    """Frees a 32 MB block before timing anything.
+
+    glibc's malloc raises its mmap threshold to the size of the freed
+    mmapped blocks (up to 32 MB). Until then, every large temporary is
+    mapped and page faulted anew, which made a benchmark up to twice as slow
+    depending on which ones ran before it.
+    """
+    block = np.ones(2**22 - 2**10)
+    del block
+
+
+def _combinations(cls):
+    """Combinations of the parameters of a benchmark class, as asv."""
+
+    params = getattr(cls, 'params', None)
+    if params is None:
+        return [()]
+    if not params or not isinstance(params[0], (list, tuple)):
+        # A single list of values
+        params = [params]
+    return list(itertools.product(*params))
+
+
+def discover(pattern=None):
+    """Benchmarks of the bench_*.py modules, as (name, class, method,
+    parameters) sorted by module."""
+
+    benchmarks = []
+    for filename in sorted(os.listdir(directory)):
+        if not (filename.startswith("bench_") and filename.endswith(".py")):
+            continue
+
+        module = importlib.import_module(filename[:-3])
+        for className, cls in inspect.getmembers(module, inspect.isclass):
+            if cls.__module__ != module.__name__ or className.startswith('_'):
+                continue
+
+            for methodName in sorted(name for name in vars(cls) if name.startswith("time_")):
+                for params in _combinations(cls):
+                    name = "{}.{}.{}".format(module.__name__, className, methodName)
+                    if params:
+                        name += "({})".format(", ".join(repr(p) for p in params))
+                    if pattern is None or re.search(pattern, name):
+                        benchmarks.append((name, cls, methodName, params))
+
+    return benchmarks
+
+
+def measure(cls, methodName, params):
+    """Best time of a call of the benchmark, in seconds. None if skipped."""
+
+    instance = cls()
+    if hasattr(instance, 'setup'):
+        try:
+            instance.setup(*params)
+        except NotImplementedError:
+            return None
+
+    try:
+        method = getattr(instance, methodName)
+        timer = timeit.Timer(lambda: method(*params))
+
+        # Calls per timing, so that a timing takes at least duration
+        number = 1
+        while True:
+            elapsed = timer.timeit(number)
+            if elapsed >= duration or number >= 10**6:
+                break
+            number *= max(2, min(10, int(duration/max(elapsed, 1e-9))))
+
+        return min([elapsed] + timer.repeat(repeat - 1, number))/number
+    finally:
+        if hasattr(instance, 'teardown'):
+            instance.teardown(*params)
+
+
+def _format(seconds):
+    if seconds is None:
+        return "-"
+    for unit, scale in (("s", 1.0), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return "{:.3g} {}".format(seconds/scale, unit)
+    return "{:.3g} ns".format(seconds/1e-9)
+
+
+def loadBaseline(filename=baselineFile):
+    """Stored results, by benchmark name (empty if there are none)."""
+
+    if not os.path.exists(filename):
+        return {}
+    with open(filename) as f:
+        return json.load(f)['results']
+
+
+def saveBaseline(results, filename=baselineFile):
+    """Stores results as the baseline, keeping the benchmarks not run."""
+
+    stored = loadBaseline(filename)
+    stored.update(results)
+
+    with open(filename, 'w') as f:
+        json.dump({'machine': platform.machine(),
+                   'processor': platform.processor(),
+                   'python': platform.python_version(),
+                   'numpy': np.__version__,
+                   'results': stored}, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def run(pattern=None, baseline=None, factor=threshold, stream=sys.stdout):
+    """
+    Runs the benchmarks matching pattern, printing each one with its ratio
+    to the baseline as it completes.
+
+    Returns:
+
+        the results by benchmark name and the names of the regressions.
+    """
+
+    results, regressions = {}, []
+    baseline = baseline or {}
+    _settleAllocator()
+
+    for name, cls, methodName, params in discover(pattern):
+        with warnings.catch_warnings(), np.errstate(all='ignore'):
+            warnings.simplefilter('ignore')
+            seconds = measure(cls, methodName, params)
+        if seconds is None:
+            print("{:<70} skipped".format(name), file=stream)
+            continue
+
+        results[name] = seconds
+        reference = baseline.get(name)
+        ratio = seconds/reference if reference else None
+
+        mark = ""
+        if ratio is not None and ratio > factor:
+            mark = "  REGRESSION"
+            regressions.append(name)
+        print("{:<70} {:>10} {:>10} {:>7}{}".format(name, _format(seconds), _format(reference),
+              "-" if ratio is None else "{:.2f}".format(ratio), mark), file=stream, flush=True)
+
+    return results, regressions
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Runs the benchmarks and compares them with the baseline.")
+    parser.add_argument('-k', dest='pattern', help="only the benchmarks matching this regular expression")
+    parser.add_argument('--save', action='store_true', help="store the results as the baseline")
+    parser.add_argument('--baseline', default=baselineFile, help="baseline file (default: %(default)s)")
+    parser.add_argument('--threshold', type=float, default=threshold,
+                        help="slowdown factor reported as a regression (default: %(default)s)")
+    arguments = parser.parse_args(arguments)
+
+    print("{:<70} {:>10} {:>10} {:>7}".format("benchmark", "time", "baseline", "ratio"))
+    results, regressions = run(arguments.pattern, loadBaseline(arguments.baseline), arguments.threshold)
+
+    if arguments.save:
+        saveBaseline(results, arguments.baseline)
+        print("Stored {} results in {}".format(len(results), arguments.baseline))
+        return 0
+
+    if regressions:
+        print("{} regression(s) beyond a factor {}".format(len(regressions), arguments.threshold))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    # The modules of the package are at the root of the repository
+    sys.path.insert(0, os.path.dirname(directory))
+    sys.path.insert(0, directory)
+    sys.exit(main())
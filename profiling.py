@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in timing of the evaluations of oscillators, models, Kramers-Kronig
+transforms, dataset conversions and fit iterations.
+
+The instrumented functions (decorated with profiled) record their calls
+in the active Profile, if any. Nothing is recorded, and the cost is a
+single check per call, unless profiling is enabled:
+
+    with profiling.profile(trace=True) as profile:
+        system.fit(model, method="trf")
+
+    print(profile.summary())
+    profile.saveTrace("fit.json")  # chrome://tracing or ui.perfetto.dev
+
+or globally, with enable() / disable() and the default Profile registry.
+"""
+import collections
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Record:
+    """Statistics of the calls of an instrumented function. total includes
+    the instrumented functions called from it, own does not."""
+
+    __slots__ = ('name', 'calls', 'total', 'own', 'points')
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.total = 0.0
+        self.own = 0.0
+        self.points = 0
+
+    def __repr__(self):
+        return "Record({!r}, calls = {}, total = {:.6f} s, own = {:.6f} s, points = {})".format(
+            self.name, self.calls, self.total, self.own, self.points)
+
+
+class Profile:
+    """Records of the instrumented calls, by name, and optionally a trace
+    of every call (Chrome trace event format)."""
+
+    def __init__(self, trace=False):
+        self.trace = trace
+        self.records = collections.OrderedDict()
+        self.events = []
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    def __getitem__(self, name):
+        return self.records[name]
+
+    def __contains__(self, name):
+        return name in self.records
+
+    def reset(self):
+        with self._lock:
+            self.records.clear()
+            self.events.clear()
+            self._start = time.perf_counter()
+
+    def add(self, name, start, elapsed, children, points):
+        """Accounts a call of name that started at start (perf_counter) and
+        took elapsed seconds, children of them in instrumented calls."""
+
+        with self._lock:
+            try:
+                record = self.records[name]
+            except KeyError:
+                record = self.records[name] = Record(name)
+            record.calls += 1
+            record.total += elapsed
+            record.own += elapsed - children
+            record.points += points
+
+            if self.trace:
+                self.events.append({'name': name, 'ph': 'X', 'pid': os.getpid(),
+                                    'tid': threading.get_ident(),
+                                    'ts': (start - self._start)*1e6, 'dur': elapsed*1e6,
+                                    'args': {'points': points}})
+
+    def summary(self, sort='total'):
+        """Table of the records, sorted by decreasing sort ('total', 'own',
+        'calls' or 'points')."""
+
+        records = sorted(self.records.values(), key=lambda record: getattr(record, sort), reverse=True)
+        width = max([len(record.name) for record in records] + [8])
+
+        lines = ["{:<{}} {:>9} {:>11} {:>11} {:>11} {:>12}".format(
+            "function", width, "calls", "total (s)", "own (s)", "mean (us)", "points")]
+        for record in records:
+            lines.append("{:<{}} {:>9d} {:>11.6f} {:>11.6f} {:>11.1f} {:>12d}".format(
+                record.name, width, record.calls, record.total, record.own,
+                record.total/record.calls*1e6, record.points))
+        return "\n".join(lines)
+
+    def saveTrace(self, filename):
+        """Writes the trace in the Chrome trace event format."""
+
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+
+
+# Default profile, used by enable()
+registry = Profile()
+
+# Profile recording the calls, None when disabled
+_active = None
+
+# Time spent in the instrumented children of each pending call
+_stacks = threading.local()
+
+
+def enable(profile=None, trace=None):
+    """Starts recording into profile (default: registry). Returns it."""
+
+    global _active
+    profile = registry if profile is None else profile
+    if trace is not None:
+        profile.trace = trace
+    _active = profile
+    return profile
+
+
+def disable():
+    """Stops recording."""
+
+    global _active
+    _active = None
+
+
+def active():
+    """Profile recording the calls, None if disabled."""
+    return _active
+
+
+@contextmanager
+def profile(trace=False):
+    """Records the calls made in the block into a new Profile."""
+
+    global _active
+    previous = _active
+    _active = Profile(trace)
+    try:
+        yield _active
+    finally:
+        _active = previous
+
+
+def _points(args):
+    """Size of the first array (or EnergyGrid) among args, 0 if none."""
+
+    for argument in args:
+        if getattr(argument, 'ndim', 0) and isinstance(getattr(argument, 'size', None), int):
+            return argument.size
+    return 0
+
+
+def profiled(name=None):
+    """Decorator recording the calls of a function in the active Profile,
+    under name (by default its qualified name, prefixed by its module for
+    plain functions), with the size of its first array argument."""
+
+    def decorator(function):
+        label = name
+        if label is None:
+            label = function.__qualname__
+            if '.' not in label:
+                label = "{}.{}".format(function.__module__.rpartition('.')[2], label)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            profile = _active
+            if profile is None:
+                return function(*args, **kwargs)
+
+            stack = getattr(_stacks, 'children', None)
+            if stack is None:
+                stack = _stacks.children = []
+
+            stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                children = stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                profile.add(label, start, elapsed, children, _points(args))
+
+        wrapper.profiled = label
+        return wrapper
+
+    return decorator
@@ -4,7 +4,7 @@ Various kinds of relations and conversions
 """
 
 import numpy as np
-from scipy.constants import physical_constants
+from scipy.constants import epsilon_0, physical_constants
 
 """
 Unit conversion
@@ -27,6 +27,7 @@ def xtoeV(x, unitX):
     else: raise NotImplemented("Conversion not implemented")
 
 def eVtox(x, unitX):
+    if isinstance(x, EnergyGrid): return x.inUnit(unitX)
     if unitX == 'nm'    : return 1239.0/x
     elif unitX == 'um'  : return 1239.0/(1e3*x)
     elif unitX == 'THz' : return x*(physical_constants['electron volt-hertz relationship'][0]/10**12)
@@ -34,6 +35,93 @@ def eVtox(x, unitX):
     elif unitX == 'eV'  : return x
     else: raise NotImplemented("Conversion not implemented")
 
+class EnergyGrid:
+    """Energies (eV) at which dielectric functions are evaluated, together
+    with the quantities depending only on them (E^2, 1/E, the energies in
+    other units, the key identifying the grid), each computed once on first
+    use and then reused by every evaluation on the grid.
+
+    Accepted wherever energies are, as it converts to the (read only) array
+    of energies. Slices are grids sharing the quantities already computed.
+    """
+
+    def __init__(self, energies, unit='eV'):
+        E = np.asarray(xtoeV(np.asarray(energies, dtype=float), unit), dtype=float)
+        # A read only view, the cached quantities must stay valid
+        self.E = E.view()
+        self.E.flags.writeable = False
+        self._cache = {}
+
+    def __cached(self, name, function):
+        try:
+            return self._cache[name]
+        except KeyError:
+            value = self._cache[name] = function()
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+            return value
+
+    @property
+    def E2(self):
+        """Squared energies."""
+        return self.__cached('E2', lambda: self.E * self.E)
+
+    @property
+    def inverse(self):
+        """Inverse energies, inf at 0."""
+        with np.errstate(divide='ignore'):
+            return self.__cached('inverse', lambda: np.divide(1.0, self.E))
+
+    @property
+    def key(self):
+        """Hashable key identifying the values of the grid: its shape and
+        raw bytes, so that equal keys mean equal grids (a hash alone can
+        collide). The bytes cache their hash, a hit costs one comparison."""
+        return self.__cached('key', lambda: (self.E.shape, np.ascontiguousarray(self.E).tobytes()))
+
+    def inUnit(self, unit):
+        """Energies converted to unit."""
+        return self.__cached(('unit', unit), lambda: np.asarray(eVtox(self.E, unit), dtype=float))
+
+    @property
+    def shape(self):
+        return self.E.shape
+
+    @property
+    def size(self):
+        return self.E.size
+
+    @property
+    def ndim(self):
+        return self.E.ndim
+
+    def __len__(self):
+        return len(self.E)
+
+    def __array__(self, dtype=None, copy=None):
+        if copy:
+            return np.array(self.E, dtype=dtype)
+        return np.asarray(self.E, dtype=dtype)
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self.E[item]
+
+        grid = EnergyGrid.__new__(EnergyGrid)
+        grid.E = self.E[item]
+        grid._cache = {name: value[item] for name, value in self._cache.items()
+                       if isinstance(value, np.ndarray) and value.shape == self.E.shape}
+        return grid
+
+    def __repr__(self):
+        return "EnergyGrid({} points)".format(self.E.size)
+
+def asGrid(window):
+    """window if already an EnergyGrid, else a grid of its energies (eV)."""
+    if isinstance(window, EnergyGrid):
+        return window
+    return EnergyGrid(window)
+
 """
 Optical relations
 """
@@ -41,12 +129,66 @@ Optical relations
 def identity(epsilon):
     return epsilon
 
+polarizations = ('s', 'p', 'unpolarized')
+
+def normal_component(epsilon, theta, ambient=1.0):
+    """Returns N = n cos(theta_t) = sqrt(epsilon - ambient sin^2 theta), the
+    normal component of the wavevector (in units of the vacuum one) in a
+    medium of dielectric function epsilon, for light incident at theta
+    (rad) from a medium of real dielectric function ambient. Decaying or
+    evanescent: Im(N) >= 0 in passive media."""
+    _sin = np.sin(theta)
+    return np.sqrt(epsilon - ambient*_sin*_sin + 0j)
+
+def fresnel(epsilon, theta=0.0, polarization='s'):
+    """Returns the Fresnel reflection coefficient of a semi-infinite medium
+    of dielectric function epsilon, for light incident from vacuum at theta
+    (rad), s or p polarized.
+
+    Both are (eta_0 - eta)/(eta_0 + eta) with the tilted admittances
+    eta = N (s) and eta = epsilon/N (p), so that they coincide at normal
+    incidence, r = (1-n)/(1+n)."""
+    N = normal_component(epsilon, theta)
+    c = np.cos(theta)
+    if polarization == 's':
+        return (c - N)/(c + N)
+    elif polarization == 'p':
+        return (N - epsilon*c)/(N + epsilon*c)
+    raise ValueError("Unknown polarization '{}'".format(polarization))
+
 def reflectivity(epsilon, theta=0.0, polarization='s'):
-    #TODO Fresnel
-    n = refractive_index(epsilon)
-    R = np.abs((n-1)/(n+1))**2
+    """Returns the reflectivity of a semi-infinite medium of dielectric
+    function epsilon, for light incident from vacuum at theta (rad), 's',
+    'p' or 'unpolarized' (the mean of both)."""
+    if np.ndim(theta) == 0 and theta == 0.0 and polarization in polarizations:
+        # Normal incidence, all polarizations alike
+        n = refractive_index(epsilon)
+        return np.abs((n-1)/(n+1))**2
+    if polarization == 'unpolarized':
+        return 0.5*(reflectivity(epsilon, theta, 's') + reflectivity(epsilon, theta, 'p'))
+
+    return np.abs(fresnel(epsilon, theta, polarization))**2
+
+def reflectivity_derivative(epsilon, theta=0.0, polarization='s'):
+    """Returns g such that dR/dp = Re(g * depsilon/dp) for the reflectivity
+    R = |r|^2 of reflectivity(epsilon, theta, polarization)."""
+    if np.ndim(theta) == 0 and theta == 0.0 and polarization in polarizations:
+        n = refractive_index(epsilon)
+        r = (n-1)/(n+1)
 
-    return R
+        return 2.0*np.conj(r)/(n*(n+1)**2)
+    if polarization == 'unpolarized':
+        return 0.5*(reflectivity_derivative(epsilon, theta, 's') + reflectivity_derivative(epsilon, theta, 'p'))
+
+    N = normal_component(epsilon, theta)
+    c = np.cos(theta)
+    r = fresnel(epsilon, theta, polarization)
+    if polarization == 's':
+        drde = -c/(N*(c + N)**2)
+    else:
+        drde = -c*(epsilon - 2.0*np.sin(theta)**2)/(N*(N + epsilon*c)**2)
+
+    return 2.0*np.conj(r)*drde
 
 def refractive_index(epsilon):
     n = np.sqrt(epsilon)
@@ -57,3 +199,52 @@ def conductivity(x, epsilon):
     s = 0.0 + 0.0j
 
     return s
+
+"""
+Sum rules
+"""
+
+# The spectral weight of a dielectric function is swFactor * int E epsilon_2(E) dE
+swFactor = epsilon_0/physical_constants['natural unit of action in eV s'][0]**2
+
+def cumulativeSpectralWeight(x, epsilon2, method='trapezoid'):
+    """
+    Spectral weight swFactor * int_x[0]^x E epsilon_2(E) dE up to every
+    energy of x, as the running integral of a single sampling of epsilon_2.
+
+    Parameters:
+    x -- Increasing energies (eV), strictly for 'simpson'.
+    epsilon2 -- Imaginary part of the dielectric function at x, of shape
+                (..., len(x)), e.g. one row per oscillator.
+    method -- 'trapezoid', or 'simpson': each interval integrates the
+              parabola through its ends and the next energy (the previous
+              one for the last interval), exact for quadratic integrands.
+
+    Returns:
+        Array of the shape of epsilon2, zero at x[0].
+    """
+
+    x = np.asarray(x, dtype=float)
+    f = x*np.asarray(epsilon2)
+    # E epsilon_2 vanishes at E = 0 for a finite epsilon_2 (a Drude term,
+    # singular there, is integrated analytically by OpticalModel)
+    f[..., x == 0.0] = 0.0
+    h = np.diff(x)
+
+    if method == 'trapezoid' or (method == 'simpson' and x.size < 3):
+        areas = 0.5*h*(f[..., 1:] + f[..., :-1])
+    elif method == 'simpson':
+        # Interval (x0, x1) with the next energy x2: h1 = x1 - x0, h2 = x2 - x1
+        h1, h2 = h[:-1], h[1:]
+        H = h1 + h2
+        areas = np.empty(f.shape[:-1] + h.shape)
+        areas[..., :-1] = h1/6.0*((3.0 - h1/H)*f[..., :-2] + (h1 + 3.0*h2)/h2*f[..., 1:-1] - h1*h1/(H*h2)*f[..., 2:])
+        # Last interval (x1, x2) with the previous energy x0, mirrored
+        h1, h2, H = h1[-1], h2[-1], H[-1]
+        areas[..., -1] = h2/6.0*((3.0 - h2/H)*f[..., -1] + (h2 + 3.0*h1)/h1*f[..., -2] - h2*h2/(H*h1)*f[..., -3])
+    else:
+        raise ValueError("Unknown integration method '{}'".format(method))
+
+    _sw = np.zeros(f.shape)
+    np.cumsum(areas, axis=-1, out=_sw[..., 1:])
+    return swFactor*_sw
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Fast reading of spectra (columns of numbers) from text files
+"""
+
+import gzip
+import io
+import os
+import warnings
+
+import numpy as np
+
+# Bytes parsed at a time
+blockSize = 2**22
+
+# Bytes at the beginning of a file used to detect its layout
+sniffSize = 2**16
+
+# Candidate delimiters, None being any whitespace
+delimiters = (None, b',', b';')
+
+def _open(filename):
+    """Opens filename in binary mode, decompressing gzip files."""
+    f = open(filename, 'rb')
+    if f.peek(2)[:2] == b'\x1f\x8b':
+        f.close()
+        return gzip.open(filename, 'rb')
+    return f
+
+def _fields(line, delimiter):
+    """Floats in line separated by delimiter, None if it is not made of
+    numbers only."""
+    try:
+        return [float(field) for field in line.split(delimiter)]
+    except ValueError:
+        return None
+
+def sniff(head, comments='#', lines=5):
+    """
+    Detects the layout of a text spectra file from its first bytes.
+
+    The data starts at the first line made of numbers only. Everything
+    before is header. The delimiter must split it and the following lines
+    of numbers (up to lines of them in total) into the same number of
+    columns.
+
+    Returns:
+
+        delimiter (None for whitespace), number of header lines, number of
+        columns.
+    """
+
+    comments = comments.encode()
+    rows = [row.strip() for row in head.splitlines()]
+
+    for start, row in enumerate(rows):
+        if not row or row.startswith(comments):
+            continue
+
+        candidates = [d for d in delimiters if _fields(row, d)]
+        if not candidates:
+            continue
+
+        following = [r for r in rows[start+1:] if r and not r.startswith(comments)][:lines-1]
+        for delimiter in candidates:
+            columns = len(_fields(row, delimiter))
+            if all(len(_fields(r, delimiter) or ()) == columns for r in following):
+                return delimiter, start, columns
+
+        raise ValueError("Inconsistent number of columns from line %d" % (start + 1))
+
+    raise ValueError("No columns of numbers found")
+
+# Bytes separating whitespace delimited fields
+_whitespace = np.zeros(256, dtype=bool)
+_whitespace[list(b' \t\n\r\v\f')] = True
+
+def _fieldCounts(block, delimiter):
+    """Number of fields of each line of block, counted on the bytes."""
+
+    data = np.frombuffer(block, dtype=np.uint8)
+    if delimiter is None:
+        # Fields start at the non-whitespace bytes following whitespace
+        space = _whitespace[data]
+        marks = np.empty(data.size, dtype=np.uint8)
+        marks[0] = not space[0]
+        np.greater(space[:-1], space[1:], out=marks[1:])
+    else:
+        marks = (data == ord(delimiter)).view(np.uint8)
+
+    # Lines start after each newline, the last one may not end with one
+    starts = np.flatnonzero(data == ord(b'\n')) + 1
+    starts = np.concatenate(([0], starts[:-1] if block.endswith(b'\n') else starts))
+
+    counts = np.add.reduceat(marks, starts, dtype=np.intp)
+    return counts if delimiter is None else counts + 1
+
+def _parse(block, delimiter, columns, comments):
+    """Parses a block of complete lines into a (columns x points) array."""
+
+    text = block if delimiter is None else block.replace(delimiter, b' ')
+
+    # Fast path: a single pass of the C parser over the whole block
+    try:
+        with warnings.catch_warnings():
+            # Older numpy versions warn and stop at the first unparsable field
+            warnings.simplefilter('ignore', DeprecationWarning)
+            values = np.fromstring(text, sep=' ')
+    except ValueError:
+        values = None
+
+    # Every line must have the columns, or a missing field in one line and
+    # an extra one in another would shift the values silently
+    lines = block.count(b'\n') + (not block.endswith(b'\n'))
+    if values is not None and values.size == lines*columns and (_fieldCounts(block, delimiter) == columns).all():
+        return values.reshape(lines, columns).T
+
+    # Blank lines, comments or anything else unexpected
+    values = np.loadtxt(io.BytesIO(block), delimiter=None if delimiter is None else delimiter.decode(),
+                        comments=comments, ndmin=2)
+    if values.size and values.shape[1] != columns:
+        raise ValueError("Expected %d columns, found %d" % (columns, values.shape[1]))
+    return values.reshape(-1, columns).T
+
+def iterSpectra(filename, comments='#', blockSize=blockSize):
+    """
+    Reads a text spectra file block by block.
+
+    The delimiter and the header are detected with sniff. Files may be
+    gzip compressed.
+
+    Yields:
+
+        (columns x points) arrays of consecutive blocks of about blockSize
+        bytes of the file.
+    """
+
+    with _open(filename) as f:
+        buffer = f.read(max(blockSize, sniffSize))
+        complete = buffer[:buffer.rfind(b'\n')+1] or buffer
+        delimiter, skip, columns = sniff(complete, comments)
+
+        # Dropping the header
+        for i in range(skip):
+            buffer = buffer[buffer.index(b'\n')+1:]
+
+        chunk = True
+        while chunk:
+            chunk = f.read(blockSize)
+            buffer += chunk
+
+            # Complete lines only, unless at the end of the file
+            end = buffer.rfind(b'\n') + 1 if chunk else len(buffer)
+
+            block, buffer = buffer[:end], buffer[end:]
+            if block.strip():
+                yield _parse(block, delimiter, columns, comments)
+
+def readSpectra(filename, comments='#', blockSize=blockSize, callback=None):
+    """
+    Reads a text spectra file, see iterSpectra.
+
+    The blocks are copied into a preallocated array, estimated from the size
+    of the file and grown geometrically if needed. callback, if given, is
+    called with every block as soon as it is parsed.
+
+    Returns:
+
+        A (columns x points) array, with contiguous columns.
+    """
+
+    size = os.path.getsize(filename)
+    data = None
+    n = 0
+
+    for block in iterSpectra(filename, comments, blockSize):
+        if callback is not None:
+            callback(block)
+
+        columns, points = block.shape
+        if data is None:
+            capacity = int(points * max(1.0, size/blockSize) * 1.05) + 1
+            data = np.empty((columns, capacity))
+
+        if n + points > data.shape[1]:
+            grown = np.empty((columns, max(2*data.shape[1], n + points)))
+            grown[:, :n] = data[:, :n]
+            data = grown
+
+        data[:, n:n+points] = block
+        n += points
+
+    if data is None:
+        raise ValueError("No data in %s" % filename)
+
+    if n < data.shape[1]:
+        data = data[:, :n].copy()
+
+    return data
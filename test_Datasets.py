@@ -0,0 +1,162 @@
+import Datasets, relations
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+
+def scan(x, window):
+    """Boundaries as found by the former linear scan of subset."""
+    index = range(len(x))
+    return (min(index, key=lambda i: abs(x[i]-window[0])),
+            min(index, key=lambda i: abs(x[i]-window[1])))
+
+
+class DatasetWindowTest(unittest.TestCase):
+    """Testing the binary searched windows against a linear scan."""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.grids = [np.linspace(0, 10, 101), np.linspace(10, 0, 101),
+                      rng.uniform(0, 10, 101), np.repeat(np.linspace(0, 10, 51), 2)]
+        self.windows = rng.uniform(-1, 11, (200, 2)).tolist() + [[0.05, 0.15], [5.0, 5.0]]
+
+    def testIndices(self):
+        for x in self.grids:
+            dataset = Datasets.Dataset(x, 2*x)
+            for window in self.windows:
+                self.assertEqual(dataset.indices(window), scan(x, window))
+
+    def testSubset(self):
+        x = self.grids[0]
+        dataset = Datasets.Dataset(x, 2*x)
+        dataset.subset((2.04, 7.96), 2)
+        np.testing.assert_array_equal(dataset.x, x[20:80:2])
+        np.testing.assert_array_equal(dataset.y, 2*x[20:80:2])
+        self.assertEqual(dataset.indices((3, 4)), (5, 10))
+
+    def testWindow(self):
+        x = self.grids[0]
+        dataset = Datasets.ReflectivityDataset(x=x, y=2*x)
+        window = dataset.window((2, 8))
+        self.assertIsInstance(window, Datasets.ReflectivityDataset)
+        self.assertTrue(np.shares_memory(window.x, dataset.x))
+        self.assertFalse(window.y.flags.writeable)
+
+        # Copy on write, the parent dataset is untouched
+        window.scale(2)
+        window.shift(1)
+        np.testing.assert_array_equal(window.y, 4*x[20:80])
+        np.testing.assert_array_equal(window.x, x[20:80] + 1)
+        np.testing.assert_array_equal(dataset.y, 2*x)
+        np.testing.assert_array_equal(dataset.x, x)
+        self.assertEqual(window.indices((3, 4)), (0, 10))
+
+    def testGrid(self):
+        x = self.grids[0]
+        dataset = Datasets.Dataset(x, 2*x)
+        grid = dataset.grid
+        self.assertIs(dataset.grid, grid)
+        np.testing.assert_array_equal(grid.E2, x**2)
+
+        # Changing the energies invalidates the grid
+        dataset.shift(1)
+        np.testing.assert_array_equal(dataset.grid.E2, (x + 1)**2)
+        dataset.subset((2, 8))
+        np.testing.assert_array_equal(dataset.grid.E, dataset.x)
+
+    def testShiftUnsorted(self):
+        x = self.grids[2]
+        dataset = Datasets.Dataset(x, x)
+        dataset.shift(1.5)
+        for window in self.windows:
+            self.assertEqual(dataset.indices(window), scan(x + 1.5, window))
+
+
+class SpectralWeightTest(unittest.TestCase):
+    """Cumulative spectral weight of dielectric function datasets."""
+
+    def testOrder(self):
+        x = np.linspace(0.5, 6, 111)
+        y = 1.0 + 1j*np.exp(-(x - 3)**2)
+        expected = relations.cumulativeSpectralWeight(x, y.imag)
+
+        order = np.random.default_rng(1).permutation(len(x))
+        for energies, values in ((x, y), (x[::-1], y[::-1]), (x[order], y[order])):
+            dataset = Datasets.DielectricFunctionDataset(energies, values)
+            np.testing.assert_allclose(dataset.cumulativeSpectralWeight(),
+                                       np.interp(energies, x, expected), rtol=1e-12)
+
+    def testSimpson(self):
+        # Exact for E epsilon_2 quadratic, on any grid
+        x = np.sort(np.random.default_rng(2).uniform(0, 3, 9))
+        weight = relations.cumulativeSpectralWeight(x, x, 'simpson')/relations.swFactor
+        np.testing.assert_allclose(weight, (x**3 - x[0]**3)/3, rtol=1e-12, atol=1e-14)
+
+
+class DatasetBinaryTest(unittest.TestCase):
+    """Testing the conversion to and the memory mapping of binary files."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.text = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Examples",
+                                 "Reflectivity-Simple-wavenumber.dat")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def testConvert(self):
+        binary = Datasets.convertToBinary(self.text, os.path.join(self.directory.name, "R.npy"), unit='cm-1')
+        self.assertTrue(Datasets.isBinary(binary))
+
+        text = Datasets.ReflectivityDataset(self.text, unit='cm-1')
+        mapped = Datasets.ReflectivityDataset(binary)
+        np.testing.assert_array_equal(mapped.x, text.x)
+        np.testing.assert_array_equal(mapped.y, text.y)
+        self.assertFalse(mapped.y.flags.writeable)
+
+        # Modifying the dataset does not touch the file
+        mapped.scale(2)
+        np.testing.assert_array_equal(Datasets.ReflectivityDataset(binary).y, text.y)
+
+    def testComplex(self):
+        x = np.linspace(0, 1, 11)
+        dataset = Datasets.DielectricFunctionDataset(x, x + 2j*x)
+        binary = os.path.join(self.directory.name, "epsilon.npy")
+        dataset.saveBinary(binary)
+        loaded = Datasets.DielectricFunctionDataset(inputFile=binary)
+        np.testing.assert_array_equal(loaded.x, x)
+        np.testing.assert_array_equal(loaded.y, dataset.y)
+
+
+class DatasetLazyTest(unittest.TestCase):
+    """Testing the lazy loading of datasets from hdf5."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "dataset.hdf5")
+        x = np.linspace(1, 2, 11)
+        self.dataset = Datasets.ReflectivityDataset(x=x, y=0.5*x)
+        self.dataset.savetohdf5(self.filename)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def testMissingFile(self):
+        dataset = Datasets.Dataset.fromhdf5(self.filename)
+        moved = self.filename + ".moved"
+        os.rename(self.filename, moved)
+        with self.assertRaises(OSError):
+            dataset.y
+        with self.assertRaises(OSError):
+            dataset.x
+
+        # Read once the file is back
+        os.rename(moved, self.filename)
+        np.testing.assert_array_equal(dataset.x, self.dataset.x)
+        np.testing.assert_array_equal(dataset.y, self.dataset.y)
+
+
+if __name__ == '__main__':
+        unittest.main()
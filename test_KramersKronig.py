@@ -0,0 +1,98 @@
+from KramersKronig import KramersKronig
+import unittest
+
+import numpy as np
+from scipy.integrate import quad
+
+
+class KramersKronigTest(unittest.TestCase):
+    """Testing the transforms on a sum of Lorentz oscillators."""
+
+    def setUp(self):
+        self.nu = np.linspace(0, 30, 3001)
+        self.epsilon = 1 + 2/(1 - self.nu**2 - 0.3j*self.nu) + 1/(9 - self.nu**2 - 0.5j*self.nu)
+        self.index = np.arange(10, 2900, 50)
+
+    def testReal2Imag(self):
+        NuEval, Result = KramersKronig.real2imag(self.nu, self.epsilon.real, self.index)
+        np.testing.assert_array_equal(NuEval, self.nu[self.index])
+        np.testing.assert_allclose(Result, self.epsilon.imag[self.index], atol=0.1)
+
+    def testImag2Real(self):
+        Result = KramersKronig.imag2real(self.nu, self.epsilon.imag, self.index)[1]
+        np.testing.assert_allclose(Result + 1, self.epsilon.real[self.index], atol=1e-3)
+
+    def testChunks(self):
+        # Tiles and threads must not change a single bit of the result
+        for transform, Y in (("real2imag", self.epsilon.real), ("imag2real", self.epsilon.imag)):
+            function = getattr(KramersKronig, transform)
+            reference = function(self.nu, Y, memory=2**30)[1]
+            np.testing.assert_array_equal(function(self.nu, Y, memory=1)[1], reference)
+            np.testing.assert_array_equal(function(self.nu, Y, memory=2**16, threads=3)[1], reference)
+
+    def testReal2ImagFFT(self):
+        Result = KramersKronig.real2imag_fft(self.nu, self.epsilon.real, self.index)[1]
+        np.testing.assert_allclose(Result, self.epsilon.imag[self.index], atol=2e-3)
+
+    def testImag2RealFFT(self):
+        Result = KramersKronig.imag2real_fft(self.nu, self.epsilon.imag, self.index)[1]
+        np.testing.assert_allclose(Result + 1, self.epsilon.real[self.index], atol=5e-3)
+
+    def testCheckFFT(self):
+        self.assertTrue(KramersKronig.check_fft(self.nu, self.epsilon.real, "real2imag")[0])
+        self.assertTrue(KramersKronig.check_fft(self.nu, self.epsilon.imag, "imag2real")[0])
+
+
+class Mod2PhaseTest(unittest.TestCase):
+    """Testing the phase retrieval against a full range integral of a
+    reflectivity continued with the same extrapolations."""
+
+    def setUp(self):
+        self.nu = np.linspace(1, 10, 9001)
+        self.data = lambda x: 0.8*np.exp(-0.1*(x - 1)) + 0.05*np.sin(x)
+        self.params = {'nub': 20.0, 's': 2.0, 'N': None}
+
+    def reflectivity(self, x):
+        R0, Ra = self.data(1.0), self.data(10.0)
+        if x < 1:
+            return 1 - (1 - R0)*np.sqrt(x)
+        if x <= 10:
+            return self.data(x)
+        if x <= 20:
+            return Ra*(10/x)**2
+        return Ra*(10/20)**2*(20/x)**4
+
+    def phase(self, nu):
+        R = self.reflectivity
+        Rnu = R(nu)
+        total = 0.0
+        for a, b in [(0, 1), (1, 10), (10, 20), (20, np.inf)]:
+            if a < nu < b:
+                total -= quad(lambda x: np.log(R(x)/Rnu)/(nu + x), a, b, weight='cauchy', wvar=nu, limit=400)[0]
+            else:
+                total += quad(lambda x: np.log(R(x)/Rnu)/(nu**2 - x**2), a, b, limit=400)[0]
+        return nu/np.pi*total
+
+    def testExtrapolations(self):
+        index = np.array([300, 4000, 8000])
+        NuEval, Result = KramersKronig.mod2phase(self.nu, self.data(self.nu), index, Extrapolation=None,
+                                                 ExtrapolationParams=self.params, LowExtrapolation="HagenRubens")
+        np.testing.assert_allclose(Result, [self.phase(nu) for nu in NuEval], rtol=1e-5)
+
+    def testSeries(self):
+        Y = self.data(self.nu)
+        closed = KramersKronig.mod2phase(self.nu, Y, Extrapolation=None, ExtrapolationParams=self.params)[1]
+        series = KramersKronig.mod2phase(self.nu, Y, Extrapolation="Full")[1]
+        # Ten terms are enough well below the last point
+        np.testing.assert_allclose(series[:3000], closed[:3000], rtol=1e-6)
+
+    def testChunks(self):
+        Y = self.data(self.nu)
+        np.testing.assert_array_equal(KramersKronig.mod2phase(self.nu, Y, memory=2**30)[1],
+                                      KramersKronig.mod2phase(self.nu, Y, memory=1)[1])
+        np.testing.assert_array_equal(KramersKronig.mod2phase(self.nu, Y, memory=2**30)[1],
+                                      KramersKronig.mod2phase(self.nu, Y, memory=2**16, threads=3)[1])
+
+
+if __name__ == '__main__':
+        unittest.main()
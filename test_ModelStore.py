@@ -0,0 +1,65 @@
+import ModelStore, OpticalModel, Oscillators
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+
+class ModelStoreTest(unittest.TestCase):
+    """Testing queries on a library of a temperature series."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ModelStore.ModelStore(os.path.join(self.directory.name, "library.db"))
+
+        self.models = []
+        for sample in ("Fe3O4", "Au"):
+            for temperature in (5, 10, 100, 300, 350):
+                model = OpticalModel.OpticalModel("%s %dK" % (sample, temperature), label=float(temperature))
+                model.add([Oscillators.Drude(1, 0.1), Oscillators.Lorentz(1, temperature/1000, 2)])
+                self.models.append(model)
+        self.ids = self.store.addMany(self.models)
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def testQuery(self):
+        entries = self.store.query(pattern="Fe3O4%", label=(10, 300))
+        self.assertEqual([entry.name for entry in entries], ["Fe3O4 10K", "Fe3O4 100K", "Fe3O4 300K"])
+        self.assertEqual(len(self.store.query(label=5.0)), 2)
+        self.assertEqual([entry.name for entry in self.store.query(label=10)], ["Fe3O4 10K", "Au 10K"])
+        self.assertEqual(len(self.store.query(label=(None, 10))), 4)
+        self.assertEqual(len(self.store.query(name="Au 5K")), 1)
+
+    def testLazy(self):
+        entry, = self.store.query(name="Au 100K")
+        self.assertIsNone(entry._model)
+        np.testing.assert_array_equal(entry.model.params, self.models[7].params)
+        self.assertEqual(entry.model.label, 100.0)
+
+    def testNumpyLabels(self):
+        model = OpticalModel.OpticalModel("Fe3O4 77K", label=np.int64(77))
+        id = self.store.add(model)
+        entry, = self.store.query(label=np.int64(77))
+        self.assertEqual(entry.id, id)
+        self.assertEqual(len(self.store.query(label=(np.float32(50), np.float32(80)))), 1)
+
+    def testTextLabels(self):
+        self.store.addMany([OpticalModel.OpticalModel("Au film", label="10"),
+                            OpticalModel.OpticalModel("Au bulk", label=True)])
+        self.assertEqual([entry.name for entry in self.store.query(label="10")], ["Au film"])
+        self.assertEqual([entry.name for entry in self.store.query(label=True)], ["Au bulk"])
+        self.assertEqual(len(self.store.query(label=1)), 0)
+
+    def testPersistence(self):
+        self.store.remove(self.ids[:5])
+        self.store.close()
+        self.store = ModelStore.ModelStore(os.path.join(self.directory.name, "library.db"))
+        self.assertEqual(len(self.store), 5)
+        self.assertEqual([model.name for model in self.store.models(label=(100, 300))], ["Au 100K", "Au 300K"])
+
+
+if __name__ == '__main__':
+        unittest.main()
@@ -0,0 +1,91 @@
+import Multilayer, OpticalModel, Oscillators, relations
+import unittest
+
+import numpy as np
+
+
+class FresnelTest(unittest.TestCase):
+    """Oblique incidence reflectivity of a semi-infinite medium."""
+
+    def setUp(self):
+        self.epsilon = np.array([2.3+0.4j, -5+1j, 12+3j])
+        self.theta = np.radians([0, 20, 50, 80])[:, np.newaxis]
+
+    def testNormal(self):
+        for polarization in relations.polarizations:
+            np.testing.assert_allclose(relations.reflectivity(self.epsilon, 1e-12, polarization),
+                                       relations.reflectivity(self.epsilon), rtol=1e-10)
+
+    def testBrewster(self):
+        theta = np.arctan(np.sqrt(2.25))
+        self.assertLess(relations.reflectivity(2.25, theta, 'p'), 1e-20)
+        self.assertGreater(relations.reflectivity(2.25, theta, 's'), 0.1)
+
+    def testDerivative(self):
+        step = 1e-7
+        for polarization in relations.polarizations:
+            g = relations.reflectivity_derivative(self.epsilon, self.theta, polarization)
+            for direction in (1, 1j):
+                numerical = (relations.reflectivity(self.epsilon + step*direction, self.theta, polarization)
+                             - relations.reflectivity(self.epsilon - step*direction, self.theta, polarization))/(2*step)
+                np.testing.assert_allclose(np.real(g*direction), numerical, rtol=1e-5, atol=1e-9)
+
+
+class MultilayerTest(unittest.TestCase):
+    """Transfer matrices against closed forms."""
+
+    def setUp(self):
+        self.substrate = OpticalModel.OpticalModel("Substrate")
+        self.substrate.add(Oscillators.Lorentz(5, 0.3, 3))
+        self.substrate.einf = 2.0
+        self.film = OpticalModel.OpticalModel("Film")
+        self.film.add(Oscillators.Drude(20, 0.5))
+        self.film.einf = 1.5
+
+        self.window = np.linspace(0.5, 6, 50)
+        self.theta = np.radians([0, 30, 60, 85])
+
+    def testSubstrate(self):
+        stack = Multilayer.Multilayer(self.substrate, [(self.film, 0.0)])
+        coefficients = stack.coefficients(self.window, self.theta, ('s', 'p'))
+        self.assertEqual(coefficients.R.shape, (2, len(self.theta), len(self.window)))
+
+        epsilon = self.substrate.dielectricFunction(self.window)
+        for row, polarization in enumerate('sp'):
+            np.testing.assert_allclose(coefficients.r[row],
+                                       relations.fresnel(epsilon, self.theta[:, np.newaxis], polarization))
+        np.testing.assert_allclose(stack.reflectivity(self.window, 0.7, 'unpolarized'),
+                                   relations.reflectivity(epsilon, 0.7, 'unpolarized'))
+
+    def testAiry(self):
+        # Film of index 2, 100 nm thick, on glass at normal incidence
+        thickness, n, substrate = 100.0, 2.0, 1.5
+        phase = np.exp(2j*self.window/Multilayer.hbarc*n*thickness)
+        r01, r12 = (1 - n)/(1 + n), (n - substrate)/(n + substrate)
+        expected = (r01 + r12*phase)/(1 + r01*r12*phase)
+
+        coefficients = Multilayer.Multilayer(substrate**2, [(n**2, thickness)]).coefficients(self.window)
+        np.testing.assert_allclose(coefficients.r, expected)
+        np.testing.assert_allclose(coefficients.R + coefficients.T, 1)
+
+    def testEnergyConservation(self):
+        stack = Multilayer.Multilayer(2.25, [(4.0, 120.0), (1.8, 60.0)], ambient=1.2)
+        coefficients = stack.coefficients(self.window, self.theta, ('s', 'p'))
+        np.testing.assert_allclose(coefficients.R + coefficients.T, 1)
+
+    def testOrder(self):
+        stack = Multilayer.Multilayer(2.25, [(4.0, 80.0), (1.68+0.26j, 40.0)])
+        stack.add(3.0, 10.0)
+        self.assertEqual([thickness for _, thickness in stack.layers], [10.0, 80.0, 40.0])
+
+    def testThick(self):
+        # An opaque film hides the substrate without overflowing
+        stack = Multilayer.Multilayer(self.substrate, [(self.film, 1e6)])
+        coefficients = stack.coefficients(self.window, self.theta, 'p')
+        np.testing.assert_allclose(coefficients.R, relations.reflectivity(self.film.dielectricFunction(self.window),
+                                                                          self.theta[:, np.newaxis], 'p'))
+        np.testing.assert_array_equal(coefficients.T, 0)
+
+
+if __name__ == '__main__':
+        unittest.main()
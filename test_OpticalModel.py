@@ -1,6 +1,11 @@
 import OpticalModel, Oscillators
+import json
+import os
+import tempfile
 import unittest
 
+import numpy as np
+
 class OpticalModelAddTest(unittest.TestCase):
     """Testing the add and addCollection methods in OpticalModel.py."""
 
@@ -114,10 +119,211 @@ class OpticalModelPropertiesTest(unittest.TestCase):
         self.om.add(self.osc1)
 
     def testTotalSpectralWeigth(self):
-        raise NotImplementedError
+        self.assertAlmostEqual(self.om.spectralWeight()/self.om.spectralWeight((0, 50)), 1)
+        self.assertEqual(self.om.spectralWeight(method='adaptive', error=True), (self.om.spectralWeight(), 0.0))
 
     def testPartialSpectralWeight(self):
-        raise NotImplementedError
+        self.om.add([Oscillators.Drude(1, 0.2), Oscillators.Tauc(100, 1, 3, 1.5)])
+        analytic, error = self.om.spectralWeight((0, 6), error=True)
+        self.assertEqual(self.om.spectralWeight((0, 6)), analytic)
+        self.assertIsInstance(self.om.spectralWeight((0, 6), method='adaptive'), float)
+
+        adaptive, adaptiveError = self.om.spectralWeight((0, 6), method='adaptive', error=True)
+        self.assertAlmostEqual(adaptive/analytic, 1, delta=1e-8)
+        self.assertLess(adaptiveError, 1e-8*analytic)
+        self.assertLess(error, 1e-8*analytic)
+
+        # Romberg fails at E = 0 with a Drude term
+        romberg, rombergError = self.om.spectralWeight((0.01, 6), method='romberg', error=True)
+        self.assertAlmostEqual(romberg/self.om.spectralWeight((0.01, 6)), 1, delta=max(1e-6, 2*rombergError/romberg))
+
+        with self.assertRaises(ValueError):
+            self.om.spectralWeight((0, 6), method='simpson')
+
+    def testCumulativeSpectralWeight(self):
+        self.om.add([Oscillators.Drude(1, 0.2), Oscillators.Tauc(100, 1, 3, 1.5)])
+        window = np.linspace(0, 8, 801)
+        weights = self.om.cumulativeSpectralWeight(window, oscillators=True)
+        self.assertEqual(weights.shape, (3, len(window)))
+
+        cumulative = self.om.cumulativeSpectralWeight(window)
+        np.testing.assert_allclose(cumulative, weights.sum(axis=0))
+        for cutoff in (100, 400, 800):
+            self.assertAlmostEqual(cumulative[cutoff]/self.om.spectralWeight((0, window[cutoff])), 1, delta=1e-6)
+
+        # Sampled Drude term, set to zero at E = 0
+        simpson = self.om.cumulativeSpectralWeight(window, 'simpson')
+        np.testing.assert_allclose(simpson[100:], cumulative[100:], rtol=2e-2)
+
+class OpticalModelParamsTest(unittest.TestCase):
+    """Testing the flat parameter vector."""
+
+    def setUp(self):
+        self.om = OpticalModel.OpticalModel()
+        self.drude = Oscillators.Drude(1, 2)
+        self.lorentz = Oscillators.Lorentz(3, 4, 5)
+        self.om.add([self.drude, self.lorentz])
+
+    def testGet(self):
+        np.testing.assert_array_equal(self.om.params, [1, 2, 3, 4, 5])
+        self.assertIs(self.om.params, self.om.params)
+
+    def testSet(self):
+        self.om.params = [6, 7, 8, 9, 10]
+        self.assertEqual(self.drude.params, [6, 7])
+        self.assertEqual(self.lorentz.params, [8, 9, 10])
+
+    def testSetNegative(self):
+        self.om.params = [6, -7, 8, 9, float('nan')]
+        np.testing.assert_array_equal(self.om.params, [6, 0, 8, 9, 0])
+
+    def testViews(self):
+        self.om.params[3] = 0.5
+        self.assertEqual(self.lorentz.width, 0.5)
+        self.lorentz.position = 11
+        self.assertEqual(self.om.params[4], 11)
+
+    def testStructureChange(self):
+        self.om.params
+        self.om.insert(0, Oscillators.Gauss(12, 13, 14))
+        np.testing.assert_array_equal(self.om.params, [12, 13, 14, 1, 2, 3, 4, 5])
+
+    def testShared(self):
+        other = OpticalModel.OpticalModel()
+        self.om.params
+        other.add(self.lorentz)
+        other.params = [20, 21, 22]
+        np.testing.assert_array_equal(self.om.params, [1, 2, 20, 21, 22])
+        self.om.params = [1, 2, 3, 4, 5]
+        np.testing.assert_array_equal(other.params, [3, 4, 5])
+
+
+class OpticalModelEvaluationTest(unittest.TestCase):
+    """Testing the compiled evaluation against the per-oscillator sum."""
+
+    def setUp(self):
+        self.om = OpticalModel.OpticalModel()
+        self.om.add([Oscillators.Drude(2, 0.3),
+                     Oscillators.Lorentz(1, 0.3, 2),
+                     Oscillators.Gauss(1, 0.8, 5),
+                     Oscillators.Lorentz(0.5, 0.1, 0.7),
+                     Oscillators.Gauss(0.2, 1.5, 3)])
+        self.om.einf = 2.5
+        self.om.poles = [0.5, 0.05, 3.0, 12.0]
+        self.window = np.linspace(0.01, 10, 1000)
+
+    def reference(self, window):
+        eps = self.om.einf
+        for oscillator in self.om:
+            eps = eps + oscillator.dielectricFunction(window)
+        for intensity, position in self.om.poles:
+            eps = eps + self.om._pole(window, intensity, position)
+        return eps
+
+    def testDielectricFunction(self):
+        np.testing.assert_allclose(self.om.dielectricFunction(self.window),
+                                   self.reference(self.window), rtol=1e-12)
+
+    def testPlanFollowsChanges(self):
+        self.om.dielectricFunction(self.window)
+        self.om[1].width = 0.6
+        self.om.add(Oscillators.Drude(1, 1))
+        del self.om[0]
+        np.testing.assert_allclose(self.om.dielectricFunction(self.window),
+                                   self.reference(self.window), rtol=1e-12)
+
+    def testJacobian(self):
+        jacobian = self.om.jacobian(self.window)
+        self.assertEqual(jacobian.shape, (len(self.om.params), len(self.window)))
+        np.testing.assert_allclose(jacobian[2:5], self.om[1].jacobian(self.window))
+
+    def testCached(self):
+        self.om.cached = True
+        first = self.om.dielectricFunction(self.window)
+        np.testing.assert_allclose(first, self.reference(self.window), rtol=1e-12)
+
+        self.om[2].position = 4
+        np.testing.assert_allclose(self.om.dielectricFunction(self.window),
+                                   self.reference(self.window), rtol=1e-12)
+        # Only the modified oscillator was evaluated again
+        self.assertEqual(len(self.om[0].dfunc), 1)
+        self.assertEqual(len(self.om[2].dfunc), 2)
+
+        self.om.cached = False
+        self.assertEqual(len(self.om[0].dfunc), 0)
+
+    def testScalar(self):
+        self.assertAlmostEqual(complex(self.om.dielectricFunction(1.3)),
+                               complex(self.reference(1.3)))
+
+    def testBatch(self):
+        window = np.linspace(0.013, 10, 700)  # away from the poles
+        self.om.add(Oscillators.Tauc(1, 1, 3, 1))  # no batch kernel
+        params = np.array(self.om.params) * np.random.default_rng(0).uniform(0.5, 1.5, (4, 3, len(self.om.params)))
+        saved = np.array(self.om.params)
+        batch = self.om.batchDielectricFunction(window, params)
+        self.assertEqual(batch.shape, (4, 3, len(window)))
+        np.testing.assert_array_equal(self.om.params, saved)
+        for row in np.ndindex(4, 3):
+            self.om.params = params[row]
+            np.testing.assert_allclose(batch[row], self.reference(window), rtol=1e-12)
+
+    def testManyModels(self):
+        window = np.linspace(0.013, 10, 700)
+        other = OpticalModel.OpticalModel(oscillators=[Oscillators.Gauss(1, 1, 1)])
+        other.einf = 4.0
+        models = [self.om, other, self.om]
+        epsilon = OpticalModel.dielectricFunctions(models, window)
+        self.assertEqual(epsilon.shape, (3, len(window)))
+        for model, row in zip(models, epsilon):
+            np.testing.assert_allclose(row, model.dielectricFunction(window), rtol=1e-12)
+        np.testing.assert_allclose(OpticalModel.reflectivities(models, window)[1],
+                                   other.reflectivity(window), rtol=1e-12)
+
+
+class OpticalModelJsonTest(unittest.TestCase):
+    """Testing the json files of models, without evaluating them."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.examples = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Examples")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def testLegacy(self):
+        model, = OpticalModel.loadModels(os.path.join(self.examples, "Fe3O4-15K.json"))
+        self.assertEqual([type(osc).__name__ for osc in model][:3], ["Drude", "Lorentz", "Lorentz"])
+        self.assertEqual(model.poles, ([0.0, 0.1], [85.4310441220902, 7.0]))
+        np.testing.assert_array_equal(model[1].params, [8.636116, 0.65579, 0.708053])
+
+    def testRoundTrip(self):
+        model, = OpticalModel.loadModels(os.path.join(self.examples, "Fe3O4-15K.json"))
+        model.label = 15.0
+        filename = os.path.join(self.directory.name, "model.json")
+        model.save(filename)
+        loaded = OpticalModel.OpticalModel()
+        loaded.load(filename)
+        self.assertEqual((loaded.name, loaded.label, loaded.poles), (model.name, 15.0, model.poles))
+        np.testing.assert_array_equal(loaded.params, model.params)
+
+    def testLibrary(self):
+        models = OpticalModel.loadModels([os.path.join(self.examples, name)
+                                          for name in ("Fe3O4-15K.json", "Demo_Model.json")])
+        filename = os.path.join(self.directory.name, "library.json")
+        OpticalModel.saveModels(models, filename)
+        loaded = OpticalModel.loadModels(filename)
+        self.assertEqual([len(model) for model in loaded], [8, 2])
+        for model, other in zip(models, loaded):
+            np.testing.assert_array_equal(model.params, other.params)
+
+    def testUnsafe(self):
+        filename = os.path.join(self.directory.name, "unsafe.json")
+        for representation in ('__import__("os").getcwd()', 'Lorentz(amplitude = len("a"))', 'Unknown(width = 1.0)'):
+            with open(filename, 'w') as f:
+                json.dump({'type': 'model', 'name': 'unsafe', 'oscillators': [representation]}, f)
+            with self.assertRaises(ValueError):
+                OpticalModel.loadModels(filename)
 
 
 if __name__ == '__main__':
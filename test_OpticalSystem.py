@@ -0,0 +1,257 @@
+import Datasets, OpticalSystem, Oscillators
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+
+class OpticalSystemFitTest(unittest.TestCase):
+    """Testing the fits against synthetic data."""
+
+    def setUp(self):
+        self.system = OpticalSystem.OpticalSystem()
+        self.truth = [2.0, 0.3, 1.0, 0.4, 2.0, 0.5, 1.0, 4.0]
+        self.window = np.linspace(0.05, 8, 300)
+
+        self.model = self.system.createModel("Test model")
+        self.model.add([Oscillators.Drude(), Oscillators.Lorentz(), Oscillators.Gauss()])
+        self.model.params = self.truth
+        self.epsilon = self.model.dielectricFunction(self.window)
+
+        self.reflectivity = Datasets.ReflectivityDataset(x=self.window, y=np.abs((np.sqrt(self.epsilon)-1)/(np.sqrt(self.epsilon)+1))**2)
+        self.dielectric = Datasets.DielectricFunctionDataset(self.window, self.epsilon)
+        self.system.datasets.extend([self.reflectivity, self.dielectric])
+
+        self.model.params = [1.5, 0.4, 1.2, 0.3, 2.2, 0.4, 1.2, 3.8]
+
+    def testReflectivityJacobian(self):
+        self.checkReflectivityJacobian()
+
+    def testObliqueReflectivityJacobian(self):
+        self.reflectivity.theta, self.reflectivity.polarization = 1.1, 'p'
+        self.checkReflectivityJacobian()
+
+    def checkReflectivityJacobian(self):
+        model = self.model
+        jacobian = self.reflectivity.inputToTypeJacobian(model.dielectricFunction(self.window),
+                                                         model.jacobian(self.window))
+        step = 1e-6
+        params = np.array(model.params)
+        for i in range(len(params)):
+            shifted = params.copy()
+            shifted[i] += step
+            model.params = shifted
+            up = self.reflectivity.inputToType(model.dielectricFunction(self.window))
+            model.params = params
+            down = self.reflectivity.inputToType(model.dielectricFunction(self.window))
+            np.testing.assert_allclose(jacobian[i], (up - down)/step, rtol=1e-3, atol=1e-6)
+
+    def testLeastSquares(self):
+        result = self.system.fit(self.model, verbose=False, method="trf")
+        self.assertTrue(result.success)
+        np.testing.assert_allclose(self.model.params, self.truth, rtol=1e-6)
+        self.assertEqual(result.uncertainties.shape, (len(self.truth),))
+        self.assertIs(self.system.fits[-1], result)
+
+    def testLeastSquaresSingleDataset(self):
+        result = self.system.fit(self.model, datasets=[1], verbose=False, method="lm")
+        np.testing.assert_allclose(result.params, self.truth, rtol=1e-6)
+
+    def testProgress(self):
+        progress = []
+        result = self.system.fit(self.model, verbose=False, method="trf", callback=progress.append)
+        self.assertTrue(result.success)
+        self.assertEqual(len(progress), result.nfev)
+        self.assertEqual([p.evaluation for p in progress], list(range(1, result.nfev + 1)))
+        self.assertAlmostEqual(progress[-1].best, result.cost)
+        self.assertGreater(progress[-1].iteration, 0)
+        np.testing.assert_allclose(progress[2].delta, progress[2].params - progress[1].params)
+        self.assertGreater(progress[-1].rate, 0)
+
+    def testEarlyStopping(self):
+        stopping = OpticalSystem.EarlyStopping(maxEvaluations=3)
+        for method in ("trf", "Powell"):
+            result = self.system.fit(self.model, verbose=False, method=method, callback=stopping)
+            self.assertFalse(result.success)
+            self.assertEqual(result.nfev, 3)
+            self.assertIn("maximum of 3 evaluations", result.message)
+            # The model holds the best parameters seen
+            self.assertEqual(self.model.params.tolist(), result.params.tolist())
+
+    def testPlateau(self):
+        costs = []
+        stopping = OpticalSystem.EarlyStopping(plateau=1e-3, patience=5)
+        result = self.system.fit(self.model, verbose=False, method="Powell",
+                                 callback=[lambda p: costs.append(p.best), stopping])
+        self.assertTrue(result.message.startswith("Stopped: relative improvement"))
+        self.assertLessEqual(costs[-6] - costs[-1], 1e-3 * costs[-6])
+
+    def testWeights(self):
+        # Two inconsistent datasets: the heavier one wins, with the same
+        # objective for the scalar and the least-squares methods
+        system = OpticalSystem.OpticalSystem()
+        model = system.createModel("Drude")
+        model.add(Oscillators.Drude())
+        for width in (0.2, 0.4):
+            model.params = [2.0, width]
+            system.datasets.append(Datasets.DielectricFunctionDataset(self.window, model.dielectricFunction(self.window)))
+
+        widths = {}
+        for weight in (1.0, 10.0):
+            system.datasets[1].weight = weight
+            results = []
+            for method in ("trf", "Powell"):
+                model.params = [1.5, 0.3]
+                results.append(system.fit(model, verbose=False, method=method))
+            trf, powell = results
+            np.testing.assert_allclose(powell.params, trf.params, rtol=1e-3)
+            self.assertAlmostEqual(powell.cost/trf.cost, 1, delta=1e-5)
+            widths[weight] = trf.params[1]
+
+        self.assertGreater(widths[10.0], widths[1.0] + 0.05)
+
+
+class OpticalSystemFitBatchTest(unittest.TestCase):
+    """Testing batches of fits of a temperature series."""
+
+    def setUp(self):
+        self.system = OpticalSystem.OpticalSystem()
+        self.window = np.linspace(0.05, 8, 200)
+        self.model = self.system.createModel("Series")
+        self.model.add([Oscillators.Drude(), Oscillators.Lorentz()])
+
+        self.truths = {}
+        for label, width in [(300, 0.5), (10, 0.2), (100, 0.3)]:
+            self.model.params = [2.0, width, 1.0, 0.4, 2.0]
+            self.truths[label] = np.array(self.model.params)
+            dataset = Datasets.DielectricFunctionDataset(self.window, self.model.dielectricFunction(self.window))
+            dataset.label = label
+            self.system.datasets.append(dataset)
+
+        self.model.params = [1.5, 0.35, 1.2, 0.3, 2.2]
+
+    def checkResults(self, results):
+        self.assertEqual([result.label for result in results], [10, 100, 300])
+        for result in results:
+            np.testing.assert_allclose(result.params, self.truths[result.label], rtol=1e-6)
+
+    def testSerial(self):
+        results = self.system.fitBatch(self.model, groupBy="label", workers=1, restarts=1, seed=0)
+        self.checkResults(results)
+        np.testing.assert_array_equal(self.model.params, [1.5, 0.35, 1.2, 0.3, 2.2])
+
+    def testParallel(self):
+        results = self.system.fitBatch(self.model, groupBy="label", workers=2)
+        self.checkResults(results)
+
+    def testUnlabelled(self):
+        self.model.params = self.truths[100]
+        self.system.datasets.append(Datasets.DielectricFunctionDataset(self.window, self.model.dielectricFunction(self.window)))
+        self.model.params = [1.5, 0.35, 1.2, 0.3, 2.2]
+
+        results = self.system.fitBatch(self.model, groupBy="label", workers=1)
+        self.assertEqual([result.label for result in results], [None, 10, 100, 300])
+        np.testing.assert_allclose(results[0].params, self.truths[100], rtol=1e-6)
+
+    def testStopping(self):
+        results = self.system.fitBatch(self.model, groupBy="label", workers=2,
+                                       callback=OpticalSystem.EarlyStopping(maxEvaluations=2))
+        self.assertEqual([result.nfev for result in results], [2, 2, 2])
+
+
+class OpticalSystemHdf5Test(unittest.TestCase):
+    """Testing saving and reopening a whole system."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "system.h5")
+
+        self.system = OpticalSystem.OpticalSystem("Test system")
+        self.window = np.linspace(0.05, 8, 300)
+        self.model = self.system.createModel("Test model")
+        self.model.add([Oscillators.Drude(2.0, 0.3), Oscillators.Lorentz(1.0, 0.4, 2.0), Oscillators.Gauss()])
+        self.model.einf = 2.5
+        self.model.poles = [0.1, 0.5, 10, 3.0]
+        self.model.label = 15.0
+
+        self.epsilon = self.model.dielectricFunction(self.window)
+        self.system.datasets.append(Datasets.ReflectivityDataset(x=self.window, y=np.abs(self.epsilon), name="R"))
+        self.system.datasets.append(Datasets.DielectricFunctionDataset(self.window, self.epsilon))
+        self.system.datasets[0].label = 10.0
+        self.system.datasets[0].theta = 0.5
+        self.system.datasets[0].polarization = 'p'
+        self.system.fit(self.model, datasets=[1], verbose=False, method="trf")
+        self.system.save(self.filename)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def testModels(self):
+        system = OpticalSystem.OpticalSystem()
+        system.load(self.filename)
+        self.assertEqual(system.description, "Test system")
+        model = system.models[0]
+        self.assertEqual((model.name, model.label, model.einf), ("Test model", 15.0, 2.5))
+        self.assertEqual(model.poles, ([0.1, 0.5], [10.0, 3.0]))
+        np.testing.assert_allclose(model.dielectricFunction(self.window), self.epsilon)
+
+    def testDatasets(self):
+        system = OpticalSystem.OpticalSystem()
+        system.load(self.filename)
+        reflectivity, dielectric = system.datasets
+        self.assertIsInstance(reflectivity, Datasets.ReflectivityDataset)
+        self.assertEqual((reflectivity.name, reflectivity.type, reflectivity.label), ("R", "Reflectivity", 10.0))
+        self.assertEqual((reflectivity.theta, reflectivity.polarization), (0.5, 'p'))
+
+        # Nothing read until used
+        self.assertNotIn('y', reflectivity.__dict__)
+        np.testing.assert_array_equal(reflectivity.y, np.abs(self.epsilon))
+        np.testing.assert_array_equal(dielectric.x, self.window)
+        np.testing.assert_array_equal(dielectric.y, self.epsilon)
+
+        system.load(self.filename, lazy=False)
+        self.assertIn('y', system.datasets[2].__dict__)
+
+    def testSaveOverSource(self):
+        # The lazy datasets read the file before it is overwritten
+        system = OpticalSystem.OpticalSystem()
+        system.load(self.filename)
+        system.save(self.filename)
+
+        reloaded = OpticalSystem.OpticalSystem()
+        reloaded.load(self.filename)
+        reflectivity, dielectric = reloaded.datasets
+        np.testing.assert_array_equal(reflectivity.y, np.abs(self.epsilon))
+        np.testing.assert_array_equal(dielectric.y, self.epsilon)
+
+        # Same for a single dataset
+        filename = os.path.join(self.directory.name, "dataset.h5")
+        dielectric.savetohdf5(filename)
+        dataset = Datasets.Dataset.fromhdf5(filename)
+        dataset.savetohdf5(filename)
+        np.testing.assert_array_equal(Datasets.Dataset.fromhdf5(filename).y, self.epsilon)
+
+    def testIntegerLabels(self):
+        self.model.label, self.system.datasets[0].label = 15, 10
+        self.system.save(self.filename)
+
+        system = OpticalSystem.OpticalSystem()
+        system.load(self.filename)
+        model, dataset = system.models[0], system.datasets[0]
+        self.assertEqual((type(model.label), type(dataset.label)), (int, int))
+        # Python scalars, that the json format can store
+        model.save(os.path.join(self.directory.name, "model.json"))
+
+    def testFits(self):
+        system = OpticalSystem.OpticalSystem()
+        system.load(self.filename)
+        result, = system.fits
+        saved = self.system.fits[0]
+        self.assertEqual((result.model, result.method, result.success), ("Test model", "trf", True))
+        np.testing.assert_array_equal(result.params, saved.params)
+        np.testing.assert_array_equal(result.covariance, saved.covariance)
+
+
+if __name__ == '__main__':
+        unittest.main()
@@ -1,6 +1,12 @@
-from Oscillators import Drude
+from Oscillators import Drude, Lorentz, Gauss, Tauc, Kernels
+from Oscillators.Oscillator import swFactor
+from relations import EnergyGrid
 import unittest
 
+import numpy as np
+import scipy.integrate
+import scipy.special
+
 
 class ParameterValidationTest(unittest.TestCase):
 
@@ -19,10 +25,167 @@ class ParameterValidationTest(unittest.TestCase):
         self.assertEqual(self.drude.amplitude, 0.0)
         self.assertEqual(self.drude.width, 0.0)
 
+    def testUnchecked(self):
+        self.drude = Drude(1, 1)
+        self.drude.setParamsUnchecked([2, 3])
+        self.assertEqual(self.drude.params, [2.0, 3.0])
+        self.drude.width = -1
+        self.assertEqual(self.drude.width, 0.0)
+
+    def testSlots(self):
+        self.drude = Drude(1, 1)
+        self.assertFalse(hasattr(self.drude, '__dict__'))
+
     def testRepresentation(self):
         self.drude = Drude(1, 1)
         self.drudefromrerp = eval(repr(self.drude))
         self.assertNotEqual(self.drude, self.drudefromrerp)
 
+class JacobianTest(unittest.TestCase):
+    """Analytic derivatives against the numerical ones."""
+
+    def setUp(self):
+        self.window = np.linspace(0.05, 8, 400)
+
+    def checkJacobian(self, oscillator):
+        analytic = oscillator.jacobian(self.window)
+        numerical = oscillator._numericalJacobian(oscillator.dielectricFunction, self.window)
+        self.assertEqual(analytic.shape, (oscillator.nparams, len(self.window)))
+        np.testing.assert_allclose(analytic, numerical, rtol=1e-5, atol=1e-6)
+
+    def testDrude(self):
+        self.checkJacobian(Drude(3, 0.4))
+
+    def testLorentz(self):
+        self.checkJacobian(Lorentz(1.5, 0.3, 2))
+
+    def testGauss(self):
+        self.checkJacobian(Gauss(1.2, 0.8, 3))
+
+    def testTauc(self):
+        self.checkJacobian(Tauc(100, 1, 3, 1.5))
+
+class SpectralWeightTest(unittest.TestCase):
+    """Closed form partial spectral weights against numerical integration."""
+
+    def checkWeight(self, oscillator, low=0.0, high=12.0):
+        numerical, _ = scipy.integrate.quad(lambda E: E*oscillator.dielectricFunction(np.array([E])).imag[0],
+                                            low, high, points=[oscillator.position], limit=200)
+        self.assertAlmostEqual(oscillator.partialSpectralWeight(low, high)/swFactor, numerical, delta=1e-8*abs(numerical))
+
+    def testDrude(self):
+        self.checkWeight(Drude(3, 0.4))
+        self.assertAlmostEqual(Drude(3, 0.4).partialSpectralWeight(0, 1e12)/Drude(3, 0.4).spectralWeight, 1)
+
+    def testLorentz(self):
+        self.checkWeight(Lorentz(1.5, 0.3, 2), 0.5, 5)
+        # Overdamped and critically damped
+        self.checkWeight(Lorentz(1.5, 5, 2))
+        self.checkWeight(Lorentz(1.5, 4, 2))
+        self.assertAlmostEqual(Lorentz(1.5, 0.3, 2).partialSpectralWeight(0, 1e9)/Lorentz(1.5, 0.3, 2).spectralWeight, 1)
+
+    def testGauss(self):
+        self.checkWeight(Gauss(1.2, 0.8, 3), 1, 4)
+        self.assertAlmostEqual(Gauss(1.2, 0.8, 3).partialSpectralWeight(0, 20)/Gauss(1.2, 0.8, 3).spectralWeight, 1)
+
+    def testArrays(self):
+        limits = np.array([1.0, 2.0, 4.0])
+        np.testing.assert_allclose(Lorentz(1.5, 0.3, 2).partialSpectralWeight(0, limits),
+                                   [Lorentz(1.5, 0.3, 2).partialSpectralWeight(0, limit) for limit in limits])
+
+    def testNumerical(self):
+        with self.assertRaises(NotImplementedError):
+            Tauc(100, 1, 3, 1.5).partialSpectralWeight(0, 4)
+
+class EnergyGridTest(unittest.TestCase):
+    """Testing the evaluations on an EnergyGrid against plain arrays."""
+
+    def setUp(self):
+        self.x = np.linspace(0.01, 10, 500)
+        self.oscillators = [Drude(1, 0.1), Lorentz(1, 3, 0.5), Gauss(1, 3, 0.5), Tauc(100, 1, 3, 1.5)]
+
+    def testEquivalence(self):
+        grid = EnergyGrid(self.x)
+        for oscillator in self.oscillators:
+            np.testing.assert_array_equal(oscillator.dielectricFunction(grid),
+                                          oscillator.dielectricFunction(self.x))
+            np.testing.assert_array_equal(oscillator.jacobian(grid), oscillator.jacobian(self.x))
+
+    def testCache(self):
+        grid = EnergyGrid(self.x)
+        self.assertIs(grid.E2, grid.E2)
+        self.assertFalse(grid.E2.flags.writeable)
+        self.assertEqual(grid.key, EnergyGrid(self.x.copy()).key)
+        # Keys compare the values themselves, not only their hash
+        other = EnergyGrid(self.x + 1e-9)
+        self.assertNotEqual(grid.key, other.key)
+        oscillator = self.oscillators[0]
+        oscillator.cachedDielectricFunction(grid)
+        np.testing.assert_array_equal(oscillator.cachedDielectricFunction(other),
+                                      oscillator.dielectricFunction(other))
+        np.testing.assert_array_equal(grid.inUnit('cm-1'), EnergyGrid(self.x, 'eV').inUnit('cm-1'))
+
+        # Slices share the quantities already computed
+        tile = grid[100:200]
+        self.assertTrue(np.shares_memory(tile.E2, grid.E2))
+        np.testing.assert_array_equal(tile.E2, self.x[100:200]**2)
+        self.assertEqual(grid[3], self.x[3])
+
+
+def taucReference(A, C, E0, Eg, x):
+    """Former expressions of the Tauc-Lorentz lineshape, term by term."""
+    x2 = x*x
+    alfa = np.sqrt(4.0*E0**2 - C**2)
+    g2 = E0**2 - C**2/2.0
+    aln = (Eg**2 - E0**2)*x2 + Eg**2*C**2 - E0**2*(E0**2 + 3.0*Eg**2)
+    aatan = (x2 - E0**2)*(E0**2 + Eg**2) + Eg**2*C**2
+    csi4 = (x2 - g2)**2 + alfa**2*C**2/4.0
+    real = 0.5*A*C/np.pi/csi4*aln/alfa/E0*np.log((E0**2 + Eg**2 + alfa*Eg)/(E0**2 + Eg**2 - alfa*Eg)) \
+        - A/np.pi/csi4*aatan/E0*(np.pi - np.arctan((2.0*Eg + alfa)/C) + np.arctan((alfa - 2.0*Eg)/C)) \
+        + 2.0*A*E0/np.pi/csi4/alfa*Eg*(x2 - g2)*(np.pi + 2.0*np.arctan(2.0*(g2 - Eg**2)/alfa/C)) \
+        - A*E0*C/np.pi/csi4*(x2 + Eg**2)/x*np.log(abs(x - Eg)/(x + Eg)) \
+        + 2.0*A*E0*C/np.pi/csi4*Eg*np.log(abs(x - Eg)*(x + Eg)/np.sqrt((E0**2 - Eg**2)**2 + Eg**2*C**2))
+    imag = 0.5*(np.sign(x - Eg) + 1.0)*A*E0*C*(x - Eg)**2/(((x2 - E0**2)**2 + C**2*x2)*x)
+    return real + 1j*imag
+
+
+class KernelTest(unittest.TestCase):
+    """Testing the fused kernels against the former expressions."""
+
+    def setUp(self):
+        self.x = np.linspace(0.013, 10, 700)
+
+    def testTauc(self):
+        for params in [(100, 1, 3, 1.5), (20, 0.3, 2, 0.5), (5, 2, 4, 3)]:
+            expected = taucReference(*params, self.x)
+            np.testing.assert_allclose(Tauc(*params).dielectricFunction(self.x), expected,
+                                       rtol=0, atol=1e-13*np.abs(expected).max())
+
+            # The loop, compiled or not, and the NumPy version agree
+            loop = np.zeros(self.x.shape, dtype=complex)
+            Kernels._taucLoop(self.x, self.x**2, loop, *Kernels._taucCoefficients(*params))
+            np.testing.assert_allclose(loop, expected, rtol=0, atol=1e-13*np.abs(expected).max())
+
+    def testGauss(self):
+        u = 2.0*np.sqrt(np.log(2))/0.5
+        expected = scipy.special.dawsn((self.x + 3)*u) - scipy.special.dawsn((self.x - 3)*u)
+        expected = 2.0/np.sqrt(np.pi)*expected + 1j*(np.exp(-((self.x - 3)*u)**2) - np.exp(-((self.x + 3)*u)**2))
+        np.testing.assert_allclose(Gauss(1, 0.5, 3).dielectricFunction(self.x), expected, rtol=1e-14, atol=1e-15)
+
+    def testTaucBatch(self):
+        oscillators = [Tauc(100, 1, 3, 1.5), Tauc(20, 0.3, 2, 0.5)]
+        params = np.array([oscillator.params for oscillator in oscillators])
+        out = np.zeros((2,) + self.x.shape, dtype=complex)
+        Tauc.batchDielectricFunction(self.x, np.stack([params, params[::-1]]), out)
+        expected = sum(oscillator.dielectricFunction(self.x) for oscillator in oscillators)
+        np.testing.assert_allclose(out, [expected, expected], rtol=1e-12)
+
+        # Loop over the oscillators of a row, compiled or not
+        row = np.zeros(self.x.shape, dtype=complex)
+        coefficients = np.array([Kernels._taucCoefficients(*p) for p in params], dtype=float)
+        Kernels._taucRows(self.x, self.x**2, row, coefficients)
+        np.testing.assert_allclose(row, expected, rtol=1e-12)
+
+
 if __name__ == '__main__':
         unittest.main()
@@ -0,0 +1,80 @@
+import Datasets, OpticalModel, OpticalSystem, Oscillators, profiling
+from KramersKronig import KramersKronig
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+
+class ProfilingTest(unittest.TestCase):
+    """Testing the records of the instrumented calls."""
+
+    def setUp(self):
+        self.window = np.linspace(0.05, 8, 300)
+        self.model = OpticalModel.OpticalModel("Profiled")
+        self.model.add([Oscillators.Drude(2, 0.3), Oscillators.Gauss(1, 0.5, 2), Oscillators.Tauc(100, 1, 3, 1.5)])
+
+    def testDisabled(self):
+        self.assertIsNone(profiling.active())
+        with profiling.profile() as profile:
+            pass
+        self.model.dielectricFunction(self.window)
+        self.assertEqual(len(profile.records), 0)
+
+    def testModel(self):
+        with profiling.profile() as profile:
+            for i in range(3):
+                self.model.dielectricFunction(self.window)
+            KramersKronig.real2imag(self.window, self.window)
+
+        record = profile["OpticalModel.dielectricFunction"]
+        self.assertEqual(record.calls, 3)
+        self.assertEqual(record.points, 3*self.window.size)
+        self.assertLess(record.own, record.total)
+
+        # The lineshapes are timed inside the evaluation plan
+        for name in ("Gauss.batchDielectricFunction", "Kernels.taucBatchDielectricFunction",
+                     "Tauc.batchDielectricFunction", "KramersKronig.real2imag"):
+            self.assertIn(name, profile)
+        self.assertGreaterEqual(profile["EvaluationPlan.dielectricFunction"].total,
+                                profile["Gauss.batchDielectricFunction"].total)
+        self.assertIn("Gauss.batchDielectricFunction", profile.summary())
+
+    def testFitTrace(self):
+        system = OpticalSystem.OpticalSystem()
+        model = system.createModel("Fit")
+        model.add([Oscillators.Lorentz(1, 0.5, 2)])
+        epsilon = model.dielectricFunction(self.window)
+        system.datasets.append(Datasets.ReflectivityDataset(x=self.window, y=np.abs((np.sqrt(epsilon)-1)/(np.sqrt(epsilon)+1))**2))
+        model.params = [1.2, 0.4, 2.1]
+
+        with profiling.profile(trace=True) as profile:
+            result = system.fit(model, verbose=False, method="trf")
+
+        self.assertEqual(profile["OpticalSystem.fitResiduals"].calls, result.nfev)
+        self.assertIn("ReflectivityDataset.inputToType", profile)
+        self.assertEqual(profile["OpticalSystem.fit"].calls, 1)
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "trace.json")
+            profile.saveTrace(filename)
+            with open(filename) as f:
+                events = json.load(f)['traceEvents']
+        self.assertEqual(len(events), sum(record.calls for record in profile.records.values()))
+        self.assertEqual(events[-1]['name'], "OpticalSystem.fit")
+
+    def testRegistry(self):
+        profiling.enable()
+        try:
+            Oscillators.Lorentz(1, 0.5, 2).dielectricFunction(self.window)
+        finally:
+            profiling.disable()
+        self.assertGreaterEqual(profiling.registry["Lorentz.dielectricFunction"].calls, 1)
+        profiling.registry.reset()
+        self.assertNotIn("Lorentz.dielectricFunction", profiling.registry)
+
+
+if __name__ == '__main__':
+        unittest.main()
@@ -0,0 +1,71 @@
+import spectrafiles
+import gzip
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+
+class ReadSpectraTest(unittest.TestCase):
+    """Testing the text reader against numpy.loadtxt."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.example = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Examples",
+                                    "DielectricFunction-Simple-wavenumber.dat")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, text):
+        filename = os.path.join(self.directory.name, name)
+        with open(filename, 'w') as f:
+            f.write(text)
+        return filename
+
+    def testBlocks(self):
+        expected = np.random.default_rng(0).normal(size=(3, 20000))
+        filename = os.path.join(self.directory.name, "large.dat")
+        np.savetxt(filename, expected.T, header="E e1 e2")
+        blocks = []
+        data = spectrafiles.readSpectra(filename, blockSize=2**16, callback=blocks.append)
+        np.testing.assert_array_equal(data, expected)
+        self.assertGreater(len(blocks), 1)
+        self.assertTrue(data.flags.c_contiguous)
+
+    def testHeader(self):
+        filename = self.write("header.dat", "# comment\nE R\n\n1 2\n3 4\n\n# in between\n5 6\r\n7 8")
+        self.assertEqual(spectrafiles.sniff(open(filename, 'rb').read()), (None, 3, 2))
+        np.testing.assert_array_equal(spectrafiles.readSpectra(filename, blockSize=8),
+                                      [[1, 3, 5, 7], [2, 4, 6, 8]])
+
+    def testDelimiters(self):
+        for delimiter in (',', ';', '\t'):
+            filename = self.write("delimited.txt", "Energy%sR\n1%s2\n3%s4\n" % ((delimiter,)*3))
+            np.testing.assert_array_equal(spectrafiles.readSpectra(filename), [[1, 3], [2, 4]])
+
+    def testGzip(self):
+        filename = os.path.join(self.directory.name, "spectrum.dat.gz")
+        with open(self.example, 'rb') as f, gzip.open(filename, 'wb') as g:
+            g.write(f.read())
+        np.testing.assert_array_equal(spectrafiles.readSpectra(filename),
+                                      np.loadtxt(self.example, unpack=True))
+
+    def testColumns(self):
+        filename = self.write("broken.dat", "1 2\n3 4\n5 6 7\n")
+        with self.assertRaises(ValueError):
+            spectrafiles.readSpectra(filename)
+
+    def testRaggedRows(self):
+        # An extra and a missing field after the sniffed lines compensate
+        rows = ["%d %d" % (10*i, 10*i + 1) for i in range(10)]
+        rows[6], rows[8] = "60 61 62", "80"
+        for delimiter in (' ', ','):
+            filename = self.write("ragged.dat", "\n".join(rows).replace(' ', delimiter) + "\n")
+            with self.assertRaises(ValueError):
+                spectrafiles.readSpectra(filename)
+
+
+if __name__ == '__main__':
+        unittest.main()